@@ -0,0 +1,456 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Replay a mix of requests against the API, either in-process or on a running server, and report the
+throughput, latency percentiles, SQL statements, response sizes and peak memory of each endpoint.
+
+Mixes are lists of weighted request templates (see DASHBOARD), read from a JSON file of such
+templates or replayed in order from an access log: uvicorn's log lines, or JSON lines with the
+"method", "path" and "json" of each request. Path placeholders ({entry_id}, {trajectory_id},
+{body_id}) are filled with random IDs of the database and "slider" templates are sent as bursts
+whose upper bound sweeps the field's range, like the requests of a slider being dragged. The same
+seed sends the same requests, so that the results of two commits can be compared with --baseline.
+"""
+
+import argparse
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import typing as t
+from pathlib import Path
+
+import numpy as np
+import requests
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+MIXES: dict[str, list[dict]] = {
+    # The requests of an analyst exploring a study in the dashboard
+    "dashboard": [
+        {
+            "name": "entries filter drag",
+            "method": "POST",
+            "path": "/entries/",
+            "json": {"filters": [], "fields": ["id", "bvec_theta", "bvec_mag"], "limit": 1000},
+            "slider": {"table": "entry", "field_name": "bvec_mag"},
+            "burst": 20,
+            "weight": 2,
+        },
+        {
+            "name": "trajectories filter drag",
+            "method": "POST",
+            "path": "/trajectories/",
+            "json": {"filters": [], "limit": 1000},
+            "slider": {"table": "trajectory", "field_name": "c3"},
+            "burst": 20,
+            "weight": 1,
+        },
+        {"name": "entry detail", "method": "GET", "path": "/entries/{entry_id}", "weight": 10},
+        {
+            "name": "entry arc",
+            "method": "POST",
+            "path": "/visualizations/get_entry_arc/{entry_id}",
+            "json": {},
+            "weight": 3,
+        },
+        {"name": "bodies", "method": "GET", "path": "/bodies/", "weight": 1},
+        {"name": "targeted bodies", "method": "GET", "path": "/bodies/targeted", "weight": 1},
+    ],
+}
+
+PLACEHOLDERS = {"entry_id": "entry", "trajectory_id": "trajectory", "body_id": "body"}
+LOG_LINE = re.compile(r'"(?P<method>GET|POST|PUT|PATCH|DELETE) (?P<path>\S+) HTTP/[\d.]+"')
+QUERY_HEADER = "x-benchmark-queries"
+THRESHOLD = 0.25  # slow down of the p95 latency, relative to the baseline, that is a regression
+
+
+class Request(t.NamedTuple):
+    name: str
+    method: str
+    path: str
+    json: t.Optional[dict] = None
+
+
+class Sample(t.NamedTuple):
+    name: str
+    seconds: float
+    status: int
+    size: int
+    queries: t.Optional[int]
+    rss: t.Optional[int]
+
+
+class Database:
+    """IDs and value ranges of the served database, to fill in the request templates"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._cache = {}
+
+    def _query(self, key, query):
+        if key not in self._cache:
+            with self.engine.connect() as conn:
+                self._cache[key] = conn.execute(text(query)).all()
+        return self._cache[key]
+
+    def ids(self, table: str) -> list[int]:
+        return [row[0] for row in self._query(table, f"SELECT id FROM {table}")]
+
+    def range(self, table: str, field: str) -> tuple[float, float]:
+        return self._query((table, field), f"SELECT min({field}), max({field}) FROM {table}")[0]
+
+
+class RemoteClient:
+    """The subset of TestClient used by `run`, for a running server"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def request(self, method: str, path: str, json: t.Optional[dict] = None):
+        return self.session.request(method, self.url + path, json=json)
+
+
+def _fill(path: str, db: Database, rng: random.Random) -> str:
+    return re.sub(r"{(\w+)}", lambda m: str(rng.choice(db.ids(PLACEHOLDERS[m.group(1)]))), path)
+
+
+def _burst(template: dict, db: Database, rng: random.Random) -> list[Request]:
+    path = _fill(template["path"], db, rng)
+    body = template.get("json")
+    slider = template.get("slider")
+    if not slider:
+        return [Request(template["name"], template["method"], path, body)] * template.get(
+            "burst", 1
+        )
+    # Drag the upper bound from the bottom of the range to its top
+    lower, upper = db.range(slider["table"], slider["field_name"])
+    n = template.get("burst", 1)
+    return [
+        Request(
+            template["name"],
+            template["method"],
+            path,
+            dict(
+                body,
+                filters=body["filters"]
+                + [
+                    {
+                        "field_name": slider["field_name"],
+                        "category": "slider",
+                        "lower": lower,
+                        "upper": lower + (upper - lower) * (i + 1) / n,
+                    }
+                ],
+            ),
+        )
+        for i in range(n)
+    ]
+
+
+def sample_mix(mix: list[dict], n: int, db: Database, seed: int) -> list[list[Request]]:
+    """Bursts of requests drawn from the weighted templates of a mix, about `n` requests in all"""
+    rng = random.Random(seed)
+    weights = [template.get("weight", 1) for template in mix]
+    bursts, count = [], 0
+    while count < n:
+        burst = _burst(rng.choices(mix, weights)[0], db, rng)
+        bursts.append(burst)
+        count += len(burst)
+    return bursts
+
+
+def _route(method: str, path: str) -> str:
+    return f"{method} " + re.sub(r"/\d+(?=/|$)", "/{id}", path.split("?")[0])
+
+
+def _template_regex(path: str) -> re.Pattern:
+    return re.compile(re.sub(r"\\{\w+\\}", r"\\d+", re.escape(path)) + "$")
+
+
+def load_log(path: Path, mix: list[dict]) -> list[list[Request]]:
+    """
+    The requests of an access log, in order. Request bodies are not in uvicorn's log, so POST
+    requests that are not JSON lines take the body of the mix template matching their path.
+    """
+    requests, skipped = [], 0
+    for line in path.read_text().splitlines():
+        if line.startswith("{"):
+            record = json.loads(line)
+            method, target, body = record["method"], record["path"], record.get("json")
+        elif match := LOG_LINE.search(line):
+            method, target, body = match["method"], match["path"], None
+            if method != "GET":
+                templates = [
+                    m
+                    for m in mix
+                    if m["method"] == method and _template_regex(m["path"]).match(target)
+                ]
+                if not templates:
+                    skipped += 1
+                    continue
+                body = templates[0].get("json")
+        else:
+            continue
+        requests.append([Request(_route(method, target), method, target, body)])
+    if skipped:
+        print(f"Skipped {skipped} requests without a body in the mix")
+    return requests
+
+
+def _rss(pid: t.Optional[int]) -> t.Optional[int]:
+    # Resident set size of a local process [bytes]
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+_queries: contextvars.ContextVar[t.Optional[list[int]]] = contextvars.ContextVar(
+    "queries", default=None
+)
+
+
+def _count_query(*args):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def counting(app):
+    """Wrap an ASGI app to report the SQL statements run by each request in a response header"""
+    event.listen(Engine, "before_cursor_execute", _count_query)
+
+    async def counted(scope, receive, send):
+        if scope["type"] != "http":
+            return await app(scope, receive, send)
+        counter = [0]
+        _queries.set(counter)
+
+        async def send_counted(message):
+            if message["type"] == "http.response.start":
+                headers = [*message.get("headers", []), (QUERY_HEADER.encode(), b"%d" % counter[0])]
+                message = dict(message, headers=headers)
+            await send(message)
+
+        await app(scope, receive, send_counted)
+
+    return counted
+
+
+def run(
+    bursts: list[list[Request]], make_client: t.Callable, concurrency: int, pid: t.Optional[int]
+) -> tuple[list[Sample], float]:
+    """Send the bursts from `concurrency` clients, each sending the requests of a burst in turn"""
+    pending = queue.SimpleQueue()
+    for burst in bursts:
+        pending.put(burst)
+    samples = []
+
+    def client():
+        session = make_client()
+        while True:
+            try:
+                burst = pending.get_nowait()
+            except queue.Empty:
+                return
+            for request in burst:
+                start = time.perf_counter()
+                response = session.request(request.method, request.path, json=request.json)
+                seconds = time.perf_counter() - start
+                queries = response.headers.get(QUERY_HEADER)
+                samples.append(
+                    Sample(
+                        request.name,
+                        seconds,
+                        response.status_code,
+                        len(response.content),
+                        None if queries is None else int(queries),
+                        _rss(pid),
+                    )
+                )
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples: list[Sample], wall: float) -> dict[str, dict]:
+    """Statistics of the samples of each endpoint, and of all of them under "total\" """
+    groups: dict[str, list[Sample]] = {}
+    for sample in samples:
+        groups.setdefault(sample.name, []).append(sample)
+    groups["total"] = samples
+
+    summary = {}
+    for name, group in groups.items():
+        seconds = np.array([s.seconds for s in group])
+        queries = [s.queries for s in group if s.queries is not None]
+        rss = [s.rss for s in group if s.rss is not None]
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+        summary[name] = {
+            "requests": len(group),
+            "errors": sum(s.status >= 400 for s in group),
+            "throughput": len(group) / wall,
+            "mean": float(seconds.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "queries": float(np.mean(queries)) if queries else None,
+            "bytes": float(np.mean([s.size for s in group])),
+            "peak_rss": max(rss) if rss else None,
+        }
+    return summary
+
+
+def report(summary: dict[str, dict]):
+    columns = "requests errors   req/s  p50 ms  p95 ms  p99 ms queries      KB  RSS MB"
+    print(f"{'endpoint':<40} {columns}")
+    for name, s in summary.items():
+        queries = "-" if s["queries"] is None else f"{s['queries']:.1f}"
+        rss = "-" if s["peak_rss"] is None else f"{s['peak_rss'] / 2**20:.0f}"
+        print(
+            f"{name:<40} {s['requests']:>8} {s['errors']:>6} {s['throughput']:>7.1f}"
+            f" {1000 * s['p50']:>7.1f} {1000 * s['p95']:>7.1f} {1000 * s['p99']:>7.1f}"
+            f" {queries:>7} {s['bytes'] / 1024:>7.1f} {rss:>7}"
+        )
+
+
+def compare(summary: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """Describe the endpoints that got slower, or run more SQL statements, than in the baseline"""
+    regressions = []
+    for name, s in summary.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if s["p95"] > before["p95"] * (1.0 + threshold):
+            regressions.append(
+                f"{name}: p95 {1000 * before['p95']:.1f} ms -> {1000 * s['p95']:.1f} ms"
+                f" (+{100.0 * (s['p95'] / before['p95'] - 1.0):.0f}%)"
+            )
+        if None not in (s["queries"], before["queries"]) and s["queries"] > before["queries"]:
+            regressions.append(
+                f"{name}: {before['queries']:.1f} -> {s['queries']:.1f} queries per request"
+            )
+    return regressions
+
+
+def _commit() -> t.Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args: argparse.Namespace) -> int:
+    if args.database:
+        os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{Path(args.database).absolute()}"
+    from vipre_data.app import dependencies as deps
+
+    engine = create_engine(os.environ["SQLALCHEMY_DATABASE_URI"]) if args.database else None
+    db = Database(engine or deps.get_engine())
+
+    mix = MIXES.get(args.mix)
+    if mix is None and args.mix.endswith(".json"):
+        mix = json.loads(Path(args.mix).read_text())
+    if mix is None:
+        bursts = load_log(Path(args.mix), MIXES["dashboard"])[: args.requests]
+    else:
+        bursts = sample_mix(mix, args.requests, db, args.seed)
+
+    if args.url:
+        make_client = lambda: RemoteClient(args.url)
+        pid = args.pid
+    else:
+        from fastapi.testclient import TestClient
+
+        from vipre_data.app.main import app
+
+        wrapped = counting(app)
+        make_client = lambda: TestClient(wrapped)
+        pid = os.getpid()
+
+    samples, wall = run(bursts, make_client, args.concurrency, pid)
+    summary = summarize(samples, wall)
+    report(summary)
+
+    results = {
+        "commit": _commit(),
+        "mix": args.mix,
+        "database": str(db.engine.url),
+        "target": args.url or "in-process",
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "endpoints": summary,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        print(
+            f"\nCompared with {baseline['commit']} ({baseline['target']}, {baseline['database']})"
+        )
+        regressions = compare(summary, baseline["endpoints"], args.threshold)
+        print("\n".join(regressions) if regressions else "No regressions")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument(
+        "--mix",
+        default="dashboard",
+        help=f"one of {list(MIXES)}, a JSON file of request templates or an access log",
+    )
+    parser.add_argument("-n", "--requests", type=int, default=1000, help="requests to send")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--database", help="SQLite database served (default: the app's)")
+    parser.add_argument("--url", help="base URL of a running server, instead of in-process")
+    parser.add_argument("--pid", type=int, help="process ID of that server, to sample its RSS")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the sampled requests")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument(
+        "--threshold", type=float, default=THRESHOLD, help="relative p95 slow down that fails"
+    )
+    sys.exit(main(parser.parse_args()))
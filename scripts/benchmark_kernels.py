@@ -0,0 +1,210 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Time the kernels of vipre_data.computations across batch sizes and true anomaly step counts, check
+them against the documented conic_2point examples and compare the timings with a stored baseline.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+import typing as t
+from pathlib import Path
+
+import numpy as np
+
+from scripts.benchmark_sampling import MU, conic_inputs, make_arcs
+from vipre_data.computations import kernels
+from vipre_data.computations.cart2sph import cart2sph
+from vipre_data.computations.conic_1point import conic_1point
+from vipre_data.computations.conic_2point import conic_2point
+from vipre_data.computations.entry import b_plane
+from vipre_data.computations.fixtures import CONIC_2POINT_EXAMPLES
+from vipre_data.computations.planet_rotation_velocity import planet_rotation_velocity
+from vipre_data.computations.propagate import propagate
+from vipre_data.computations.sun_relative_states_angle import sun_relative_states_angle
+
+BASELINE = Path(__file__).parent / "baselines" / "kernels.json"
+SIZES = [1, 100, 10000, 100000]
+TA_STEPS = [15, 500, 5000]
+MAX_SAMPLES = 10**7  # larger N x ta_step combinations are skipped
+THRESHOLD = 0.25  # slow down, relative to the baseline, that counts as a regression
+MIN_SECONDS = 1e-4  # timings this short in both runs are too noisy to compare
+
+
+def _tile(array: np.ndarray, n: int) -> np.ndarray:
+    return np.resize(array, (n, *array.shape[1:]))
+
+
+def _conic_2point(n: int, ta_step: int) -> t.Callable:
+    # The states of the heliocentric example, repeated to fill the batch
+    example = dict(CONIC_2POINT_EXAMPLES[1], ta_step=ta_step)
+    for name in ("r_1", "r_2", "v_1", "v_2", "t_1", "t_2"):
+        example[name] = _tile(example[name], n)
+    return lambda: conic_2point(**example)
+
+
+def _conic_1point(n: int, ta_step: int) -> t.Callable:
+    inputs = conic_inputs(*make_arcs(n))
+    return lambda: conic_1point(**inputs, ta_step=ta_step)
+
+
+def _cart2sph(n: int, ta_step: int) -> t.Callable:
+    x, y, z = np.random.default_rng(0).normal(size=(3, n, ta_step))
+    return lambda: cart2sph(x, y, z)
+
+
+def _propagate(n: int, ta_step: int) -> t.Callable:
+    inputs = conic_inputs(*make_arcs(n))
+    times = np.linspace(0.0, 1.0, ta_step) * inputs["t_2"]
+    return lambda: propagate(inputs["r_1"], inputs["v_1"], inputs["t_1"], times, MU)
+
+
+def _planet_rotation_velocity(n: int, ta_step: int) -> t.Callable:
+    R = np.random.default_rng(0).normal(size=(3, n))
+    return lambda: planet_rotation_velocity(R, 0.71833)
+
+
+def _sun_relative_states_angle(n: int, ta_step: int) -> t.Callable:
+    vectors = np.random.default_rng(0).normal(size=(4, 3, n))
+    return lambda: sun_relative_states_angle(*vectors)
+
+
+def _b_plane(n: int, ta_step: int) -> t.Callable:
+    v_inf, pos, vel = np.random.default_rng(0).normal(size=(3, n, 3))
+    return lambda: b_plane(v_inf, pos, vel, np.array([0.0, 0.0, 1.0]))
+
+
+# name: (setup returning the call to time, whether the kernel samples ta_step points per item)
+KERNELS: dict[str, tuple[t.Callable[[int, int], t.Callable], bool]] = {
+    "conic_2point": (_conic_2point, True),
+    "conic_1point": (_conic_1point, True),
+    "propagate": (_propagate, True),
+    "cart2sph": (_cart2sph, True),
+    "planet_rotation_velocity": (_planet_rotation_velocity, False),
+    "sun_relative_states_angle": (_sun_relative_states_angle, False),
+    "b_plane": (_b_plane, False),
+}
+
+
+def time_call(call: t.Callable, repeat: int) -> float:
+    """Best time of a single call [s], over `repeat` runs of enough calls to last 0.2 s"""
+    call()  # warm up, e.g. compile the numba kernels
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(
+    names: list[str], sizes: list[int], ta_steps: list[int], max_samples: int, repeat: int
+) -> dict[str, float]:
+    timings = {}
+    for name in names:
+        setup, sampled = KERNELS[name]
+        for n in sizes:
+            for ta_step in ta_steps if sampled else [None]:
+                if sampled and n * ta_step > max_samples:
+                    continue
+                key = f"{name}[n={n}]" if ta_step is None else f"{name}[n={n},ta_step={ta_step}]"
+                timings[key] = time_call(setup(n, ta_step or 1), repeat)
+                print(f"{key:<50} {1000.0 * timings[key]:>12.4f} ms")
+    return timings
+
+
+def check_accuracy() -> list[str]:
+    """Failures of the backends on the documented conic_2point examples"""
+    return [
+        failure
+        for backend in kernels.available_backends()
+        for failure in kernels.check_backends(backend)
+    ]
+
+
+def compare(timings: dict, baseline: dict, threshold: float) -> list[str]:
+    """Describe every case that is slower than in the baseline by more than `threshold`"""
+    regressions = []
+    for key, seconds in timings.items():
+        before = baseline.get(key)
+        if before is None or max(seconds, before) < MIN_SECONDS:
+            continue
+        if seconds > before * (1.0 + threshold):
+            regressions.append(
+                f"{key}: {1000.0 * before:.4f} ms -> {1000.0 * seconds:.4f} ms"
+                f" (+{100.0 * (seconds / before - 1.0):.0f}%)"
+            )
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    names = args.kernels or list(KERNELS)
+    print(f"conic backend: {kernels.get_backend()}\n")
+    results = {
+        "machine": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "backend": kernels.get_backend(),
+        "timings": run(names, args.sizes, args.ta_steps, args.max_samples, args.repeat),
+        "accuracy_failures": check_accuracy(),
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.baseline).write_text(json.dumps(results, indent=2))
+        print(f"\nSaved baseline to {args.baseline}")
+
+    failures = list(results["accuracy_failures"])
+    if not args.save_baseline and Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline["machine"] != results["machine"]:
+            print(f"\nWarning: the baseline was recorded on {baseline['machine']}")
+        failures += compare(results["timings"], baseline["timings"], args.threshold)
+    print("\n" + "\n".join(failures) if failures else "\nNo regressions")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-k", "--kernels", nargs="+", choices=list(KERNELS), help="kernels to run")
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES, help="batch sizes N")
+    parser.add_argument("--ta-steps", nargs="+", type=int, default=TA_STEPS, help="ta_step values")
+    parser.add_argument(
+        "--max-samples", type=int, default=MAX_SAMPLES, help="skip larger N x ta_step cases"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timing repetitions")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=str(BASELINE), help="baseline JSON file")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store the results as the new baseline"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=THRESHOLD, help="relative slow down that fails"
+    )
+    sys.exit(main(parser.parse_args()))
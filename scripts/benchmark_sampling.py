@@ -0,0 +1,114 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from timeit import timeit
+import argparse
+
+import numpy as np
+
+from vipre_data.computations.conic_1point import conic_1point
+from vipre_data.computations.kepler import mean_anomaly, mean_motion
+from vipre_data.computations.sampling import true_anomaly_set
+
+MU = 5.793939e6  # Uranus [km3/s2]
+R_P = 3.0e4  # periapsis radius of the generated arcs [km]
+
+
+def make_arcs(n: int, seed: int = 0):
+    """Random approach hyperbolas sampled from far out on the incoming leg to past periapsis"""
+    rng = np.random.default_rng(seed)
+    ecc = rng.uniform(1.05, 4.0, (n, 1))
+    p = R_P * (1.0 + ecc)
+    ta_inf = np.arccos(-1.0 / ecc)  # true anomaly of the asymptotes
+    ta_1 = -rng.uniform(0.9, 0.98, (n, 1)) * ta_inf
+    ta_2 = rng.uniform(0.3, 0.8, (n, 1)) * ta_inf
+    return ta_1, ta_2, p, ecc
+
+
+def perifocal(ta, p, ecc):
+    r = p / (1.0 + ecc * np.cos(ta))
+    return r * np.cos(ta), r * np.sin(ta)
+
+
+def fidelity(ta_set, p, ecc, sub_steps: int = 8):
+    """Maximum chord deviation relative to periapsis and maximum turn between samples [deg]"""
+    ta = ta_set[:, :, 0]
+    p, ecc = p[:, :, None], ecc[:, :, None]
+    x, y = perifocal(ta[:, :, None], p, ecc)
+    fractions = np.linspace(0.0, 1.0, sub_steps + 2)[1:-1]
+    ta_mid = ta[:, :-1, None] + np.diff(ta, axis=1)[:, :, None] * fractions
+    xm, ym = perifocal(ta_mid, p, ecc)
+    dx, dy = x[:, 1:] - x[:, :-1], y[:, 1:] - y[:, :-1]
+    deviation = np.abs(dx * (ym - y[:, :-1]) - dy * (xm - x[:, :-1])) / np.hypot(dx, dy)
+    chord_error = np.max(deviation / (p / (1.0 + ecc)))
+
+    ta = ta[:, :, None]
+    flight_angle = np.arctan2(ecc * np.sin(ta), 1.0 + ecc * np.cos(ta))  # flight path angle
+    heading = ta + np.pi / 2.0 - flight_angle
+    turn_error = np.rad2deg(np.max(np.abs(np.diff(heading, axis=1))))
+    return chord_error, turn_error
+
+
+def conic_inputs(ta_1, ta_2, p, ecc):
+    """State vectors and end times reproducing the generated arcs with conic_1point"""
+    n = len(ecc)
+    x, y = perifocal(ta_1, p, ecc)
+    vx, vy = -np.sqrt(MU / p) * np.sin(ta_1), np.sqrt(MU / p) * (ecc + np.cos(ta_1))
+    tilt = np.deg2rad(20.0)  # keep the orbit normal off the z axis
+    r_1 = np.stack([x, y * np.cos(tilt), y * np.sin(tilt)], axis=1)
+    v_1 = np.stack([vx, vy * np.cos(tilt), vy * np.sin(tilt)], axis=1)
+    t_1 = np.zeros((n, 1))
+    t_2 = (mean_anomaly(ta_2, ecc) - mean_anomaly(ta_1, ecc)) / mean_motion(p, ecc, MU)
+    return dict(r_1=r_1, v_1=v_1, t_1=t_1, t_2=t_2, mu=MU, rev_check=0, time_flag=0)
+
+
+def main(n: int, uniform_step: int, adaptive_step: int, repeat: int):
+    ta_1, ta_2, p, ecc = make_arcs(n)
+    print(f"{n} approach hyperbolas, eccentricity 1.05 - 4.0\n")
+    print(f"{'sampling':<10} {'points/arc':>10} {'chord err':>10} {'turn [deg]':>10} {'ms':>8}")
+    inputs = conic_inputs(ta_1, ta_2, p, ecc)
+    for sampling, ta_step in [("uniform", uniform_step), ("adaptive", adaptive_step)]:
+        ta_set = true_anomaly_set(ta_1, ta_2 - ta_1, p, ecc, ta_step, sampling)
+        chord_error, turn_error = fidelity(ta_set, p, ecc)
+        seconds = timeit(
+            lambda: conic_1point(**inputs, ta_step=ta_step, sampling=sampling), number=repeat
+        )
+        print(
+            f"{sampling:<10} {ta_set.shape[1]:>10} {chord_error:>10.2e} {turn_error:>10.3f}"
+            f" {1000.0 * seconds / repeat:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare uniform and adaptive conic sampling")
+    parser.add_argument("-n", type=int, default=100, help="number of arcs in the batch")
+    parser.add_argument("--uniform-step", type=int, default=500, help="uniform ta_step")
+    parser.add_argument("--adaptive-step", type=int, default=5000, help="adaptive ta_step cap")
+    parser.add_argument("--repeat", type=int, default=20, help="timing repetitions")
+    args = parser.parse_args()
+
+    main(args.n, args.uniform_step, args.adaptive_step, args.repeat)
@@ -0,0 +1,297 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Bounded in-process caches for expensive, immutable results
+
+Cache keys are tuples whose first element is a namespace, typically the checksum of the database
+the value was computed from (see `vipre_data.sql.manifest.database_checksum`). Namespaces let a
+cache drop or carry over whole generations of entries when the database changes.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import sys
+import threading
+import typing as t
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Key = tuple
+
+# All caches created in this process, by name, so that they can be inspected and accounted for
+caches: dict[str, "LRUCache"] = {}
+
+# Bytes that all the caches may hold together, on top of their own budgets (0: no combined budget)
+memory_budget = int(os.getenv("VIPRE_DATA_MEMORY_BUDGET_BYTES", "0"))
+_budget_lock = threading.Lock()
+
+
+def approximate_size(value: t.Any) -> int:
+    """Estimate the number of bytes held by a cached value"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(approximate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approximate_size(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class DiskCache:
+    """Persistent cache of pickled values, stored in one directory per key namespace"""
+
+    def __init__(self, directory: t.Union[str, Path], max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.nbytes = sum(f.stat().st_size for f in self.directory.glob("*/*.pkl"))
+
+    def _path(self, key: Key) -> Path:
+        namespace, rest = str(key[0]), key[1:]
+        return self.directory / namespace / f"{hashlib.sha1(repr(rest).encode()).hexdigest()}.pkl"
+
+    def get(self, key: Key) -> t.Optional[t.Any]:
+        try:
+            with self._path(key).open("rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError):
+            logger.warning("Discarding unreadable disk cache entry for %s", key)
+            self._path(key).unlink(missing_ok=True)
+            return None
+
+    def put(self, key: Key, value: t.Any) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with tmp.open("wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)  # Concurrent workers never read a partially written entry
+            self.nbytes += path.stat().st_size - replaced
+            if self.nbytes > self.max_bytes:
+                self._prune()
+
+    def _prune(self) -> None:
+        """Delete the least recently written entries until the cache fits in its budget"""
+        files = sorted(self.directory.glob("*/*.pkl"), key=lambda f: f.stat().st_mtime)
+        self.nbytes = sum(f.stat().st_size for f in files)
+        for f in files:
+            if self.nbytes <= self.max_bytes * 0.9:
+                break
+            self.nbytes -= f.stat().st_size
+            f.unlink(missing_ok=True)
+
+    def rename_namespace(self, old: str, new: str) -> None:
+        old_dir, new_dir = self.directory / str(old), self.directory / str(new)
+        if not old_dir.exists():
+            return
+        if not new_dir.exists():
+            old_dir.rename(new_dir)
+            return
+        # Merge into the existing namespace, whose entries take precedence
+        for f in old_dir.glob("*.pkl"):
+            target = new_dir / f.name
+            if target.exists():
+                with self._lock:
+                    self.nbytes -= f.stat().st_size
+                f.unlink(missing_ok=True)
+            else:
+                f.rename(target)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def drop_namespace(self, namespace: str) -> None:
+        for f in (self.directory / str(namespace)).glob("*.pkl"):
+            with self._lock:
+                self.nbytes -= f.stat().st_size
+            f.unlink(missing_ok=True)
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by the total size of its values in bytes.
+
+    Optionally backed by a `DiskCache`: values evicted from or missing in memory are looked up on
+    disk, and every value put in the cache is also written to disk.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int,
+        disk: t.Optional[DiskCache] = None,
+        sizeof: t.Callable[[t.Any], int] = approximate_size,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+        self._entries: OrderedDict[Key, tuple[t.Any, int]] = OrderedDict()
+        self._lock = threading.RLock()
+        caches[name] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: Key) -> t.Optional[t.Any]:
+        """Fetch a value, marking it as most recently used; returns None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        value = self.disk.get(key) if self.disk else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, value)
+        enforce_budget()
+        return value
+
+    def put(self, key: Key, value: t.Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._insert(key, value)
+        enforce_budget()
+        if self.disk:
+            self.disk.put(key, value)
+
+    def _insert(self, key: Key, value: t.Any) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return  # Never evict everything else for a single oversized value
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        self.evict(self.max_bytes)
+
+    def evict(self, max_bytes: int) -> int:
+        """Evict least recently used entries until at most `max_bytes` are held
+
+        :return: number of bytes freed
+        """
+        freed = 0
+        with self._lock:
+            while self._entries and self.nbytes > max_bytes:
+                _, (_, size) = self._entries.popitem(last=False)
+                self.nbytes -= size
+                freed += size
+                self.evictions += 1
+        return freed
+
+    def rename_namespace(self, old: str, new: str) -> None:
+        """Carry entries computed against one database generation over to the next"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == old]:
+                entry, new_key = self._entries.pop(key), (new, *key[1:])
+                if new_key in self._entries:
+                    self.nbytes -= entry[1]  # Keep the entry already computed for the new database
+                else:
+                    self._entries[new_key] = entry
+        if self.disk:
+            self.disk.rename_namespace(old, new)
+
+    def drop_namespace(self, namespace: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == namespace]:
+                self.nbytes -= self._entries.pop(key)[1]
+        if self.disk:
+            self.disk.drop_namespace(namespace)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "nbytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "disk_nbytes": self.disk.nbytes if self.disk else None,
+            }
+
+
+def enforce_budget() -> int:
+    """Evict from the largest caches until all of them fit in `memory_budget` together
+
+    :return: number of bytes freed
+    """
+    if memory_budget <= 0:
+        return 0
+    freed = 0
+    # Caches are locked one at a time, never while another one is held
+    with _budget_lock:
+        while (excess := sum(c.nbytes for c in caches.values()) - memory_budget) > 0:
+            largest = max(caches.values(), key=lambda c: c.nbytes)
+            evicted = largest.evict(max(largest.nbytes - excess, 0))
+            if not evicted:
+                break
+            freed += evicted
+    return freed
+
+
+def from_env(name: str, prefix: str, default_bytes: int) -> LRUCache:
+    """
+    Create a cache configured from environment variables:
+        {prefix}_BYTES: in-memory budget in bytes (0 disables the cache)
+        {prefix}_DIR: directory for the persistent on-disk layer (unset disables it)
+        {prefix}_DISK_BYTES: on-disk budget in bytes
+    """
+    max_bytes = int(os.getenv(f"{prefix}_BYTES", str(default_bytes)))
+    directory = os.getenv(f"{prefix}_DIR")
+    disk = None
+    if directory and max_bytes > 0:
+        disk = DiskCache(directory, int(os.getenv(f"{prefix}_DISK_BYTES", str(2**30))))
+    return LRUCache(name, max_bytes, disk=disk)
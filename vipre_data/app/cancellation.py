@@ -0,0 +1,279 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Cancellation of the work done for requests whose response is no longer wanted
+
+Each request gets a `Cancellation` which is cancelled when:
+  - its client disconnects,
+  - a newer request of the same query stream arrives: requests sent with an
+    `X-Query-Generation: <stream>:<generation>` header cancel the requests of the same stream with
+    a lower generation, so that only the last request of, e.g., a slider drag is served,
+  - its time budget runs out: `X-Time-Budget` seconds, or VIPRE_DATA_TIME_BUDGET by default.
+
+SQLite statements check the cancellation of their request through a progress handler and are
+aborted with a `Cancelled` error, which is served as a 499 (disconnected), 409 (superseded) or
+504 (timeout) response. Filter queries running out of time return the rows fetched so far instead
+(see `fetch_all`). Computations waiting on the compute pool check it as well (see
+`vipre_data.app.compute`).
+"""
+
+import asyncio
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query
+
+DISCONNECTED, SUPERSEDED, TIMEOUT = "disconnected", "superseded", "timeout"
+REASONS = {
+    DISCONNECTED: (499, "Client disconnected"),
+    SUPERSEDED: (409, "Superseded by a newer query of the same stream"),
+    TIMEOUT: (504, "Request ran out of its time budget"),
+}
+
+GENERATION_HEADER = b"x-query-generation"
+BUDGET_HEADER = b"x-time-budget"
+PARTIAL_HEADER = "X-Partial-Result"
+
+default_budget = float(os.getenv("VIPRE_DATA_TIME_BUDGET", "0"))  # [s], 0: unlimited
+PROGRESS_INSTRUCTIONS = 1000  # SQLite virtual machine instructions between cancellation checks
+PARTIAL_BATCH = 500  # rows fetched at a time by `fetch_all`
+
+
+class Cancelled(HTTPException):
+    """Work abandoned because the response of its request is no longer wanted"""
+
+    def __init__(self, reason: str):
+        super().__init__(*REASONS[reason])
+        self.reason = reason
+
+
+class Cancellation:
+    """Cancellation state of one request, shared by the tasks and threads serving it"""
+
+    def __init__(self, budget: float = 0.0):
+        self.deadline = time.monotonic() + budget if budget > 0 else None
+        self.reason: t.Optional[str] = None
+        self.partial = False  # the response holds the results fetched before the deadline
+
+    def cancel(self, reason: str) -> None:
+        if self.reason is None:
+            self.reason = reason
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() > self.deadline:
+            self.reason = TIMEOUT
+        return self.reason is not None
+
+    def check(self) -> None:
+        """Raise `Cancelled` if the request has been cancelled"""
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+
+_current: contextvars.ContextVar[t.Optional[Cancellation]] = contextvars.ContextVar(
+    "cancellation", default=None
+)
+
+
+def current() -> t.Optional[Cancellation]:
+    """The cancellation of the request being served by this task or thread, if any"""
+    return _current.get()
+
+
+def check() -> None:
+    """Raise `Cancelled` if the request being served has been cancelled"""
+    if (cancellation := _current.get()) is not None:
+        cancellation.check()
+
+
+def fetch_all(query: Query) -> list:
+    """
+    All the rows of a query or, if the request runs out of time while they are fetched, those
+    fetched so far, marking the response as partial
+    """
+    rows = []
+    try:
+        rows.extend(query.yield_per(PARTIAL_BATCH))
+    except Cancelled as e:
+        if e.reason != TIMEOUT or not rows:
+            raise
+        _current.get().partial = True
+    return rows
+
+
+class _Stream:
+    __slots__ = ("generation", "requests")
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.requests: set[Cancellation] = set()
+
+
+class Generations:
+    """Requests in flight for each query stream"""
+
+    def __init__(self):
+        self._streams: dict[str, _Stream] = {}
+        self._lock = threading.Lock()
+
+    def enter(self, stream: str, generation: int, cancellation: Cancellation) -> None:
+        """Start a request, cancelling the older requests of its stream or itself if outdated"""
+        with self._lock:
+            current = self._streams.setdefault(stream, _Stream(generation))
+            if generation < current.generation:
+                cancellation.cancel(SUPERSEDED)
+            elif generation > current.generation:
+                for older in current.requests:
+                    older.cancel(SUPERSEDED)
+                current.generation = generation
+            current.requests.add(cancellation)
+
+    def exit(self, stream: str, cancellation: Cancellation) -> None:
+        # Streams are forgotten once idle, so only requests overlapping a newer one are superseded
+        with self._lock:
+            current = self._streams[stream]
+            current.requests.discard(cancellation)
+            if not current.requests:
+                del self._streams[stream]
+
+
+generations = Generations()
+
+
+def _parse(scope) -> tuple[t.Optional[tuple[str, int]], float]:
+    # Query stream and generation, and time budget of a request; raises ValueError if invalid
+    headers = dict(scope["headers"])
+    stream = None
+    if GENERATION_HEADER in headers:
+        name, generation = headers[GENERATION_HEADER].decode().rsplit(":", 1)
+        stream = (name, int(generation))
+    budget = float(headers.get(BUDGET_HEADER, default_budget))
+    if not budget >= 0:
+        raise ValueError(f"Invalid time budget: {budget}")
+    return stream, budget
+
+
+class CancellationMiddleware:
+    """
+    ASGI middleware giving each request a `Cancellation`, cancelled when its client disconnects or
+    a newer request of its query stream arrives
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        try:
+            stream, budget = _parse(scope)
+        except ValueError as e:
+            response = JSONResponse({"detail": f"Invalid cancellation headers: {e}"}, 400)
+            return await response(scope, receive, send)
+
+        cancellation = Cancellation(budget)
+        if stream is not None:
+            generations.enter(*stream, cancellation)
+        if cancellation.cancelled:
+            if stream is not None:
+                generations.exit(stream[0], cancellation)
+            status, detail = REASONS[cancellation.reason]
+            return await JSONResponse({"detail": detail}, status)(scope, receive, send)
+
+        # Messages are read from the server as they arrive so that a disconnect is noticed while
+        # the request is being served, even by endpoints that never read the request
+        messages: asyncio.Queue = asyncio.Queue()
+        responded = False
+
+        async def listen():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect" and not responded:
+                    cancellation.cancel(DISCONNECTED)
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        async def receive_listened():
+            if cancellation.reason == DISCONNECTED and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def send_tracked(message):
+            nonlocal responded
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                responded = True
+            await send(message)
+
+        listener = asyncio.ensure_future(listen())
+        token = _current.set(cancellation)
+        try:
+            await self.app(scope, receive_listened, send_tracked)
+        finally:
+            _current.reset(token)
+            listener.cancel()
+            if stream is not None:
+                generations.exit(stream[0], cancellation)
+
+
+def _progress() -> int:
+    # SQLite progress handler; a non-zero return value aborts the running statement
+    cancellation = _current.get()
+    return cancellation is not None and cancellation.cancelled
+
+
+def _connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(_progress, PROGRESS_INSTRUCTIONS)
+
+
+def _handle_error(context):
+    # Report statements aborted by `_progress` as the cancellation of their request
+    cancellation = _current.get()
+    if (
+        isinstance(context.original_exception, sqlite3.OperationalError)
+        and cancellation is not None
+        and cancellation.reason is not None
+    ):
+        raise Cancelled(cancellation.reason) from context.original_exception
+
+
+def install(app):
+    """Cancel the work of the requests served by `app` once their responses are not wanted"""
+    event.listen(Engine, "connect", _connect)
+    event.listen(Engine, "handle_error", _handle_error)
+    app.add_middleware(CancellationMiddleware)
@@ -0,0 +1,120 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Single-flight coalescing of identical concurrent requests
+
+When several clients (or several components of one dashboard) send the same request at once, only
+the first one, the leader, runs the computation; the others wait for it and share its result or
+its error. Calls are only coalesced while one is in flight, nothing is kept afterwards (see
+`vipre_data.app.cache` for that).
+
+A leader whose request is cancelled (see `vipre_data.app.cancellation`) does not fail its
+followers: they start over and one of them becomes the new leader. Followers whose own request is
+cancelled stop waiting.
+"""
+
+import threading
+import typing as t
+
+from vipre_data.app import cancellation
+
+Key = t.Hashable
+
+WAIT_INTERVAL = 0.1  # seconds between checks for the cancellation of a waiting follower
+
+# All groups created in this process, by name, so that their coalescing rates can be reported
+groups: dict[str, "SingleFlight"] = {}
+
+
+def abandoned(error: BaseException) -> bool:
+    """Whether an error only concerns the request that raised it"""
+    return isinstance(error, cancellation.Cancelled)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: t.Any = None
+        self.error: t.Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Thread-safe group of calls in which at most one call per key is in flight at a time"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = self.followers = 0
+        self._calls: dict[Key, _Call] = {}
+        self._lock = threading.Lock()
+        groups[name] = self
+
+    def do(self, key: Key, func: t.Callable, *args, **kwargs) -> t.Any:
+        """
+        Return `func(*args, **kwargs)`, or the result of the call in flight with the same key if
+        there is one
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+            if leader:
+                return self._lead(key, call, func, *args, **kwargs)
+            while not call.done.wait(WAIT_INTERVAL):
+                cancellation.check()
+            if call.error is None:
+                return call.result
+            if not abandoned(call.error):
+                raise call.error
+
+    def _lead(self, key: Key, call: _Call, func: t.Callable, *args, **kwargs) -> t.Any:
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,238 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Process pool for CPU heavy computations such as the entry arcs
+
+Computations run in worker processes so that they do not hold the GIL of the server process, which
+keeps the latency of the database backed endpoints flat while arcs are being computed. Workers
+return their arrays through a shared memory block instead of pickling them. Jobs submitted on
+behalf of a request are abandoned when the client disconnects or the request is otherwise cancelled
+(see `vipre_data.app.cancellation`): queued jobs are cancelled and the results of running ones are
+discarded.
+
+The pool holds VIPRE_DATA_COMPUTE_WORKERS processes (by default half of the CPUs, at most 4). With
+0 workers computations run in the server's thread pool instead.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import typing as t
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+from vipre_data.app import cancellation, metrics
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.1  # seconds between checks for a disconnected client
+
+# (offset, shape, dtype) of each array in a shared memory block
+Layout = list[tuple[int, tuple, str]]
+
+_executor: t.Optional[ProcessPoolExecutor] = None
+_slots: t.Optional[asyncio.Semaphore] = None  # idle workers
+_lock = threading.Lock()
+
+
+def worker_count() -> int:
+    default = min(4, max(1, (os.cpu_count() or 2) // 2))
+    return int(os.getenv("VIPRE_DATA_COMPUTE_WORKERS", str(default)))
+
+
+def get_executor() -> t.Optional[ProcessPoolExecutor]:
+    """The shared process pool, started on first use; None when computing in-process"""
+    global _executor
+    with _lock:
+        if _executor is None and worker_count() > 0:
+            # Workers must share this process' resource tracker, or the shared memory they create
+            # would be reported as leaked (and unlinked twice) when they exit
+            resource_tracker.ensure_running()
+            # Forking this process would copy the state of its threads (locks held by the thread
+            # pool, the jobs or the slow query log) into the workers; they start from a clean
+            # forkserver instead, or are spawned where there is none (Windows)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            _executor = ProcessPoolExecutor(max_workers=worker_count(), mp_context=context)
+        return _executor
+
+
+def shutdown() -> None:
+    global _executor, _slots
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+            _slots = None
+
+
+def _share(arrays: list[np.ndarray]) -> tuple[str, Layout]:
+    # Copy the arrays into one new shared memory block, which the receiving process must unlink
+    layout, offset = [], 0
+    arrays = [np.ascontiguousarray(a) for a in arrays]
+    for a in arrays:
+        layout.append((offset, a.shape, a.dtype.str))
+        offset += -(-a.nbytes // 8) * 8  # keep every array 8 byte aligned
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for (start, shape, dtype), a in zip(layout, arrays):
+            np.ndarray(shape, dtype, buffer=block.buf, offset=start)[...] = a
+        return block.name, layout
+    finally:
+        block.close()
+
+
+def _collect(name: str, layout: Layout) -> list[np.ndarray]:
+    # Copy the arrays out of a block written by `_share` and release it
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return [
+            np.ndarray(shape, dtype, buffer=block.buf, offset=start).copy()
+            for start, shape, dtype in layout
+        ]
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _release(future: Future) -> None:
+    # Free the shared memory of a job whose result is no longer wanted
+    if not future.cancelled() and future.exception() is None:
+        name, _ = future.result()
+        block = shared_memory.SharedMemory(name=name)
+        block.close()
+        block.unlink()
+
+
+def _run_shared(func: t.Callable[..., list[np.ndarray]], args: tuple, kwargs: dict):
+    # Entry point in the worker processes
+    return _share(func(*args, **kwargs))
+
+
+async def _until_disconnected(awaitable: t.Awaitable, request: t.Optional[Request]):
+    # Await `awaitable`, raising `Cancelled` if the client of `request` disconnects or the request
+    # being served is cancelled meanwhile
+    task = asyncio.ensure_future(awaitable)
+    while True:
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            try:
+                if request is not None and await request.is_disconnected():
+                    raise cancellation.Cancelled(cancellation.DISCONNECTED)
+                cancellation.check()
+            except cancellation.Cancelled:
+                task.cancel()
+                raise
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(worker_count())
+    return _slots
+
+
+async def _acquire_slot(slots: asyncio.Semaphore, request: t.Optional[Request]) -> None:
+    # Wait for an idle worker; a slot acquired after the request stopped waiting is given back
+    task = asyncio.ensure_future(slots.acquire())
+    try:
+        await _until_disconnected(task, request)
+    except BaseException:
+        task.cancel()
+        task.add_done_callback(
+            lambda _: task.cancelled() or task.exception() is not None or slots.release()
+        )
+        raise
+
+
+async def run(
+    func: t.Callable[..., list[np.ndarray]],
+    *args,
+    request: t.Optional[Request] = None,
+    **kwargs,
+) -> list[np.ndarray]:
+    """
+    Run `func(*args, **kwargs)` in the compute pool and return the list of arrays it returns.
+
+    `func` must be importable from a module and its arguments must be picklable. Jobs wait here
+    for an idle worker rather than in the executor's queue, so that a job whose request is cancelled
+    (or, when `request` is given, whose client disconnects) before it starts is dropped without
+    running. A job that has already started runs to completion, but its result is discarded.
+    """
+    executor = get_executor()
+    if executor is None:
+        return await run_in_threadpool(metrics.profiled(func), *args, **kwargs)
+
+    slots = _get_slots()
+    await _acquire_slot(slots, request)
+    loop = asyncio.get_running_loop()
+    try:
+        future = executor.submit(_run_shared, func, args, kwargs)
+    except BrokenProcessPool:
+        logger.warning("Compute pool is broken, restarting it")
+        shutdown()
+        future = get_executor().submit(_run_shared, func, args, kwargs)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(slots.release))
+
+    try:
+        return _collect(*await _until_disconnected(asyncio.wrap_future(future), request))
+    except BaseException:
+        future.add_done_callback(_release)
+        raise
+
+
+def run_sync(func: t.Callable[..., list[np.ndarray]], *args, **kwargs) -> list[np.ndarray]:
+    """
+    Blocking counterpart of `run` for callers outside the event loop, such as background jobs.
+
+    These jobs queue in the executor alongside those submitted by `run` rather than waiting for an
+    idle worker, and cannot be abandoned once submitted.
+    """
+    executor = get_executor()
+    if executor is None:
+        return func(*args, **kwargs)
+    try:
+        future = executor.submit(_run_shared, func, args, kwargs)
+    except BrokenProcessPool:
+        logger.warning("Compute pool is broken, restarting it")
+        shutdown()
+        future = get_executor().submit(_run_shared, func, args, kwargs)
+    return _collect(*future.result())
@@ -0,0 +1,63 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Selective invalidation of in-process caches when rows are appended to the served database
+
+Cache layers register a callback with `subscribe`; when a change manifest is posted to the server
+(see `vipre_data.sql.ingest`) every callback receives it and drops or re-keys only the entries that
+the appended rows can affect.
+"""
+
+import logging
+import typing as t
+
+logger = logging.getLogger(__name__)
+
+ManifestCallback = t.Callable[[dict], None]
+
+_subscribers: dict[str, ManifestCallback] = {}
+
+
+def subscribe(name: str, callback: ManifestCallback) -> None:
+    """Register a callback to receive change manifests; re-subscribing a name replaces it"""
+    _subscribers[name] = callback
+
+
+def apply_manifest(manifest: dict) -> list[str]:
+    """Forward a change manifest to every subscriber
+
+    :return: names of the subscribers that were notified
+    """
+    notified = []
+    for name, callback in list(_subscribers.items()):
+        try:
+            callback(manifest)
+            notified.append(name)
+        except Exception:  # One misbehaving cache should not block invalidation of the others
+            logger.exception("Failed to apply change manifest to %s", name)
+    return notified
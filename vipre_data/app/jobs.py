@@ -0,0 +1,251 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+In-process job queue for computations too long to run within a single HTTP request
+
+A job is a registered computation (see `register`) applied to a spec, for example the arcs of every
+entry of a trajectory. Submitted jobs wait in a bounded queue and are run by a small pool of worker
+threads, each with its own database session. Jobs report their progress through `Job.report`,
+which is also where a cancelled job stops. Results are kept for VIPRE_DATA_JOB_TTL seconds after a
+job finishes and then dropped.
+
+The pool runs VIPRE_DATA_JOB_WORKERS threads (default 2) and the queue holds at most
+VIPRE_DATA_JOB_QUEUE jobs (default 100).
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import typing as t
+import uuid
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from vipre_data.app.dependencies import get_engine
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised from `Job.report` to stop a job that has been cancelled"""
+
+
+class QueueFull(Exception):
+    """Raised when submitting to a job queue that is at capacity"""
+
+
+class Job:
+    """A submitted computation and its state; `result` is set once it has succeeded"""
+
+    def __init__(self, kind: str, spec: BaseModel):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.spec = spec
+        self.status = QUEUED
+        self.progress = 0.0
+        self.error: t.Optional[str] = None
+        self.result: t.Any = None
+        self.created = time.time()
+        self.started: t.Optional[float] = None
+        self.finished: t.Optional[float] = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def report(self, progress: float) -> None:
+        """Record the fraction of the job that is done, stopping here if it was cancelled"""
+        if self.cancelled:
+            raise JobCancelled()
+        self.progress = min(max(progress, 0.0), 1.0)
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+# A job function computes the result of a job from its validated spec, calling `job.report`
+# regularly; the result must be serializable as the JSON response of `/jobs/{id}/result`
+JobFunction = t.Callable[[Session, BaseModel, Job], t.Any]
+
+
+class JobManager:
+    """Bounded queue of jobs run by a pool of worker threads, started on first submission"""
+
+    def __init__(self, workers: int, max_queued: int, result_ttl: float):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._kinds: dict[str, tuple[JobFunction, type[BaseModel]]] = {}
+        self._jobs: dict[str, Job] = {}
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queued)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, func: JobFunction, spec: type[BaseModel]) -> None:
+        """Make `func` available as a job of the given kind; re-registering a kind replaces it"""
+        self._kinds[kind] = (func, spec)
+
+    @property
+    def kinds(self) -> list[str]:
+        return sorted(self._kinds)
+
+    def spec_model(self, kind: str) -> type[BaseModel]:
+        return self._kinds[kind][1]
+
+    def submit(self, kind: str, spec: BaseModel) -> Job:
+        """Queue a job, raising `KeyError` for an unknown kind and `QueueFull` at capacity"""
+        if kind not in self._kinds:
+            raise KeyError(kind)
+        self._expire()
+        job = Job(kind, spec)
+        with self._lock:
+            self._start()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull(f"The job queue is full ({self.max_queued} jobs)") from None
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> t.Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        self._expire()
+        return sorted(self._jobs.values(), key=lambda job: job.created)
+
+    def cancel(self, job_id: str) -> t.Optional[Job]:
+        """
+        Cancel a job. Queued jobs never start; running jobs stop at their next progress report.
+        Finished jobs are left as they are.
+        """
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED:
+            job._cancelled.set()
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+        return job
+
+    def shutdown(self) -> None:
+        """Cancel every pending job and stop the workers"""
+        with self._lock:
+            for job in self._jobs.values():
+                job._cancelled.set()
+            for _ in self._threads:
+                self._queue.put(None)
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+
+    def _start(self) -> None:
+        # Called with the lock held
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work, name=f"vipre-job-{len(self._threads)}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _expire(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id
+                for job_id, job in self._jobs.items()
+                if job.finished is not None and now - job.finished > self.result_ttl
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    @staticmethod
+    def _finish(job: Job, status: str, error: t.Optional[str] = None) -> None:
+        job.error = error
+        job.finished = time.time()
+        job.status = status
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.cancelled:
+                if job.status not in FINISHED:
+                    self._finish(job, CANCELLED)
+                continue
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        func, _ = self._kinds[job.kind]
+        job.started = time.time()
+        job.status = RUNNING
+        db = Session(autocommit=False, autoflush=False, bind=get_engine())
+        try:
+            result = func(db, job.spec, job)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            self._finish(job, FAILED, str(getattr(e, "detail", e)))
+        else:
+            job.result = result
+            job.progress = 1.0
+            self._finish(job, SUCCEEDED)
+        finally:
+            db.close()
+
+
+def from_env() -> JobManager:
+    return JobManager(
+        workers=int(os.getenv("VIPRE_DATA_JOB_WORKERS", "2")),
+        max_queued=int(os.getenv("VIPRE_DATA_JOB_QUEUE", "100")),
+        result_ttl=float(os.getenv("VIPRE_DATA_JOB_TTL", "3600")),
+    )
+
+
+manager = from_env()
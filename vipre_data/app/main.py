@@ -29,7 +29,10 @@ from importlib.metadata import version
 
 from fastapi import FastAPI
 
-from vipre_data.app.routers import trajectories, entries, info, visualizations, bodies
+from vipre_data.app import cancellation, compute, jobs, metrics, profiling, slow_queries
+from vipre_data.app.routers import trajectories, entries, info, visualizations, bodies, debug
+from vipre_data.app.routers import jobs as jobs_router
+from vipre_data.app.routers import metrics as metrics_router
 
 app = FastAPI(
     title="VIPRE-data",
@@ -42,6 +45,18 @@ app.include_router(trajectories.router)
 app.include_router(entries.router)
 app.include_router(bodies.router)
 app.include_router(info.router)
+app.include_router(jobs_router.router)
+app.include_router(debug.router)
+if metrics.enabled:
+    app.include_router(metrics_router.router)
+# Installed first so that the metrics middleware, added last, also records profiled requests
+profiling.install(app)
+cancellation.install(app)
+metrics.install(app)
+slow_queries.install()
+
+app.add_event_handler("shutdown", jobs.manager.shutdown)
+app.add_event_handler("shutdown", compute.shutdown)
 
 
 @app.get("/")
@@ -0,0 +1,177 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Memory diagnostics of this worker process
+
+Reports the resident set size of the process and the bytes held by each in-process cache, and, while
+tracemalloc is tracing (VIPRE_DATA_TRACEMALLOC frames from startup, or toggled at runtime), the
+lines that allocated the most memory. Named snapshots of the traced allocations can be taken and
+compared to find what grew between two points in time. Since each uvicorn worker is a separate
+process, every report carries the process ID of the worker that served it.
+
+The combined budget of the caches, VIPRE_DATA_MEMORY_BUDGET_BYTES, is enforced by
+`vipre_data.app.cache`.
+"""
+
+import os
+import threading
+import time
+import tracemalloc
+import typing as t
+from collections import OrderedDict
+
+from vipre_data.app import cache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACEMALLOC_FRAMES = int(os.getenv("VIPRE_DATA_TRACEMALLOC", "0"))  # traced from startup if > 0
+MAX_SNAPSHOTS = 10  # oldest snapshots are dropped past this
+KEY_TYPES = ("filename", "lineno", "traceback")
+NOW = "now"  # name of a snapshot taken on the spot when diffing
+
+
+class NotTracing(Exception):
+    """Raised when allocations are requested while tracemalloc is not tracing"""
+
+
+class UnknownSnapshot(KeyError):
+    """Raised when diffing a snapshot that was never taken or was dropped"""
+
+
+def rss() -> t.Optional[int]:
+    """Resident set size of this process [bytes], where /proc is available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss() -> t.Optional[int]:
+    """Largest resident set size this process has had [bytes]"""
+    if resource is None:
+        return None
+    # Reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def report() -> dict:
+    stats = [c.stats() for c in cache.caches.values()]
+    traced, traced_peak = tracemalloc.get_traced_memory()
+    return {
+        "pid": os.getpid(),
+        "rss": rss(),
+        "peak_rss": peak_rss(),
+        "caches": stats,
+        "cache_bytes": sum(s["nbytes"] for s in stats),
+        "cache_budget": cache.memory_budget or None,
+        "tracing": tracemalloc.is_tracing(),
+        "traced_bytes": traced,
+        "traced_peak_bytes": traced_peak,
+        "snapshots": list(_snapshots),
+    }
+
+
+def set_tracing(enabled: bool, frames: int = 1) -> None:
+    """Start or stop tracing allocations; stopping also drops the snapshots taken"""
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+        with _lock:
+            _snapshots.clear()
+
+
+_snapshots: OrderedDict[str, tracemalloc.Snapshot] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    if not tracemalloc.is_tracing():
+        raise NotTracing()
+    return tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+    )
+
+
+def _location(statistic: t.Union[tracemalloc.Statistic, tracemalloc.StatisticDiff]) -> str:
+    return " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in statistic.traceback)
+
+
+def top(limit: int = 20, key_type: str = "lineno") -> list[dict]:
+    """The locations holding the most traced memory right now"""
+    return [
+        {"location": _location(s), "size": s.size, "count": s.count}
+        for s in _snapshot().statistics(key_type)[:limit]
+    ]
+
+
+def take_snapshot(name: t.Optional[str] = None) -> str:
+    """Store a snapshot of the traced allocations under `name` (by default, the current time)"""
+    snapshot = _snapshot()
+    name = name or time.strftime("%Y-%m-%dT%H:%M:%S")
+    with _lock:
+        _snapshots.pop(name, None)
+        _snapshots[name] = snapshot
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return name
+
+
+def diff(first: str, second: str = NOW, limit: int = 20, key_type: str = "lineno") -> list[dict]:
+    """The locations whose traced memory changed the most from snapshot `first` to `second`"""
+
+    def get(name: str) -> tracemalloc.Snapshot:
+        if name == NOW:
+            return _snapshot()
+        with _lock:
+            if name not in _snapshots:
+                raise UnknownSnapshot(name)
+            return _snapshots[name]
+
+    statistics = get(second).compare_to(get(first), key_type)
+    return [
+        {
+            "location": _location(s),
+            "size": s.size,
+            "count": s.count,
+            "size_diff": s.size_diff,
+            "count_diff": s.count_diff,
+        }
+        for s in statistics[:limit]
+    ]
+
+
+if TRACEMALLOC_FRAMES > 0:
+    set_tracing(True, TRACEMALLOC_FRAMES)
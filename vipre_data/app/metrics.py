@@ -0,0 +1,425 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Per-route performance metrics, exposed in the Prometheus text format at `/metrics`
+
+`MetricsMiddleware` times each request and counts its response bytes. SQL statements and their
+time are recorded through engine events, the rows loaded through ORM load events, and the routes
+of the API routers (created with `route_class=InstrumentedRoute`) record their path template and
+the time spent in their endpoint function; the rest of the route's time, spent validating the
+request, solving its dependencies and serializing the response, is reported as serialization time.
+Statements run outside of a request, by jobs for example, are reported under the "background"
+route.
+
+Metrics are collected unless VIPRE_DATA_METRICS is "0", in which case neither the middleware nor
+the event listeners are installed and `/metrics` is not served. Routes then find no record to fill
+in. Requests being profiled (see `vipre_data.app.profiling`) have a record in any case, on which
+the threads running their endpoint add their profiles.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import cProfile
+import functools
+import os
+import threading
+import time
+import typing as t
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from vipre_data.app import cache, coalesce, memory
+from vipre_data.sql import models
+
+enabled = os.getenv("VIPRE_DATA_METRICS", "1") != "0"
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # [s]
+BACKGROUND = "background"
+UNMATCHED = "unmatched"
+
+
+class RequestRecord:
+    """What a request did, filled in as it is served"""
+
+    __slots__ = (
+        "route",
+        "statements",
+        "sql_seconds",
+        "rows",
+        "endpoint_seconds",
+        "route_seconds",
+        "profiles",
+    )
+
+    def __init__(self):
+        self.route = UNMATCHED
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.endpoint_seconds = 0.0
+        self.route_seconds = 0.0
+        # Profiles of the endpoint threads, when the request is profiled
+        self.profiles: t.Optional[list[cProfile.Profile]] = None
+
+
+# The record of the request being served; the threads running sync endpoints inherit a copy of the
+# context, which refers to the same record
+_record: contextvars.ContextVar[t.Optional[RequestRecord]] = contextvars.ContextVar(
+    "record", default=None
+)
+
+
+def current_record() -> t.Optional[RequestRecord]:
+    """The record of the request being served by this task or thread, if any"""
+    return _record.get()
+
+
+@contextlib.contextmanager
+def request_record() -> t.Iterator[RequestRecord]:
+    """The record of the request being served, started here if metrics have not started one"""
+    record = _record.get()
+    if record is not None:
+        yield record
+        return
+    record = RequestRecord()
+    token = _record.set(record)
+    try:
+        yield record
+    finally:
+        _record.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets: t.Sequence[float] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Thread-safe registry of the per-route metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: dict[tuple[str, str], Histogram] = {}  # by route and method
+        self.requests: dict[tuple[str, str, int], int] = {}  # by route, method and status
+        # Totals by route
+        self.statements: dict[str, int] = {}
+        self.sql_seconds: dict[str, float] = {}
+        self.rows: dict[str, int] = {}
+        self.serialization_seconds: dict[str, float] = {}
+        self.response_bytes: dict[str, int] = {}
+
+    @staticmethod
+    def _add(totals: dict, key, value):
+        totals[key] = totals.get(key, 0) + value
+
+    def observe(self, method: str, status: int, size: int, seconds: float, record: RequestRecord):
+        route = record.route
+        with self._lock:
+            self.latency.setdefault((route, method), Histogram()).observe(seconds)
+            self._add(self.requests, (route, method, status), 1)
+            self._add(self.statements, route, record.statements)
+            self._add(self.sql_seconds, route, record.sql_seconds)
+            self._add(self.rows, route, record.rows)
+            self._add(
+                self.serialization_seconds,
+                route,
+                max(record.route_seconds - record.endpoint_seconds, 0.0),
+            )
+            self._add(self.response_bytes, route, size)
+
+    def observe_background(self, statements: int = 0, sql_seconds: float = 0.0, rows: int = 0):
+        with self._lock:
+            self._add(self.statements, BACKGROUND, statements)
+            self._add(self.sql_seconds, BACKGROUND, sql_seconds)
+            self._add(self.rows, BACKGROUND, rows)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name: str, kind: str, help: str, samples: t.Iterable[tuple[str, dict, float]]):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_labels(labels)} {_number(value)}")
+
+        with self._lock:
+            family(
+                "vipre_data_request_duration_seconds",
+                "histogram",
+                "Time to serve a request",
+                (
+                    sample
+                    for (route, method), histogram in sorted(self.latency.items())
+                    for sample in _histogram_samples({"route": route, "method": method}, histogram)
+                ),
+            )
+            family(
+                "vipre_data_requests_total",
+                "counter",
+                "Requests served",
+                (
+                    ("", {"route": route, "method": method, "status": str(status)}, count)
+                    for (route, method, status), count in sorted(self.requests.items())
+                ),
+            )
+            for name, help, totals in [
+                ("sql_statements_total", "SQL statements executed", self.statements),
+                ("sql_seconds_total", "Time spent executing SQL statements", self.sql_seconds),
+                ("rows_loaded_total", "ORM rows loaded from the database", self.rows),
+                (
+                    "serialization_seconds_total",
+                    "Time spent in routes outside of their endpoint function",
+                    self.serialization_seconds,
+                ),
+                ("response_bytes_total", "Bytes of response bodies", self.response_bytes),
+            ]:
+                family(
+                    f"vipre_data_{name}",
+                    "counter",
+                    help,
+                    (("", {"route": route}, value) for route, value in sorted(totals.items())),
+                )
+
+        for name, help, value in [
+            ("process_resident_bytes", "Resident set size of this worker", memory.rss()),
+            (
+                "process_peak_resident_bytes",
+                "Peak resident set size of this worker",
+                memory.peak_rss(),
+            ),
+        ]:
+            if value is not None:
+                family(f"vipre_data_{name}", "gauge", help, [("", {}, value)])
+
+        stats = [c.stats() for c in cache.caches.values()]
+        for name, kind, help, field in [
+            ("cache_bytes", "gauge", "Bytes held by an in-process cache", "nbytes"),
+            ("cache_entries", "gauge", "Entries held by an in-process cache", "entries"),
+            ("cache_hits_total", "counter", "Cache lookups that found a value", "hits"),
+            ("cache_misses_total", "counter", "Cache lookups that found nothing", "misses"),
+            ("cache_evictions_total", "counter", "Values evicted from a cache", "evictions"),
+        ]:
+            family(
+                f"vipre_data_{name}",
+                kind,
+                help,
+                (("", {"cache": s["name"]}, s[field]) for s in stats),
+            )
+
+        stats = [g.stats() for g in coalesce.groups.values()]
+        for name, kind, help, field in [
+            ("coalesce_leaders_total", "counter", "Calls that ran their computation", "leaders"),
+            (
+                "coalesce_followers_total",
+                "counter",
+                "Calls that shared the computation of an identical call in flight",
+                "followers",
+            ),
+            ("coalesce_in_flight", "gauge", "Computations in flight", "in_flight"),
+        ]:
+            family(
+                f"vipre_data_{name}",
+                kind,
+                help,
+                (("", {"group": s["name"]}, s[field]) for s in stats),
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_samples(labels: dict, histogram: Histogram) -> t.Iterator[tuple[str, dict, float]]:
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        yield "_bucket", {**labels, "le": repr(bound)}, count
+    yield "_bucket", {**labels, "le": "+Inf"}, histogram.count
+    yield "_sum", labels, histogram.sum
+    yield "_count", labels, histogram.count
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    record = _record.get()
+    if record is None:
+        metrics.observe_background(statements=1, sql_seconds=seconds)
+    else:
+        record.statements += 1
+        record.sql_seconds += seconds
+
+
+def _load(target, context):
+    record = _record.get()
+    if record is None:
+        metrics.observe_background(rows=1)
+    else:
+        record.rows += 1
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency, response size and `RequestRecord` of each request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        record = RequestRecord()
+        token = _record.set(record)
+        status, size = 500, 0
+
+        async def send_measured(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            metrics.observe(scope["method"], status, size, time.perf_counter() - start, record)
+            _record.reset(token)
+
+
+def profiled(func: t.Callable) -> t.Callable:
+    """Wrap a function run in a worker thread so that it is profiled along with its request"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        record = _record.get()
+        if record is None or record.profiles is None:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            record.profiles.append(profile)
+
+    return wrapper
+
+
+def _timed_endpoint(call: t.Callable) -> t.Callable:
+    # Add the time spent in an endpoint function to the request's record
+    if asyncio.iscoroutinefunction(call):
+
+        @functools.wraps(call)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                if (record := _record.get()) is not None:
+                    record.endpoint_seconds += time.perf_counter() - start
+
+    else:
+        # Sync endpoints run in a worker thread, out of reach of the event loop's profiler
+        call = profiled(call)
+
+        @functools.wraps(call)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                if (record := _record.get()) is not None:
+                    record.endpoint_seconds += time.perf_counter() - start
+
+    return timed
+
+
+class InstrumentedRoute(APIRoute):
+    """Route that records its path template and the time spent in its endpoint function"""
+
+    def __init__(self, path: str, endpoint: t.Callable, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        # The request handler looks the endpoint up from the dependant on every call
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+
+    def get_route_handler(self) -> t.Callable:
+        handler = super().get_route_handler()
+
+        async def instrumented(request):
+            record = _record.get()
+            if record is None:
+                return await handler(request)
+            record.route = self.path_format
+            start = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                record.route_seconds += time.perf_counter() - start
+
+        return instrumented
+
+
+def install(app: FastAPI):
+    """Start collecting metrics for the requests served by `app`, if enabled"""
+    if not enabled:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(models.Base, "load", _load, propagate=True)
+    app.add_middleware(MetricsMiddleware)
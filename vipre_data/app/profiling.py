@@ -0,0 +1,194 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+On-demand profiling of single requests
+
+When VIPRE_DATA_PROFILE_TOKEN is set, a request carrying that token in an `X-Profile` header (or a
+`profile` query parameter) is run under cProfile, and its response is replaced by the profile:
+a pstats file to download (load it with `pstats.Stats` or snakeviz), or with `X-Profile-Format:
+summary` (or `profile_format=summary`) a JSON summary of the slowest functions. The event loop
+thread is profiled for the whole request, along with the worker thread running a sync endpoint;
+other requests served concurrently on the event loop show up in the profile as well. Only one
+profiler can hook the event loop thread, so profiled requests are served one at a time.
+
+The time of the profiled functions is split between the database, serialization, computation,
+waiting (on locks, other threads or processes) and the rest, according to where each function is
+defined. The status of the profiled response is returned in `X-Profiled-Status`.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import json
+import marshal
+import os
+import pstats
+import time
+import typing as t
+from urllib.parse import parse_qs
+
+from vipre_data.app import metrics
+
+token = os.getenv("VIPRE_DATA_PROFILE_TOKEN")
+enabled = bool(token)
+
+HEADER = b"x-profile"
+FORMAT_HEADER = b"x-profile-format"
+TOP_FUNCTIONS = 40
+
+# Held while a request is profiled: enabling a second profiler on the event loop thread would
+# replace the hook of the first one. Created in the server's event loop, see `_get_lock`
+_lock: t.Optional[asyncio.Lock] = None
+
+
+def _get_lock() -> asyncio.Lock:
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    return _lock
+
+
+# Categories of the split, by substrings of the (file, function) of the profiled functions; the
+# first matching category wins
+CATEGORIES: list[tuple[str, tuple[str, ...]]] = [
+    ("database", ("sqlalchemy", "sqlite3")),
+    (
+        "waiting",
+        ("lock' objects", "'acquire'", "'wait'", "'poll'", "'select'", "concurrent/futures"),
+    ),
+    ("computation", ("numpy", "numba", "vipre_data/computations")),
+    (
+        "serialization",
+        ("pydantic", "fastapi/encoders", "json", "starlette/responses", "vipre_data/app/schemas"),
+    ),
+]
+
+
+def _category(function: tuple[str, int, str]) -> str:
+    name = f"{function[0]}:{function[2]}"
+    for category, patterns in CATEGORIES:
+        if any(pattern in name for pattern in patterns):
+            return category
+    return "other"
+
+
+def split(stats: pstats.Stats) -> dict[str, float]:
+    """Seconds spent in the functions of each category, excluding the functions they call"""
+    seconds = {category: 0.0 for category, _ in CATEGORIES}
+    seconds["other"] = 0.0
+    for function, (_, _, tottime, _, _) in stats.stats.items():
+        seconds[_category(function)] += tottime
+    return seconds
+
+
+def summary(stats: pstats.Stats, status: int, seconds: float) -> dict:
+    functions = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:TOP_FUNCTIONS]
+    return {
+        "status": status,
+        "seconds": seconds,
+        "split": split(stats),
+        "functions": [
+            {
+                "function": pstats.func_std_string(function),
+                "calls": calls,
+                "tottime": tottime,
+                "cumtime": cumtime,
+            }
+            for function, (_, calls, tottime, cumtime, _) in functions
+        ],
+    }
+
+
+def _requested(scope) -> t.Optional[str]:
+    # The format of the profile requested with the configured token, if any
+    headers = dict(scope["headers"])
+    query = parse_qs(scope.get("query_string", b"").decode())
+    given = headers.get(HEADER, b"").decode() or query.get("profile", [""])[0]
+    if not given or not hmac.compare_digest(given, token):
+        return None
+    return headers.get(FORMAT_HEADER, b"").decode() or query.get("profile_format", ["pstats"])[0]
+
+
+class ProfilingMiddleware:
+    """ASGI middleware replacing the response of a request asking to be profiled by its profile"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profile_format = _requested(scope) if scope["type"] == "http" else None
+        if profile_format is None:
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        profile = cProfile.Profile()
+        async with _get_lock():
+            with metrics.request_record() as record:
+                record.profiles = []
+                start = time.perf_counter()
+                profile.enable()
+                try:
+                    await self.app(scope, receive, discard)
+                finally:
+                    profile.disable()
+                seconds = time.perf_counter() - start
+        stats = pstats.Stats(profile)
+        for thread_profile in record.profiles:
+            stats.add(thread_profile)
+
+        headers = [(b"x-profiled-status", b"%d" % status)]
+        if profile_format == "summary":
+            body = json.dumps(summary(stats, status, seconds)).encode()
+            headers.append((b"content-type", b"application/json"))
+        else:
+            # The format written by pstats.Stats.dump_stats
+            body = marshal.dumps(stats.stats)
+            name = scope["path"].strip("/").replace("/", "_") or "root"
+            headers += [
+                (b"content-type", b"application/octet-stream"),
+                (b"content-disposition", f'attachment; filename="{name}.pstats"'.encode()),
+            ]
+            headers += [
+                (f"x-profile-{category}-seconds".encode(), b"%f" % value)
+                for category, value in split(stats).items()
+            ]
+        headers.append((b"content-length", b"%d" % len(body)))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def install(app):
+    """Serve profiles of the requests that ask for one, if a profiling token is configured"""
+    if enabled:
+        app.add_middleware(ProfilingMiddleware)
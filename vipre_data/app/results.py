@@ -0,0 +1,151 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Shared cache of the encoded responses to filter queries
+
+The served database only changes through appends, so the response to a filter query is fully
+determined by the request and the contents of the database. Responses are cached as the bytes sent
+to the client, keyed by the checksum of the database, which changes with the file or the connection
+URL (see `vipre_data.sql.manifest.database_checksum`), and a canonical hash of the request: filters
+are sorted and their numbers normalised, so that equivalent requests from different clients or
+saved views share one entry. Identical queries arriving together are run once (see
+`vipre_data.app.coalesce`). Partial responses, of queries running out of time (see
+`vipre_data.app.cancellation.fetch_all`), are not cached.
+"""
+
+import hashlib
+import json
+import typing as t
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import parse_obj_as
+from sqlalchemy.orm import Session
+
+from vipre_data.app import cache, cancellation, coalesce, invalidation, schemas
+from vipre_data.sql.manifest import database_checksum
+
+# RESULT_VERSION must be incremented whenever the queries or the response models change so that
+# responses persisted in the on-disk cache by an older version are not served
+RESULT_VERSION = 1
+result_cache = cache.from_env(
+    "filter_results", "VIPRE_DATA_RESULT_CACHE", default_bytes=32 * 2**20
+)
+flights = coalesce.SingleFlight("filter_queries")
+
+
+def _drop_results(manifest: dict) -> None:
+    # Appended rows can match any filter, so none of the previous results remain valid
+    result_cache.drop_namespace(manifest["checksum_before"])
+
+
+invalidation.subscribe(result_cache.name, _drop_results)
+
+
+def _normalise(value: t.Any) -> t.Any:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value) + 0.0  # 1 == 1.0 and -0.0 == 0.0 in SQL comparisons
+    return value
+
+
+def request_digest(req: schemas.request.DataRequest, **params: t.Any) -> str:
+    """
+    Hash identifying the results of a filter query. The filters are combined with AND, so their
+    order and repetitions do not matter; neither does the order of the requested fields.
+
+    :param params: other parameters of the query, such as path parameters
+    """
+    filters = {
+        json.dumps({k: _normalise(v) for k, v in f.dict().items()}, sort_keys=True)
+        for f in req.filters
+    }
+    canonical = {
+        "filters": sorted(filters),
+        "fields": sorted(set(req.fields)) if req.fields is not None else None,
+        "limit": req.limit,
+        "params": {k: _normalise(v) for k, v in params.items()},
+    }
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def encode(content: t.Any, response_model: t.Any, exclude_unset: bool = False) -> bytes:
+    """Validate and encode a response as FastAPI would for a route with this response model"""
+    value = parse_obj_as(response_model, content)
+    return JSONResponse(jsonable_encoder(value, by_alias=True, exclude_unset=exclude_unset)).body
+
+
+def cached_response(
+    db: Session,
+    name: str,
+    req: schemas.request.DataRequest,
+    query: t.Callable[[], t.Any],
+    response_model: t.Any,
+    exclude_unset: bool = False,
+    **params: t.Any,
+) -> Response:
+    """
+    Respond to a filter query from `result_cache`, running `query` and encoding its results on a
+    miss.
+
+    :param name: name of the query, distinguishing the results of different routes
+    :param query: runs the query, returning the content of the response
+    :param response_model: response model of the route
+    :param exclude_unset: `response_model_exclude_unset` of the route
+    :param params: other parameters of the query, such as path parameters
+    """
+    key = (
+        database_checksum(db.get_bind()),
+        RESULT_VERSION,
+        name,
+        request_digest(req, **params),
+    )
+    while (body := result_cache.get(key)) is None:
+        body, partial = flights.do(key, _run, key, query, response_model, exclude_unset)
+        if not partial:
+            break
+        # Partial results are only served to the request whose own time budget ran out; requests
+        # that shared the query of a leader with a shorter budget run it again
+        if _partial():
+            headers = {cancellation.PARTIAL_HEADER: "true"}
+            return Response(body, media_type=JSONResponse.media_type, headers=headers)
+    return Response(body, media_type=JSONResponse.media_type)
+
+
+def _partial() -> bool:
+    # Whether the request being served ran out of time while fetching its results
+    return (current := cancellation.current()) is not None and current.partial
+
+
+def _run(
+    key: cache.Key, query: t.Callable[[], t.Any], response_model: t.Any, exclude_unset: bool
+) -> tuple[bytes, bool]:
+    body = encode(query(), response_model, exclude_unset)
+    partial = _partial()
+    if not partial:
+        result_cache.put(key, body)
+    return body, partial
@@ -25,22 +25,37 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
 
 from vipre_data.app import dependencies as deps
-from vipre_data.app import schemas
+from vipre_data.app import coalesce, jobs, results, schemas
+from vipre_data.app.metrics import InstrumentedRoute
+from vipre_data.app.schemas.utils import get_xyz_array
+from vipre_data.computations.entry import b_plane
+from vipre_data.computations.propagate import propagate
+from vipre_data.computations.sun_relative_states_angle import sun_relative_states_angle
 from vipre_data.sql import crud
 
 router = APIRouter(
     prefix="/bodies",
     tags=["bodies"],
+    route_class=InstrumentedRoute,
 )
 
+# Every component of the dashboard asks for the bodies when it loads
+body_flights = coalesce.SingleFlight("bodies")
+
 
 @router.get("/", response_model=list[schemas.response.Body])
 def get_bodies(db: Session = Depends(deps.get_db)):
-    return crud.get_bodies(db)
+    body = body_flights.do(
+        (str(db.get_bind().url), "bodies"),
+        lambda: results.encode(crud.get_bodies(db), list[schemas.response.Body]),
+    )
+    return Response(body, media_type=JSONResponse.media_type)
 
 
 @router.get("/targeted", response_model=list[schemas.response.BodySummary])
@@ -52,7 +67,11 @@ def get_targeted_bodies(db: Session = Depends(deps.get_db)):
     There may be other bodies present in the sequence of flybys that are never present as the
     ultimate destination of a trajectory (e.g. not a target body)
     """
-    return crud.get_targeted_bodies(db)
+    body = body_flights.do(
+        (str(db.get_bind().url), "targeted"),
+        lambda: results.encode(crud.get_targeted_bodies(db), list[schemas.response.BodySummary]),
+    )
+    return Response(body, media_type=JSONResponse.media_type)
 
 
 @router.get("/body/{body_id}", response_model=schemas.response.Body)
@@ -63,6 +82,44 @@ def get_body(body_id: int, db: Session = Depends(deps.get_db)):
     return bodies[0]
 
 
+@router.post("/body/{body_id}/bplane", response_model=schemas.response.BPlane)
+def get_b_plane(
+    body_id: int, req: schemas.request.BPlaneRequest, db: Session = Depends(deps.get_db)
+):
+    """
+    Evaluate the B-plane angle [rad] and magnitude [km] of candidate arrivals at a body, which need
+    not be in the database
+    """
+    bodies = crud.get_bodies(db, body_id=body_id)
+    if len(bodies) == 0:
+        raise HTTPException(404, f"No body was found with the ID: {body_id}")
+    pole = get_xyz_array(bodies, "pole_vec")[0, :, 0]
+    theta, mag = b_plane(np.array(req.v_inf), np.array(req.pos), np.array(req.vel), pole)
+    return {"bvec_theta": theta.tolist(), "bvec_mag": mag.tolist()}
+
+
+@router.post("/body/{body_id}/propagate", response_model=schemas.response.Propagation)
+def propagate_states(
+    body_id: int, req: schemas.request.PropagationRequest, db: Session = Depends(deps.get_db)
+):
+    """Propagate states about a body along their conics to every one of the requested epochs"""
+    bodies = crud.get_bodies(db, body_id=body_id)
+    if len(bodies) == 0:
+        raise HTTPException(404, f"No body was found with the ID: {body_id}")
+    pos_set, vel_set = propagate(
+        r_1=np.array(req.pos)[:, :, None],
+        v_1=np.array(req.vel)[:, :, None],
+        t_1=np.array(req.t_1)[:, None],
+        times=np.array(req.times),
+        mu=bodies[0].mu,
+        vel_flag=req.vel_flag,
+    )
+    return {
+        "pos": pos_set.transpose(1, 2, 0).tolist(),
+        "vel": vel_set.transpose(1, 2, 0).tolist() if vel_set is not None else None,
+    }
+
+
 @router.get("/list", response_model=list[schemas.response.BodySummary])
 def list_bodies(db: Session = Depends(deps.get_db)):
     return crud.get_bodies(db)
@@ -73,3 +130,39 @@ def get_architecture(architecture_sequence: str, db: Session = Depends(deps.get_
     bodies = [
         crud.get_bodies(db, int(body_id.strip())) for body_id in architecture_sequence.split("-")
     ]
+
+
+def solar_angles_job(
+    db: Session, spec: schemas.request.SolarAnglesJobSpec, job: jobs.Job
+) -> dict[str, list]:
+    """
+    Job recomputing the solar phase, conjunction and incidence angles [rad] of every entry at a
+    body from the stored entry states, JOB_CHUNK entries at a time
+    """
+    entry_ids = crud.get_entry_ids(db, body_id=spec.body_id)
+    angles = np.empty((3, len(entry_ids)))
+    for start in range(0, len(entry_ids), JOB_CHUNK):
+        job.report(start / len(entry_ids))
+        entries = crud.get_entries(db, entry_ids[start : start + JOB_CHUNK])
+        entries.sort(key=lambda e: e.id)
+        trajectories = crud.get_trajectories(db, list({e.trajectory_id for e in entries}))
+        v_inf_arr = get_xyz_array([trajectories[e.trajectory_id] for e in entries], "v_inf_arr")
+        angles[:, start : start + len(entries)] = sun_relative_states_angle(
+            # Like the entry position, the sun and earth positions are relative to the target body
+            R_b_s=get_xyz_array(entries, "pos_sun_entry")[..., 0].T,
+            R_b_e=get_xyz_array(entries, "pos_earth_entry")[..., 0].T,
+            R=get_xyz_array(entries, "pos_entry")[..., 0].T,
+            V=v_inf_arr[..., 0].T,
+        )
+    # Entries missing any of the states have no angles
+    values = [[None if np.isnan(a) else float(a) for a in row] for row in angles]
+    return schemas.response.SolarAngles(
+        entry_id=entry_ids,
+        solar_phase_angle=values[0],
+        solar_conj_angle=values[1],
+        solar_incidence_angle=values[2],
+    ).dict()
+
+
+JOB_CHUNK = 500  # entries computed between progress reports of `solar_angles_job`
+jobs.manager.register("solar_angles", solar_angles_job, schemas.request.SolarAnglesJobSpec)
@@ -0,0 +1,106 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import typing as t
+
+from fastapi import APIRouter, HTTPException, Query
+
+from vipre_data.app import memory, schemas, slow_queries
+from vipre_data.app.metrics import InstrumentedRoute
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"],
+    route_class=InstrumentedRoute,
+)
+
+
+@router.get("/slow_queries", response_model=list[schemas.response.SlowQuery])
+def get_slow_queries():
+    """
+    SQL statements slower than VIPRE_DATA_SLOW_QUERY_MS, grouped by shape (their SQL text), with
+    the query plan SQLite chose for them and the tables it scanned without an index.
+    """
+    return slow_queries.log.shapes()
+
+
+@router.delete("/slow_queries", status_code=204)
+def reset_slow_queries():
+    slow_queries.log.reset()
+
+
+@router.get("/memory", response_model=schemas.response.MemoryReport)
+def get_memory():
+    """
+    Resident memory of the worker process serving the request, bytes held by each in-process cache
+    and the state of allocation tracing.
+    """
+    return memory.report()
+
+
+@router.put("/memory/tracing", response_model=schemas.response.MemoryReport)
+def set_memory_tracing(req: schemas.request.TracingRequest):
+    """Start or stop tracing allocations with tracemalloc, which slows the worker down"""
+    memory.set_tracing(req.enabled, req.frames)
+    return memory.report()
+
+
+KeyType = t.Literal["filename", "lineno", "traceback"]
+
+
+@router.get("/memory/top", response_model=list[schemas.response.Allocation])
+def get_top_allocations(limit: int = Query(20, gt=0, le=1000), key_type: KeyType = "lineno"):
+    """The locations holding the most traced memory"""
+    try:
+        return memory.top(limit, key_type)
+    except memory.NotTracing:
+        raise HTTPException(409, "Allocations are not being traced, see /debug/memory/tracing")
+
+
+@router.post("/memory/snapshots", response_model=str)
+def take_memory_snapshot(req: schemas.request.SnapshotRequest):
+    """Snapshot the traced allocations for a later diff, returning the snapshot's name"""
+    try:
+        return memory.take_snapshot(req.name)
+    except memory.NotTracing:
+        raise HTTPException(409, "Allocations are not being traced, see /debug/memory/tracing")
+
+
+@router.get("/memory/diff", response_model=list[schemas.response.Allocation])
+def diff_memory_snapshots(
+    first: str,
+    second: str = memory.NOW,
+    limit: int = Query(20, gt=0, le=1000),
+    key_type: KeyType = "lineno",
+):
+    """The locations whose traced memory grew or shrank the most between two snapshots"""
+    try:
+        return memory.diff(first, second, limit, key_type)
+    except memory.NotTracing:
+        raise HTTPException(409, "Allocations are not being traced, see /debug/memory/tracing")
+    except memory.UnknownSnapshot as e:
+        raise HTTPException(404, f"No snapshot was found with the name: {e.args[0]}")
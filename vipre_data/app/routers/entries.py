@@ -29,20 +29,27 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
 from vipre_data.app import dependencies as deps
-from vipre_data.app import schemas
+from vipre_data.app import cancellation, coalesce, results, schemas
+from vipre_data.app.metrics import InstrumentedRoute
 from vipre_data.sql import crud, models
 
 router = APIRouter(
     prefix="/entries",
     tags=["entries"],
+    route_class=InstrumentedRoute,
 )
 
+entry_flights = coalesce.SingleFlight("entry_details")
+
 
 @router.post("/", response_model=list[schemas.response.Entry], response_model_exclude_unset=False)
 def query_entries(req: schemas.request.EntryRequest, db: Session = Depends(deps.get_db)):
-    query = crud.make_query(db, models.Entry, req.filters, req.fields, req.limit)
-    result = query.all()
-    return result
+    def query():
+        return cancellation.fetch_all(
+            crud.make_query(db, models.Entry, req.filters, req.fields, req.limit)
+        )
+
+    return results.cached_response(db, "entries", req, query, list[schemas.response.Entry])
 
 
 # @router.post(
@@ -61,6 +68,10 @@ def query_entries(req: schemas.request.EntryRequest, db: Session = Depends(deps.
 
 @router.get("/{entry_id}", response_model=schemas.response.EntryFull)
 def get_entry(entry_id: int, db: Session = Depends(deps.get_db)):
+    return entry_flights.do((str(db.get_bind().url), entry_id), _get_entry, db, entry_id)
+
+
+def _get_entry(db: Session, entry_id: int) -> schemas.response.EntryFull:
     result = crud.get_entry(db, entry_id)
     entry = schemas.response.EntryFull.from_orm(result)
     entry.mission_delta_v = result.trajectory.interplanetary_dv + sum(
@@ -33,12 +33,14 @@ from sqlalchemy import inspect
 from sqlalchemy.engine import Engine, reflection
 from sqlalchemy.orm import Session
 
-from vipre_data.app import schemas
+from vipre_data.app import cache, invalidation, schemas
 from vipre_data.app.dependencies import get_db, get_engine
+from vipre_data.app.metrics import InstrumentedRoute
 from vipre_data.sql.models import VERSION as DATABASE_VERSION
 
 router = APIRouter(
     tags=["info"],
+    route_class=InstrumentedRoute,
 )
 
 
@@ -119,3 +121,20 @@ def get_database_connection(engine: Engine = Depends(get_engine)):
 def set_database_connection(uri: str = Body()):
     os.environ["SQLALCHEMY_DATABASE_URI"] = uri
     return uri
+
+
+@router.post("/database/manifest", response_model=list[str])
+def apply_change_manifest(manifest: schemas.request.ChangeManifest) -> list[str]:
+    """
+    Apply a change manifest emitted by an append ingest (`python -m vipre_data.sql.ingest`).
+
+    In-process caches invalidate only the entries affected by the appended rows. Returns the names
+    of the caches that were notified.
+    """
+    return invalidation.apply_manifest(manifest.dict())
+
+
+@router.get("/caches", response_model=list[schemas.response.CacheStats])
+def get_cache_stats():
+    """Report size, hit and miss counts for every in-process cache"""
+    return [c.stats() for c in cache.caches.values()]
@@ -0,0 +1,97 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from fastapi import APIRouter, HTTPException
+from pydantic import ValidationError
+
+from vipre_data.app import jobs, schemas
+from vipre_data.app.metrics import InstrumentedRoute
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    route_class=InstrumentedRoute,
+)
+
+
+def _get_job(job_id: str) -> jobs.Job:
+    job = jobs.manager.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"No job was found with the ID: {job_id}")
+    return job
+
+
+@router.post("/", response_model=schemas.response.JobInfo, status_code=202)
+def submit_job(req: schemas.request.JobRequest):
+    """
+    Queue a long-running computation and return its job, whose progress can be followed at
+    `/jobs/{job_id}`. See `/jobs/kinds` for the available kinds of job.
+    """
+    if req.kind not in jobs.manager.kinds:
+        raise HTTPException(
+            422, f"Unknown job kind {req.kind!r}, expected one of {jobs.manager.kinds}"
+        )
+    try:
+        spec = jobs.manager.spec_model(req.kind).parse_obj(req.spec)
+    except ValidationError as e:
+        raise HTTPException(422, e.errors())
+    try:
+        return jobs.manager.submit(req.kind, spec).info()
+    except jobs.QueueFull as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "10"})
+
+
+@router.get("/", response_model=list[schemas.response.JobInfo])
+def list_jobs():
+    return [job.info() for job in jobs.manager.list()]
+
+
+@router.get("/kinds", response_model=dict[str, dict])
+def list_job_kinds():
+    """JSON schema of the spec of each kind of job"""
+    return {kind: jobs.manager.spec_model(kind).schema() for kind in jobs.manager.kinds}
+
+
+@router.get("/{job_id}", response_model=schemas.response.JobInfo)
+def get_job(job_id: str):
+    return _get_job(job_id).info()
+
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str):
+    """The result of a job, once it has succeeded; results expire some time after that"""
+    job = _get_job(job_id)
+    if job.status != jobs.SUCCEEDED:
+        raise HTTPException(409, f"Job {job_id} has no result, its status is {job.status!r}")
+    return job.result
+
+
+@router.delete("/{job_id}", response_model=schemas.response.JobInfo)
+def cancel_job(job_id: str):
+    """Cancel a queued or running job; finished jobs are left unchanged"""
+    _get_job(job_id)
+    return jobs.manager.cancel(job_id).info()
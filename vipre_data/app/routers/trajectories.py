@@ -29,12 +29,14 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
 from vipre_data.app import dependencies as deps
-from vipre_data.app import schemas
+from vipre_data.app import cancellation, results, schemas
+from vipre_data.app.metrics import InstrumentedRoute
 from vipre_data.sql import crud, models
 
 router = APIRouter(
     prefix="/trajectories",
     tags=["trajectories"],
+    route_class=InstrumentedRoute,
 )
 
 
@@ -42,9 +44,14 @@ router = APIRouter(
     "/", response_model=list[schemas.response.Trajectory], response_model_exclude_unset=True
 )
 def get_trajectories(req: schemas.request.TrajectoryRequest, db: Session = Depends(deps.get_db)):
-    query = crud.make_query(db, models.Trajectory, req.filters, req.fields, req.limit)
-    result = query.all()
-    return result
+    def query():
+        return cancellation.fetch_all(
+            crud.make_query(db, models.Trajectory, req.filters, req.fields, req.limit)
+        )
+
+    return results.cached_response(
+        db, "trajectories", req, query, list[schemas.response.Trajectory], exclude_unset=True
+    )
 
 
 @router.get("/{trajectory_id}", response_model=schemas.response.TrajectoryFull)
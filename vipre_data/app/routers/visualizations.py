@@ -25,23 +25,52 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
+from collections import defaultdict
+from functools import partial
+from typing import Any, Callable, Optional, Union
+
 import numpy as np
-from fastapi import APIRouter, Depends
+from anyio import from_thread
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+from vipre_data.app import cache, coalesce, compute, invalidation, jobs, results
 from vipre_data.app import dependencies as deps
 from vipre_data.app import schemas
-from vipre_data.app.schemas.utils import get_xyz_tuple, make_lat_long
+from vipre_data.app.metrics import InstrumentedRoute, profiled
+from vipre_data.app.schemas.utils import get_xyz_array, make_arc_arrays, make_lat_long
+from vipre_data.computations import arcs
+from vipre_data.computations.body_fixed import BodyRotation, inertial_to_body_fixed
 from vipre_data.computations.cart2sph import cart2sph
-from vipre_data.computations.conic_1point import conic_1point
-from vipre_data.computations.conic_2point import conic_2point
+from vipre_data.computations.propagate import propagate
 from vipre_data.sql import crud, models
+from vipre_data.sql.manifest import database_checksum
 
 router = APIRouter(
     prefix="/visualizations",
     tags=["visualizations"],
+    route_class=InstrumentedRoute,
 )
 
+# Computed (probe, carrier) arcs keyed by
+#   (db checksum, ARC_VERSION, entry_id, probe_ta_step, carrier_ta_step, sampling, frame)
+# ARC_VERSION must be incremented whenever the arc computation changes so that arcs persisted in the
+# on-disk cache by an older version are not served
+ARC_VERSION = 2
+arc_cache = cache.from_env("entry_arcs", "VIPRE_DATA_ARC_CACHE", default_bytes=64 * 2**20)
+
+
+def _rebase_arc_cache(manifest: dict) -> None:
+    # Appends never modify existing entries, so their arcs remain valid for the new database
+    arc_cache.rename_namespace(manifest["checksum_before"], manifest["checksum_after"])
+
+
+invalidation.subscribe(arc_cache.name, _rebase_arc_cache)
+arc_flights = coalesce.SingleFlight("entry_arcs")
+
 
 @router.post(
     "/trajectory_selection/{target_body_id}",
@@ -50,92 +79,355 @@ router = APIRouter(
 def trajectory_selection(
     target_body_id: int, req: schemas.request.TrajectoryRequest, db: Session = Depends(deps.get_db)
 ):
-    result = crud.get_body_trajectories(db, target_body_id, filters=req.filters, limit=req.limit)
-    return result
+    def query():
+        return crud.get_body_trajectories(db, target_body_id, filters=req.filters, limit=req.limit)
+
+    return results.cached_response(
+        db,
+        "trajectory_selection",
+        req,
+        query,
+        list[schemas.response.Trajectory],
+        target_body_id=target_body_id,
+    )
+
+
+def _load_arc_states(
+    db: Session, entry_ids: list[int]
+) -> list[tuple[list[int], models.Body, dict]]:
+    """
+    Fetch the states the arcs of the given entries are computed from, as plain arrays batched by
+    target body (the conic kernels take a single gravity parameter)
+    """
+    entries = {e.id: e for e in crud.get_entries(db, entry_ids)}
+    maneuvers = crud.get_divert_maneuvers(db, entry_ids)
+    final_datarates = crud.get_final_datarates(db, entry_ids)
+
+    missing = [
+        i for i in entry_ids if not (i in entries and i in maneuvers and i in final_datarates)
+    ]
+    if missing:
+        raise HTTPException(404, f"No entry arc data was found for the entry IDs: {missing}")
+
+    bodies: dict[int, models.Body] = {}
+    batches: dict[int, list[int]] = defaultdict(list)
+    for entry_id in entry_ids:
+        body = entries[entry_id].target_body
+        bodies[body.id] = body
+        batches[body.id].append(entry_id)
+
+    states = []
+    for body_id, batch in batches.items():
+        batch_entries = [entries[i] for i in batch]
+        batch_maneuvers = [maneuvers[i] for i in batch]
+        arrays = {
+            name: get_xyz_array(batch_maneuvers, name)
+            for name in ("pos_man", "vel_man", "dv_maneuver")
+        }
+        arrays.update(
+            pos_entry=get_xyz_array(batch_entries, "pos_entry"),
+            vel_entry=get_xyz_array(batch_entries, "vel_entry"),
+            time_man=np.array([[m.time_man] for m in batch_maneuvers], dtype=float),
+            t_entry=np.array([[e.t_entry] for e in batch_entries], dtype=float),
+            final_time=np.array(
+                [[final_datarates[i].time + entries[i].t_entry] for i in batch], dtype=float
+            ),
+        )
+        states.append((batch, bodies[body_id], arrays))
+    return states
+
 
+def _body_rotation(body: models.Body, frame: str) -> Optional[BodyRotation]:
+    if frame == "inertial":
+        return None
+    return BodyRotation(get_xyz_array([body], "pole_vec")[0, :, 0], body.period)
 
-def get_carrier_arc(maneuver: models.Maneuver, ta_step: int, final_time: int):
-    # TODO: Implement via conic_1point
-    # Carrier velocity vector is sum of instantaneous velocity vector and delta_v of maneuver
-    velocity_vector = get_xyz_tuple(maneuver, "vel_man")
-    maneuver_dv = get_xyz_tuple(maneuver, "dv_maneuver")
-    velocity_vector += maneuver_dv
-    params = dict(
-        r_1=get_xyz_tuple(maneuver, "pos_man"),
-        v_1=velocity_vector,  # add dv_man to this v_1
-        t_1=np.array([[maneuver.time_man]]),
-        mu=maneuver.entry.target_body.mu,
-        ta_step=ta_step,  # Just needs to be high enough for a smooth arc
-        rev_check=0,  # Likely not ever changed by user
-        time_flag=1,  # Likely not ever changed by user
+
+def _lookup_entry_arcs(
+    db: Session, keys: dict[int, tuple]
+) -> tuple[dict[int, Optional[tuple]], list[tuple[list[int], models.Body, dict]]]:
+    # Blocking half of `compute_entry_arcs`: cached arcs and the states of the missing ones
+    cached = {i: arc_cache.get(key) for i, key in keys.items()}
+    pending = [i for i, arc in cached.items() if arc is None]
+    return cached, _load_arc_states(db, pending) if pending else []
+
+
+# Converts the (height, latitude, longitude) arrays of an arc to its representation in a response
+ArcEncoder = Callable[[np.ndarray, np.ndarray, np.ndarray], Any]
+
+
+def _arc_encoder(req: schemas.request.ArcFormatRequest) -> ArcEncoder:
+    if req.format == "points":
+        return make_lat_long
+    return partial(make_arc_arrays, precision=req.precision, delta=req.delta, encoding=req.encoding)
+
+
+def _arc_response(req: schemas.request.ArcFormatRequest, content: Any) -> Any:
+    # Array responses are already in their final form; returning them as a response skips
+    # validating every sample against the response model
+    return JSONResponse(content) if req.format == "arrays" else content
+
+
+def _finish_entry_arcs(
+    keys: dict[int, tuple], cached: dict, computed: dict, encode: ArcEncoder = make_lat_long
+) -> list[dict]:
+    for entry_id, arc in computed.items():
+        arc_cache.put(keys[entry_id], arc)
+    found = {**cached, **computed}
+    return [
+        {
+            "entry_id": entry_id,
+            "carrier": encode(*found[entry_id][1]),
+            "probe": encode(*found[entry_id][0]),
+        }
+        for entry_id in keys
+    ]
+
+
+async def compute_entry_arcs(
+    db: Session,
+    entry_ids: list[int],
+    probe_ta_step: int,
+    carrier_ta_step: int,
+    sampling: str = "uniform",
+    request: Optional[Request] = None,
+    frame: str = "inertial",
+    encode: ArcEncoder = make_lat_long,
+) -> list[dict]:
+    """
+    Compute the probe and carrier arcs for many entries at once, in the inertial frame or, with
+    `frame="body_fixed"`, as ground tracks in the rotating frame of the target body. Each arc is
+    returned as encoded by `encode`.
+
+    Arcs only depend on immutable database rows and the sampling resolution, so they are served
+    from `arc_cache` when possible. The remaining entries, divert maneuvers and final datarates are
+    each fetched with a single query and the conic kernels are run once over the stacked states of
+    all entries sharing a target body, in the compute pool (see `vipre_data.app.compute`). Database
+    and cache access run in the thread pool so that the event loop is never blocked.
+    """
+    entry_ids = list(dict.fromkeys(entry_ids))  # Drop duplicates, preserving request order
+    checksum = await run_in_threadpool(profiled(database_checksum), db.get_bind())
+    keys = {
+        i: (checksum, ARC_VERSION, i, probe_ta_step, carrier_ta_step, sampling, frame)
+        for i in entry_ids
+    }
+
+    cached, batches = await run_in_threadpool(profiled(_lookup_entry_arcs), db, keys)
+    results = await asyncio.gather(
+        *(
+            compute.run(
+                arcs.entry_arcs,
+                states,
+                body.mu,
+                probe_ta_step,
+                carrier_ta_step,
+                sampling,
+                _body_rotation(body, frame),
+                request=request,
+            )
+            for _, body, states in batches
+        )
     )
-    pos_set, vel_set, time_set = conic_1point(**params)
-    # pos_set: [ [[ x1, x2, ... ]], [[ y1, y2, ... ]], [[ z1, z2, ... ]] ]
-    # vel_set: same...
-    # time_set: [ [[ t1, t2, ... ]] ]
-
-    # Identify last valid entry in time_set (all tuples up to final_time)
-    final_idx = 0
-    for i, time in enumerate(time_set.flatten()):
-        if time >= final_time:
-            final_idx = i
-            break
-
-    # slice each component (x,y,z) up to final_idx
-    pos_set = pos_set[:, :, :final_idx]
-    height, lat, long = cart2sph(*pos_set)
-
-    return height, lat, long
-
-
-def get_probe_arc(entry: models.Entry, maneuver: models.Maneuver, ta_step: int):
-    params = dict(
-        r_1=get_xyz_tuple(maneuver, "pos_man"),
-        r_2=get_xyz_tuple(entry, "pos_entry"),
-        v_1=get_xyz_tuple(maneuver, "vel_man"),
-        v_2=get_xyz_tuple(entry, "vel_entry"),
-        t_1=np.array([[maneuver.time_man]]),
-        t_2=np.array([[entry.t_entry]]),
-        mu=entry.target_body.mu,
-        ta_step=ta_step,  # Just needs to be high enough for a smooth arc
-        rev_check=0,  # Likely not ever changed by user
-        time_flag=0,  # Likely not ever changed by user
+    computed = {}
+    for (batch, _, _), arrays in zip(batches, results):
+        probe, carrier = zip(*arrays[:3]), zip(*arrays[3:])
+        computed.update(zip(batch, zip(probe, carrier)))
+
+    return await run_in_threadpool(profiled(_finish_entry_arcs), keys, cached, computed, encode)
+
+
+def entry_arcs_job(
+    db: Session, spec: schemas.request.EntryArcsJobSpec, job: jobs.Job
+) -> list[dict]:
+    """
+    Job computing the arcs of every entry of a trajectory, JOB_CHUNK entries at a time so that it
+    reports its progress and can be cancelled between chunks. Arcs are returned in the format of
+    the spec, as by `/get_entry_arcs`.
+    """
+    entry_ids = crud.get_entry_ids(db, trajectory_id=spec.trajectory_id)
+    if not entry_ids:
+        raise HTTPException(404, f"No entries were found for trajectory: {spec.trajectory_id}")
+    checksum = database_checksum(db.get_bind())
+    encode = _arc_encoder(spec)
+
+    results = []
+    for start in range(0, len(entry_ids), JOB_CHUNK):
+        job.report(start / len(entry_ids))
+        keys = {
+            i: (
+                checksum,
+                ARC_VERSION,
+                i,
+                spec.probe_ta_step,
+                spec.carrier_ta_step,
+                spec.sampling,
+                "inertial",
+            )
+            for i in entry_ids[start : start + JOB_CHUNK]
+        }
+        cached, batches = _lookup_entry_arcs(db, keys)
+        computed = {}
+        for batch, body, states in batches:
+            arrays = compute.run_sync(
+                arcs.entry_arcs,
+                states,
+                body.mu,
+                spec.probe_ta_step,
+                spec.carrier_ta_step,
+                spec.sampling,
+            )
+            probe, carrier = zip(*arrays[:3]), zip(*arrays[3:])
+            computed.update(zip(batch, zip(probe, carrier)))
+        results.extend(_finish_entry_arcs(keys, cached, computed, encode))
+    return results
+
+
+JOB_CHUNK = 200  # entries computed between progress reports of `entry_arcs_job`
+jobs.manager.register("entry_arcs", entry_arcs_job, schemas.request.EntryArcsJobSpec)
+
+
+def _coalesced_entry_arcs(
+    db: Session,
+    entry_ids: list[int],
+    req: schemas.request.EntryArcRequest,
+    request: Request,
+    frame: str,
+) -> list[dict]:
+    # Blocking `compute_entry_arcs`, shared by identical requests arriving together
+    key = (str(db.get_bind().url), tuple(entry_ids), frame, req.json(exclude={"entry_ids"}))
+    return arc_flights.do(
+        key,
+        from_thread.run,
+        compute_entry_arcs,
+        db,
+        entry_ids,
+        req.probe_ta_step,
+        req.carrier_ta_step,
+        req.sampling,
+        request,
+        frame,
+        _arc_encoder(req),
     )
-    pos_set, vel_set, time_set = conic_2point(**params)
 
-    height, lat, long = cart2sph(*pos_set)
-    return height, lat, long
+
+# The arc endpoints are synchronous so that validating and serializing their large responses
+# happens in the thread pool rather than blocking the event loop; they hand the computation
+# itself back to the event loop, which waits on the compute pool
 
 
-@router.post("/get_entry_arc/{entry_id}", response_model=schemas.response.TrajectoryArcs)
+@router.post(
+    "/get_entry_arc/{entry_id}",
+    response_model=Union[schemas.response.TrajectoryArcs, schemas.response.TrajectoryArcArrays],
+)
 def get_trajectory_arc(
-    entry_id: int, req: schemas.request.EntryArcRequest, db: Session = Depends(deps.get_db)
+    entry_id: int,
+    req: schemas.request.EntryArcRequest,
+    request: Request,
+    db: Session = Depends(deps.get_db),
+):
+    result = _coalesced_entry_arcs(db, [entry_id], req, request, "inertial")
+    return _arc_response(req, {"carrier": result[0]["carrier"], "probe": result[0]["probe"]})
+
+
+@router.post(
+    "/get_entry_arcs",
+    response_model=Union[list[schemas.response.EntryArcs], list[schemas.response.EntryArcArrays]],
+)
+def get_trajectory_arcs(
+    req: schemas.request.EntryArcsRequest, request: Request, db: Session = Depends(deps.get_db)
 ):
-    # Fetch required
-    entry: models.Entry = db.query(models.Entry).where(models.Entry.id == entry_id).first()
-    maneuver: models.Maneuver = (
-        db.query(models.Maneuver)
-        .where(models.Maneuver.entry_id == entry.id)
-        .where(models.Maneuver.maneuver_type == "divert")
-        .first()
+    """
+    Compute the probe and carrier arcs for a list of entries in a single request.
+
+    Equivalent to calling `/get_entry_arc/{entry_id}` for each entry, but the database lookups and
+    conic computations are batched across all requested entries.
+    """
+    result = _coalesced_entry_arcs(db, req.entry_ids, req, request, "inertial")
+    return _arc_response(req, result)
+
+
+@router.post(
+    "/get_ground_tracks",
+    response_model=Union[list[schemas.response.EntryArcs], list[schemas.response.EntryArcArrays]],
+)
+def get_ground_tracks(
+    req: schemas.request.EntryArcsRequest, request: Request, db: Session = Depends(deps.get_db)
+):
+    """
+    Compute the probe and carrier arcs of a list of entries as ground tracks: latitude, longitude
+    and height of each sample in the frame rotating with the target body (see
+    `vipre_data.computations.body_fixed`).
+    """
+    result = _coalesced_entry_arcs(db, req.entry_ids, req, request, "body_fixed")
+    return _arc_response(req, result)
+
+
+@router.post(
+    "/get_entry_positions/{entry_id}",
+    response_model=Union[schemas.response.EntryPositions, schemas.response.EntryPositionArrays],
+)
+def get_entry_positions(
+    entry_id: int, req: schemas.request.EntryPositionsRequest, db: Session = Depends(deps.get_db)
+):
+    """
+    Positions of the probe and carrier of an entry at the requested times, on the conics they
+    follow after the divert maneuver, e.g. to animate them along the datarate timeline. The probe
+    positions are only meaningful up to the time of entry.
+    """
+    [(_, body, states)] = _load_arc_states(db, [entry_id])
+    pos_set, _ = propagate(
+        r_1=np.concatenate([states["pos_man"]] * 2),
+        # The carrier follows the maneuver's delta v, the probe does not
+        v_1=np.concatenate([states["vel_man"], states["vel_man"] + states["dv_maneuver"]]),
+        t_1=np.concatenate([states["time_man"]] * 2),
+        times=np.array(req.times),
+        mu=body.mu,
+        vel_flag=0,
     )
-    final_datarate: models.Datarate = (
-        db.query(models.Datarate)
-        .where(models.Datarate.entry_id == entry.id)
-        .order_by(models.Datarate.order.desc())
-        .first()
+    rotation = _body_rotation(body, req.frame)
+    if rotation is not None:
+        times = np.broadcast_to(np.array(req.times), pos_set.shape[1:])
+        pos_set = inertial_to_body_fixed(pos_set, times, rotation)
+    (probe, carrier) = zip(*cart2sph(*pos_set))
+    encode = _arc_encoder(req)
+    return _arc_response(
+        req, {"times": req.times, "probe": encode(*probe), "carrier": encode(*carrier)}
     )
-    final_time = final_datarate.time + entry.t_entry
 
-    # Generate arc for probe trajectory
-    height, lat, long = get_probe_arc(entry, maneuver, req.probe_ta_step)
-    probe_lat_long = make_lat_long(height, lat, long)
 
-    # Generate arc for carrier trajectory
-    height, lat, long = get_carrier_arc(maneuver, req.carrier_ta_step, final_time)
-    carrier_lat_long = make_lat_long(height, lat, long)
+@router.post("/get_flyby_arcs/{trajectory_id}", response_model=schemas.response.FlybyArcs)
+def get_flyby_arcs(
+    trajectory_id: int, req: schemas.request.FlybyArcsRequest, db: Session = Depends(deps.get_db)
+):
+    """
+    Sample the planetocentric hyperbolas of every flyby of a trajectory, in a single computation
+    over all of its flybys.
+    """
+    if crud.get_trajectory(db, trajectory_id) is None:
+        raise HTTPException(404, f"No trajectory was found with the ID: {trajectory_id}")
+    flybys = crud.get_trajectory_flybys(db, trajectory_id)
+    result = {
+        "flyby_id": [f.id for f in flybys],
+        "body_id": [f.body_id for f in flybys],
+        "t_flyby": [f.t_flyby for f in flybys],
+        "height": [],
+        "latitude": [],
+        "longitude": [],
+    }
+    if not flybys:
+        return result
 
-    return {"carrier": carrier_lat_long, "probe": probe_lat_long}
+    radius = np.array([[f.flyby_body.radius] for f in flybys], dtype=float)
+    height, lat, long = arcs.flyby_arcs(
+        v_inf_in=get_xyz_array(flybys, "v_inf_in")[:, :, 0],
+        v_inf_out=get_xyz_array(flybys, "v_inf_out")[:, :, 0],
+        r_p=radius + np.array([[f.altitude] for f in flybys], dtype=float),
+        mu=np.array([[f.flyby_body.mu] for f in flybys], dtype=float),
+        r_max=radius * req.extent,
+        ta_step=req.ta_step,
+    )
+    result.update(height=height.tolist(), latitude=lat.tolist(), longitude=long.tolist())
+    return result
 
 
 @router.post("/plot_entry")
@@ -27,9 +27,9 @@
 
 import typing as t
 
-from pydantic import BaseModel, conint
+from pydantic import BaseModel, confloat, conint, conlist, constr, validator
 
-from .utils import FilterCategory, number
+from .utils import ArcEncoding, ArcPrecision, FilterCategory, number
 
 
 class FilterRequest(BaseModel):
@@ -99,6 +99,111 @@ class EntryRequest(DataRequest):
         }
 
 
-class EntryArcRequest(BaseModel):
+class ArcFormatRequest(BaseModel):
+    # "arrays" returns each arc as parallel height/latitude/longitude arrays (see ArcArrays) rather
+    # than as a list of points; the other options only apply to "arrays"
+    format: t.Literal["points", "arrays"] = "points"
+    precision: ArcPrecision = "float64"
+    delta: bool = False
+    encoding: ArcEncoding = "json"
+
+
+class EntryArcRequest(ArcFormatRequest):
     probe_ta_step: conint(ge=15, le=100) = 25
     carrier_ta_step: conint(ge=15, le=5000) = 500
+    # "adaptive" places at most *_ta_step points by curvature rather than evenly in true anomaly
+    sampling: t.Literal["uniform", "adaptive"] = "uniform"
+
+
+class EntryArcsRequest(EntryArcRequest):
+    entry_ids: conlist(int, min_items=1, max_items=500)
+
+
+class FlybyArcsRequest(BaseModel):
+    ta_step: conint(ge=15, le=5000) = 200
+    # Radius at which the hyperbolas start and end, in radii of the flyby body
+    extent: confloat(gt=1, le=1000) = 10.0
+
+
+Vectors = conlist(conlist(float, min_items=3, max_items=3), min_items=1, max_items=100000)
+
+
+class BPlaneRequest(BaseModel):
+    # Nx3 arrival v-infinity vectors and body relative states, in the frame of the body's pole
+    v_inf: Vectors
+    pos: Vectors
+    vel: Vectors
+
+    @validator("pos", "vel")
+    def check_length(cls, v, values):
+        if "v_inf" in values and len(v) != len(values["v_inf"]):
+            raise ValueError("must have as many vectors as v_inf")
+        return v
+
+
+Epochs = conlist(float, min_items=1, max_items=10000)  # seconds past J2000
+
+
+class PropagationRequest(BaseModel):
+    # Nx3 body relative states at the N times t_1, propagated to every one of the epochs in `times`
+    pos: Vectors
+    vel: Vectors
+    t_1: conlist(float, min_items=1, max_items=100000)
+    times: Epochs
+    vel_flag: bool = True
+
+    @validator("vel", "t_1")
+    def check_length(cls, v, values):
+        if "pos" in values and len(v) != len(values["pos"]):
+            raise ValueError("must have as many items as pos")
+        return v
+
+
+class EntryPositionsRequest(ArcFormatRequest):
+    times: Epochs
+    # "body_fixed" gives positions in the frame rotating with the target body
+    frame: t.Literal["inertial", "body_fixed"] = "inertial"
+
+
+class TracingRequest(BaseModel):
+    enabled: bool
+    # Frames of each allocation's traceback that are kept
+    frames: conint(ge=1, le=100) = 1
+
+
+class SnapshotRequest(BaseModel):
+    name: t.Optional[constr(min_length=1, max_length=100)]
+
+
+class JobRequest(BaseModel):
+    kind: str
+    # Validated against the spec model registered for `kind` (see `vipre_data.app.jobs`)
+    spec: dict = {}
+
+    class Config:
+        schema_extra = {"example": {"kind": "entry_arcs", "spec": {"trajectory_id": 1}}}
+
+
+class EntryArcsJobSpec(EntryArcRequest):
+    trajectory_id: int
+
+
+class SolarAnglesJobSpec(BaseModel):
+    body_id: int
+
+
+class TableChange(BaseModel):
+    inserted: int
+    first_id: t.Optional[int]
+    last_id: t.Optional[int]
+
+
+class ChangeManifest(BaseModel):
+    version: int
+    created: str
+    database: str
+    source: str
+    checksum_before: str
+    checksum_after: str
+    tables: dict[str, TableChange]
+    body_ids: list[int]
@@ -31,7 +31,7 @@ import numpy as np
 from pydantic import BaseModel, root_validator, validator
 from sqlalchemy.orm import Query
 
-from .utils import Filter, LatLongH
+from .utils import ArcArrays, Coord, Filter, LatLongH
 
 
 def calculate_magnitudes(cls, values: dict) -> dict:
@@ -94,11 +94,117 @@ class DbInfo(BaseModel):
     schema_version: str
 
 
+class CacheStats(BaseModel):
+    name: str
+    entries: int
+    nbytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+    disk_hits: int
+    evictions: int
+    disk_nbytes: t.Optional[int]
+
+
+class MemoryReport(BaseModel):
+    pid: int
+    rss: t.Optional[int]
+    peak_rss: t.Optional[int]
+    caches: list[CacheStats]
+    cache_bytes: int
+    cache_budget: t.Optional[int]
+    tracing: bool
+    traced_bytes: int
+    traced_peak_bytes: int
+    snapshots: list[str]
+
+
+class Allocation(BaseModel):
+    location: str
+    size: int
+    count: int
+    size_diff: t.Optional[int]
+    count_diff: t.Optional[int]
+
+
+class SlowQuery(BaseModel):
+    statement: str
+    where: t.Optional[str]
+    count: int
+    total_seconds: float
+    max_seconds: float
+    routes: list[str]
+    parameters: t.Any
+    last_seen: float
+    plan: t.Optional[list[str]]
+    full_scans: list[str]
+
+
+class BPlane(BaseModel):
+    bvec_theta: list[float]
+    bvec_mag: list[float]
+
+
+class Propagation(BaseModel):
+    # NxKx3 positions [km] and velocities [km/s] of the N states at the K epochs
+    pos: list[list[Coord]]
+    vel: t.Optional[list[list[Coord]]]
+
+
+class JobInfo(BaseModel):
+    id: str
+    kind: str
+    status: t.Literal["queued", "running", "succeeded", "failed", "cancelled"]
+    progress: float
+    error: t.Optional[str]
+    created: float
+    started: t.Optional[float]
+    finished: t.Optional[float]
+
+
+class SolarAngles(BaseModel):
+    entry_id: list[int]
+    solar_phase_angle: list[t.Optional[float]]
+    solar_conj_angle: list[t.Optional[float]]
+    solar_incidence_angle: list[t.Optional[float]]
+
+
 class TrajectoryArcs(BaseModel):
     carrier: list[LatLongH]
     probe: list[LatLongH]
 
 
+class EntryArcs(TrajectoryArcs):
+    entry_id: int
+
+
+class EntryPositions(TrajectoryArcs):
+    times: list[float]
+
+
+class TrajectoryArcArrays(BaseModel):
+    carrier: ArcArrays
+    probe: ArcArrays
+
+
+class EntryArcArrays(TrajectoryArcArrays):
+    entry_id: int
+
+
+class EntryPositionArrays(TrajectoryArcArrays):
+    times: list[float]
+
+
+class FlybyArcs(BaseModel):
+    # One item per flyby, in flyby order; the arcs are relative to the flyby body
+    flyby_id: list[int]
+    body_id: list[int]
+    t_flyby: list[float]
+    height: list[list[float]]
+    latitude: list[list[float]]
+    longitude: list[list[float]]
+
+
 class BodySummary(DbModelBase):
     name: t.Optional[str]
 
@@ -25,6 +25,7 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import base64
 import typing as t
 from enum import Enum
 
@@ -87,6 +88,21 @@ class LatLongH(LatLong):
     height: float
 
 
+ArcPrecision = t.Literal["float64", "float32"]
+ArcEncoding = t.Literal["json", "base64"]
+
+
+class ArcArrays(BaseModel):
+    """An arc as parallel arrays of its samples, see make_arc_arrays"""
+
+    precision: ArcPrecision
+    delta: bool
+    encoding: ArcEncoding
+    height: t.Union[list[float], str]
+    latitude: t.Union[list[float], str]
+    longitude: t.Union[list[float], str]
+
+
 Coord = tuple[float, float, float]
 
 
@@ -120,15 +136,72 @@ def get_xyz_tuple(obj: object, field_name: str) -> np.ndarray:
     return np.array([[[getattr(obj, f"{field_name}_{i}")] for i in "xyz"]])
 
 
-def make_lat_long(height: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> list[LatLongH]:
+def get_xyz_array(objs: t.Sequence[object], field_name: str) -> np.ndarray:
+    """
+    Stack the x, y, z components of many objects into a single array.
+    Each object is expected to have attributes with "<field_name>_{x,y,z}".
+
+    :param objs: python objects with fields mapping to xyz coordinates ("_x", "_y", "_z")
+    :param field_name: prefix of the fields with xzy coordinates
+    :return: numpy array of shape (N,3,1)
+    """
+    return np.array(
+        [[[getattr(obj, f"{field_name}_{i}")] for i in "xyz"] for obj in objs], dtype=float
+    ).reshape(len(objs), 3, 1)
+
+
+def make_lat_long(height: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> list[dict]:
+    """
+    Convert the outputs of cart2sph for a single arc to a list of LatLongH points.
+
+    :param height: radius of each sample [km]
+    :param lat: latitude of each sample [deg]
+    :param lon: longitude of each sample [deg]
+    :return: dicts with the fields of LatLongH, one per sample
     """
+    columns = (np.ravel(height).tolist(), np.ravel(lat).tolist(), np.ravel(lon).tolist())
+    return [{"height": h, "latitude": a, "longitude": o} for h, a, o in zip(*columns)]
 
-    :param lat:
-    :param lon:
-    :param height:
 
-    :return:
+def encode_array(
+    values: np.ndarray, precision: str = "float64", delta: bool = False, encoding: str = "json"
+) -> t.Union[list[float], str]:
+    """
+    Encode one array of an arc for an array-native response (see ArcArrays).
+
+    :param values: 1D array
+    :param precision: "float64" or "float32"; float32 halves the size of base64 encoded arrays
+    :param delta: store the first value followed by the differences between consecutive values,
+        which are smaller and compress better; the values are recovered by a cumulative sum in
+        float64
+    :param encoding: "json" for a list of numbers, or "base64" for the little-endian bytes of the
+        array in the requested precision
+    """
+    values = np.ravel(values)
+    if delta:  # rounding the differences rather than the values keeps their relative precision
+        values = np.diff(values, prepend=0.0)
+    values = values.astype(precision)
+    if encoding == "base64":
+        return base64.b64encode(values.astype(values.dtype.newbyteorder("<")).tobytes()).decode()
+    return values.tolist()
+
+
+def make_arc_arrays(
+    height: np.ndarray,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    precision: str = "float64",
+    delta: bool = False,
+    encoding: str = "json",
+) -> dict:
+    """
+    Convert the outputs of cart2sph for a single arc to the parallel arrays of ArcArrays, without
+    creating an object per sample.
     """
-    fields = ["height", "latitude", "longitude"]
-    points = np.array([height, lat, lon]).T.reshape(-1, 3)
-    return [LatLongH(**{k: v for k, v in zip(fields, point)}) for point in points]
+    options = {"precision": precision, "delta": delta, "encoding": encoding}
+    return {
+        **options,
+        "height": encode_array(height, **options),
+        "latitude": encode_array(lat, **options),
+        "longitude": encode_array(lon, **options),
+    }
@@ -0,0 +1,235 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Log of the SQL statements that take longer than a threshold, with their query plans
+
+Statements are grouped by shape, their SQL text with bound parameters as placeholders, which for
+the filter queries is one shape per combination of filtered fields. The first time a shape is slow,
+a background thread runs `EXPLAIN QUERY PLAN` on it with the parameters it was slow with, so that
+tables scanned without an index stand out (see `Shape.full_scans`). Every slow statement is also
+written as a JSON line to a rotating log file, when one is configured.
+
+Configured by VIPRE_DATA_SLOW_QUERY_MS (default 100, 0 disables the log),
+VIPRE_DATA_SLOW_QUERY_LOG (path of the log file, unset by default) and
+VIPRE_DATA_SLOW_QUERY_LOG_BYTES (size at which the log file is rotated, default 10 MB).
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from vipre_data.app import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_SHAPES = 1000  # least recently slow shapes are dropped past this
+MAX_PENDING = 1000  # slow statements waiting to be explained and logged
+LOG_BACKUPS = 5
+
+
+class Shape:
+    """Statistics of the slow statements sharing the same SQL text"""
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        match = re.search(
+            r"\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)", statement, re.S
+        )
+        self.where = " ".join(match.group(1).split()) if match else None
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.routes: set[str] = set()
+        self.parameters: t.Any = None  # of the slowest statement
+        self.last_seen = 0.0
+        self.plan: t.Optional[list[str]] = None
+
+    @property
+    def full_scans(self) -> list[str]:
+        """Tables scanned without an index, according to the query plan"""
+        return [
+            match.group(1)
+            for detail in self.plan or []
+            if (match := re.match(r"SCAN (?:TABLE )?(\w+)", detail)) and "USING" not in detail
+        ]
+
+    def info(self) -> dict:
+        return {
+            "statement": self.statement,
+            "where": self.where,
+            "count": self.count,
+            "total_seconds": self.total_seconds,
+            "max_seconds": self.max_seconds,
+            "routes": sorted(self.routes),
+            "parameters": _jsonable(self.parameters),
+            "last_seen": self.last_seen,
+            "plan": self.plan,
+            "full_scans": self.full_scans,
+        }
+
+
+def _jsonable(parameters: t.Any) -> t.Any:
+    return json.loads(json.dumps(parameters, default=str))
+
+
+def _normalize(statement: str) -> str:
+    # One shape for every length of "IN (?, ?, ...)" lists
+    return re.sub(r"\(\?(?:,\s*\?)*\)", "(?...)", " ".join(statement.split()))
+
+
+class SlowQueryLog:
+    """Slow statements grouped by shape, explained and logged by a background thread"""
+
+    def __init__(
+        self, threshold: float, log_path: t.Optional[str] = None, log_bytes: int = 10**7
+    ):
+        self.threshold = threshold
+        self._shapes: OrderedDict[str, Shape] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(MAX_PENDING)
+        self._thread: t.Optional[threading.Thread] = None
+        self._log: t.Optional[logging.Logger] = None
+        if log_path:
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=log_bytes, backupCount=LOG_BACKUPS
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._log = logging.getLogger(f"{__name__}.log")
+            self._log.addHandler(handler)
+            self._log.setLevel(logging.INFO)
+            self._log.propagate = False
+
+    def record(self, engine: Engine, statement: str, parameters: t.Any, seconds: float):
+        """Account for a statement that took `seconds`, if that is over the threshold"""
+        if seconds < self.threshold:
+            return
+        key = _normalize(statement)
+        record = metrics.current_record()
+        route = record.route if record is not None else metrics.BACKGROUND
+        with self._lock:
+            shape = self._shapes.pop(key, None) or Shape(key)
+            self._shapes[key] = shape
+            if len(self._shapes) > MAX_SHAPES:
+                self._shapes.popitem(last=False)
+            shape.count += 1
+            shape.total_seconds += seconds
+            if seconds > shape.max_seconds:
+                shape.max_seconds = seconds
+                shape.parameters = parameters
+            shape.routes.add(route)
+            shape.last_seen = time.time()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        try:
+            self._pending.put_nowait((engine, shape, statement, parameters, seconds, route))
+        except queue.Full:
+            logger.warning("Too many slow statements pending, not logging %s", key)
+
+    def shapes(self) -> list[dict]:
+        """The slow shapes, those that took the longest in total first"""
+        with self._lock:
+            shapes = list(self._shapes.values())
+        return sorted((s.info() for s in shapes), key=lambda s: -s["total_seconds"])
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+
+    def _run(self):
+        while True:
+            engine, shape, statement, parameters, seconds, route = self._pending.get()
+            if shape.plan is None:
+                shape.plan = self._explain(engine, statement, parameters)
+            if self._log is not None:
+                self._log.info(
+                    json.dumps(
+                        {
+                            "time": time.time(),
+                            "seconds": seconds,
+                            "route": route,
+                            "statement": statement,
+                            "parameters": parameters,
+                            "where": shape.where,
+                            "plan": shape.plan,
+                            "full_scans": shape.full_scans,
+                        },
+                        default=str,
+                    )
+                )
+
+    @staticmethod
+    def _explain(engine: Engine, statement: str, parameters: t.Any) -> t.Optional[list[str]]:
+        if not statement.lstrip().upper().startswith("SELECT"):
+            return None
+        try:
+            with engine.connect() as conn:
+                rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        except Exception:
+            logger.exception("Failed to explain a slow statement")
+            return None
+        # The last column of each row describes a step of the plan
+        return [row[-1] for row in rows]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["slow_query_start"].pop()
+    if not executemany and not statement.startswith("EXPLAIN"):
+        log.record(conn.engine, statement, parameters, seconds)
+
+
+def from_env() -> SlowQueryLog:
+    return SlowQueryLog(
+        threshold=float(os.getenv("VIPRE_DATA_SLOW_QUERY_MS", "100")) / 1000.0,
+        log_path=os.getenv("VIPRE_DATA_SLOW_QUERY_LOG"),
+        log_bytes=int(os.getenv("VIPRE_DATA_SLOW_QUERY_LOG_BYTES", str(10**7))),
+    )
+
+
+log = from_env()
+
+
+def install():
+    """Start timing every statement, unless the log is disabled"""
+    if log.threshold > 0:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
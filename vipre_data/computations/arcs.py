@@ -0,0 +1,241 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from typing import Optional
+
+import numpy as np
+
+from vipre_data.computations.body_fixed import BodyRotation, inertial_to_body_fixed
+from vipre_data.computations.cart2sph import cart2sph
+from vipre_data.computations.conic_1point import conic_1point
+from vipre_data.computations.conic_2point import conic_2point
+from vipre_data.computations.kepler import mean_anomaly, mean_motion
+from vipre_data.computations.workspace import ConicWorkspace, pool
+
+
+def _to_spherical(
+    pos_set: np.ndarray, time_set: Optional[np.ndarray], rotation: Optional[BodyRotation]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if rotation is not None:
+        pos_set = inertial_to_body_fixed(pos_set, time_set, rotation)
+    return cart2sph(*pos_set)
+
+
+def carrier_arcs(
+    r_1,
+    v_1,
+    t_1,
+    final_times,
+    mu: float,
+    ta_step: int,
+    sampling: str = "uniform",
+    workspace: Optional[ConicWorkspace] = None,
+    rotation: Optional[BodyRotation] = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sample the carrier arcs from the divert maneuvers up to the final datarate times.
+    :inputs:
+    r_1: Nx3x1 positions at the maneuvers [km]
+    v_1: Nx3x1 velocities after the maneuvers (including their delta v) [km/s]
+    t_1: Nx1 maneuver times [s]
+    final_times: Nx1 times of the final datarates [s]
+    mu: gravity constant of central body [km3/s2]
+    ta_step: true anomaly step count (see conic_1point)
+    sampling: "uniform" or "adaptive" (see conic_1point)
+    workspace: optional scratch buffers for the conic kernels
+    rotation: when given, the arcs are converted to the rotating body-fixed frame of the body
+    :return:
+    height, latitude, longitude: NxK arrays
+    """
+    pos_set, vel_set, time_set = conic_1point(
+        r_1=r_1,
+        v_1=v_1,
+        t_1=t_1,
+        t_2=np.maximum(final_times, t_1),  # Sample exactly up to the final datarate
+        mu=mu,
+        ta_step=ta_step,  # Just needs to be high enough for a smooth arc
+        rev_check=0,  # Likely not ever changed by user
+        time_flag=int(rotation is not None),  # Sample times are only needed to rotate the positions
+        sampling=sampling,
+        vel_flag=0,  # Only positions are drawn
+        workspace=workspace,
+    )
+    # pos_set: [ [[ x1, x2, ... ], ... N arcs], [[ y1, y2, ... ], ...], [[ z1, z2, ... ], ...] ]
+    return _to_spherical(pos_set, time_set, rotation)
+
+
+def probe_arcs(
+    r_1,
+    v_1,
+    t_1,
+    r_2,
+    v_2,
+    t_2,
+    mu: float,
+    ta_step: int,
+    sampling: str = "uniform",
+    workspace: Optional[ConicWorkspace] = None,
+    rotation: Optional[BodyRotation] = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sample the probe arcs from the divert maneuvers to the entry points.
+    :inputs:
+    r_1, v_1: Nx3x1 position [km] and velocity [km/s] at the maneuvers
+    t_1: Nx1 maneuver times [s]
+    r_2, v_2: Nx3x1 position [km] and velocity [km/s] at entry
+    t_2: Nx1 entry times [s]
+    mu: gravity constant of central body [km3/s2]
+    ta_step: true anomaly step count (see conic_2point)
+    sampling: "uniform" or "adaptive" (see conic_2point)
+    workspace: optional scratch buffers for the conic kernels
+    rotation: when given, the arcs are converted to the rotating body-fixed frame of the body
+    :return:
+    height, latitude, longitude: NxK arrays
+    """
+    pos_set, vel_set, time_set = conic_2point(
+        r_1=r_1,
+        r_2=r_2,
+        v_1=v_1,
+        v_2=v_2,
+        t_1=t_1,
+        t_2=t_2,
+        mu=mu,
+        ta_step=ta_step,  # Just needs to be high enough for a smooth arc
+        rev_check=0,  # Likely not ever changed by user
+        time_flag=int(rotation is not None),  # Sample times are only needed to rotate the positions
+        sampling=sampling,
+        vel_flag=0,  # Only positions are drawn
+        workspace=workspace,
+    )
+    return _to_spherical(pos_set, time_set, rotation)
+
+
+def entry_arcs(
+    states: dict[str, np.ndarray],
+    mu: float,
+    probe_ta_step: int,
+    carrier_ta_step: int,
+    sampling: str = "uniform",
+    rotation: Optional[BodyRotation] = None,
+) -> list[np.ndarray]:
+    """
+    Sample the probe and carrier arcs of a batch of entries sharing a target body.
+
+    Only takes and returns plain arrays so that it can be run in a worker process (see
+    app.compute).
+    :inputs:
+    states: Nx3x1 "pos_man", "vel_man", "dv_maneuver", "pos_entry" and "vel_entry" arrays and Nx1
+        "time_man", "t_entry" and "final_time" arrays
+    mu: gravity constant of central body [km3/s2]
+    probe_ta_step, carrier_ta_step: true anomaly step counts of the probe and carrier arcs
+    sampling: "uniform" or "adaptive"
+    rotation: when given, the arcs are returned as ground tracks in the body-fixed frame
+    :return:
+    [probe height, probe latitude, probe longitude, carrier height, carrier latitude,
+    carrier longitude], each an array with one row per entry
+    """
+    # Arcs are converted to new arrays right away, so one workspace serves both conics
+    with pool.acquire() as workspace:
+        probe = probe_arcs(
+            states["pos_man"],
+            states["vel_man"],
+            states["time_man"],
+            states["pos_entry"],
+            states["vel_entry"],
+            states["t_entry"],
+            mu,
+            probe_ta_step,
+            sampling,
+            workspace,
+            rotation,
+        )
+        carrier = carrier_arcs(
+            states["pos_man"],
+            # Carrier velocity vector is sum of instantaneous velocity vector and delta_v of maneuver
+            states["vel_man"] + states["dv_maneuver"],
+            states["time_man"],
+            states["final_time"],
+            mu,
+            carrier_ta_step,
+            sampling,
+            workspace,
+            rotation,
+        )
+    return [*probe, *carrier]
+
+
+def flyby_arcs(
+    v_inf_in, v_inf_out, r_p, mu, r_max, ta_step: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sample the planetocentric hyperbolas of many flybys, at any number of bodies, in a single
+    conic_1point call.
+
+    Each hyperbola has its periapsis at r_p, its energy set by the incoming v-infinity and its
+    plane and periapsis direction set by the incoming and outgoing asymptotes. It is sampled
+    symmetrically about periapsis between the radii r_max. The states are scaled by r_p and the
+    body's mu before sampling, which lets flybys of bodies with different gravity constants share
+    one call.
+    :inputs:
+    v_inf_in, v_inf_out: Nx3 incoming and outgoing v-infinity vectors [km/s]
+    r_p: Nx1 periapsis radii [km]
+    mu: Nx1 gravity constants of the flyby bodies [km3/s2]
+    r_max: Nx1 radii at which the arcs start and end [km]
+    ta_step: true anomaly step count (see conic_1point)
+    :return:
+    height, latitude, longitude: NxK arrays, relative to the flyby bodies in EMO2000
+    """
+    s_in = v_inf_in / np.linalg.norm(v_inf_in, axis=1, keepdims=True)
+    s_out = v_inf_out / np.linalg.norm(v_inf_out, axis=1, keepdims=True)
+    # Periapsis opposes the velocity change of the flyby, and the velocity there is normal to it
+    e_hat = s_in - s_out
+    e_hat /= np.linalg.norm(e_hat, axis=1, keepdims=True)
+    p_hat = s_in + s_out
+    p_hat /= np.linalg.norm(p_hat, axis=1, keepdims=True)
+
+    # In units of r_p and sqrt(mu / r_p), where mu = 1
+    v_inf = np.linalg.norm(v_inf_in, axis=1, keepdims=True) / np.sqrt(mu / r_p)
+    ecc = 1.0 + v_inf**2
+    p = 1.0 + ecc
+    ta_1 = -np.arccos(np.clip((p / (r_max / r_p) - 1.0) / ecc, -1.0, 1.0))  # inbound at r_max
+    r_1 = (p / (1.0 + ecc * np.cos(ta_1))) * (np.cos(ta_1) * e_hat + np.sin(ta_1) * p_hat)
+    v_1 = np.sqrt(1.0 / p) * (-np.sin(ta_1) * e_hat + (ecc + np.cos(ta_1)) * p_hat)
+    # The outbound half takes as long as the inbound one
+    t_2 = 2.0 * -mean_anomaly(ta_1, ecc) / mean_motion(p, ecc, 1.0)
+
+    pos_set, _, _ = conic_1point(
+        r_1=r_1[:, :, None],
+        v_1=v_1[:, :, None],
+        t_1=np.zeros_like(t_2),
+        t_2=t_2,
+        mu=1.0,
+        ta_step=ta_step,
+        rev_check=0,
+        time_flag=0,
+        vel_flag=0,
+    )
+    return cart2sph(*(pos_set * r_p[:, 0, None]))
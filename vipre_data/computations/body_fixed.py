@@ -0,0 +1,77 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Transformation of sampled arcs from the inertial frame to the rotating body-fixed frame
+
+The body's equatorial frame has its z axis along the spin pole and its x axis along the ascending
+node of the equator on the EMO2000 x-y plane. The body-fixed frame rotates about the pole with the
+body's period; its prime meridian is taken to be on the node at J2000 (t = 0), since the database
+does not record the body's prime meridian angle.
+"""
+
+import typing as t
+
+import numpy as np
+
+
+class BodyRotation(t.NamedTuple):
+    pole: np.ndarray  # spin pole unit vector in EMO2000 (3,)
+    period: float  # rotational period [days], negative for retrograde rotation
+
+
+def equatorial_frame(pole: np.ndarray) -> np.ndarray:
+    """
+    Rotation matrix from EMO2000 to the body's (non-rotating) equatorial frame.
+
+    :param pole: spin pole vector of the body in EMO2000
+    :return: 3x3 matrix whose rows are the equatorial x, y and z axes
+    """
+    z = np.asarray(pole, dtype=float) / np.linalg.norm(pole)
+    x = np.cross([0.0, 0.0, 1.0], z)
+    if np.linalg.norm(x) < 1e-12:  # the pole is along the EMO2000 z axis
+        x = np.array([1.0, 0.0, 0.0])
+    x /= np.linalg.norm(x)
+    return np.stack([x, np.cross(z, x), z])
+
+
+def inertial_to_body_fixed(
+    pos_set: np.ndarray, time_set: np.ndarray, rotation: BodyRotation
+) -> np.ndarray:
+    """
+    Rotate sampled positions into the body-fixed frame at their sample times, for a whole batch of
+    arcs at once.
+
+    :param pos_set: 3xNxK positions in EMO2000 [km], as returned by the conic kernels
+    :param time_set: 1xNxK or NxK sample times [seconds past J2000]
+    :param rotation: pole and period of the body
+    :return: 3xNxK positions in the body-fixed frame [km]
+    """
+    x, y, z = np.einsum("ij,j...->i...", equatorial_frame(rotation.pole), pos_set)
+    angle = np.reshape(time_set, x.shape) * (2.0 * np.pi / (rotation.period * 86400.0))
+    cos, sin = np.cos(angle), np.sin(angle)
+    return np.stack([cos * x + sin * y, cos * y - sin * x, z])
@@ -30,9 +30,25 @@ from typing import Tuple, Any
 import numpy as np
 from numpy import linalg as la, ndarray
 
+from vipre_data.computations import kernels
+from vipre_data.computations.kepler import true_anomaly_at_time
+from vipre_data.computations.sampling import true_anomaly_set
+
 
 def conic_1point(
-    r_1, v_1, t_1, ta_step, mu, rev_check, time_flag
+    r_1,
+    v_1,
+    t_1,
+    ta_step,
+    mu,
+    rev_check,
+    time_flag,
+    t_2=None,
+    sampling="uniform",
+    vel_flag=1,
+    out=None,
+    workspace=None,
+    backend=None,
 ) -> tuple[ndarray, ndarray, ndarray]:
     """
     Compute an array of N points along a conic orbit between two postions of the trajectory.
@@ -45,6 +61,18 @@ def conic_1point(
     :param mu: gravity constant of central body [km3/s2]
     :param rev_check: flag indicating whether to check for multiple revolutions based on input time. 1 to toggle on
     :param time_flag: flag indication whether to compute the time at each orbit point. 1 to toggle on
+    :param t_2: optional end time [seconds past J2000] as an Nx1 array. When given, the true anomaly
+        reached at t_2 is found by solving Kepler's equation and the ta_step samples span exactly
+        t_1 to t_2 instead of ending at a true anomaly of 15 degrees
+    :param sampling: "uniform" for ta_step evenly spaced true anomaly steps, or "adaptive" for at
+        most ta_step steps placed by curvature (see computations.sampling)
+    :param vel_flag: flag indicating whether to compute the velocity at each orbit point. 1 to toggle
+        on. vel_set is None when off
+    :param out: optional (pos_set, vel_set, time_set) arrays to write the results to, see
+        kernels.conic_sets
+    :param workspace: optional ConicWorkspace whose buffers are reused for the samples, the
+        intermediate arrays and, when out is not given, the results
+    :param backend: "numpy" or "numba" to override the backend selected in computations.kernels
     :return:
         pos_set: position vector along trajectory in ta_step evenly spaced true anomaly steps
         vel_set: velocity vector along trajectory in ta_step evenlyspaced true anomaly steps
@@ -63,9 +91,12 @@ def conic_1point(
     sma = -mu / (2.0 * energy)  # semi major axis
     ecc = np.sqrt(1.0 + (2.0 * energy * la.norm(h, axis=1) ** 2) / mu**2)  # eccentricity
     ta_1 = get_true_anomaly(p, ecc, r_1, v_1)  # true anomaly for point 1
-    ta_2 = (
-        np.pi * 15.0 / 180.0 * np.ones(np.shape(ta_1))
-    )  # get_true_anomaly(p,ecc,r_2,v_2)#true anomaly for point 2
+    if t_2 is None:
+        ta_2 = (
+            np.pi * 15.0 / 180.0 * np.ones(np.shape(ta_1))
+        )  # get_true_anomaly(p,ecc,r_2,v_2)#true anomaly for point 2
+    else:
+        ta_2 = true_anomaly_at_time(ta_1, t_1, t_2, p, ecc, mu)  # true anomaly reached at time 2
     inc = np.arccos(h_hat.T[0][2])[None].T  # inclination
     th = np.arctan2(r_hat.T[0][2], th_hat.T[0][2])[None].T  # orbit angle
     raan = np.arctan2(h_hat.T[0][0], -h_hat.T[0][1])[None].T  # right ascension of ascending node
@@ -80,6 +111,8 @@ def conic_1point(
     ell_ind = np.where(ecc < 1.0)  # identify elliptical cases
     period = np.zeros(np.shape(ta))
     revs = np.zeros(np.shape(ta))
+    if t_2 is not None:  # time bounded arcs may span several revolutions, which are timed by period
+        period[ell_ind] = 2.0 * np.pi * np.sqrt(sma[ell_ind] ** 3 / mu)  # orbit period
     # if rev_check and len(ell_ind) > 0:  # count total number of orbits if specified
     #     period[ell_ind] = 2.0 * np.pi * np.sqrt(sma[ell_ind] ** 3 / mu)  # orbit period
     #     revs[ell_ind] = np.floor(
@@ -89,53 +122,20 @@ def conic_1point(
     (E, P, H) = kep2cart_array(
         raan, aop, inc
     )  # conversion unit vectors from keplerian elements to cartesian
-    ta_set = (
-        np.linspace(np.zeros(np.shape(ta)), ta + 2.0 * np.pi * revs, ta_step, axis=1)
-        + ta_1.T[None].T
+    ta_set = true_anomaly_set(
+        ta_1,
+        ta + 2.0 * np.pi * revs,
+        p,
+        ecc,
+        ta_step,
+        sampling,
+        out=workspace.array("ta_set", (len(ta), ta_step, 1)) if workspace is not None else None,
     )  # true anomaly sampling
 
-    pos_set_E = (
-        p.T[None].T / (1.0 + ecc.T[None].T * np.cos(ta_set)) * np.cos(ta_set)
-    )  # E direction position
-    pos_set_P = (
-        p.T[None].T / (1.0 + ecc.T[None].T * np.cos(ta_set)) * np.sin(ta_set)
-    )  # P direction position
-    pos_set = (
-        np.transpose(E, axes=[2, 0, 1]) * np.transpose(pos_set_E, axes=[2, 0, 1]).T
-        + np.transpose(P, axes=[2, 0, 1]) * np.transpose(pos_set_P, axes=[2, 0, 1]).T
-    ).T
-
-    # generate velocities
-    vel_set_E = -np.sqrt(mu / p.T[None].T) * np.sin(ta_set)  # E direction velocity
-    vel_set_P = np.sqrt(mu / p.T[None].T) * (ecc.T[None].T + np.cos(ta_set))  # P direction velocity
-    vel_set = (
-        np.transpose(E, axes=[2, 0, 1]) * np.transpose(vel_set_E, axes=[2, 0, 1]).T
-        + np.transpose(P, axes=[2, 0, 1]) * np.transpose(vel_set_P, axes=[2, 0, 1]).T
-    ).T
+    return kernels.conic_sets(
+        E, P, p, ecc, ta_set, mu, t_1, period, time_flag, vel_flag, out, workspace, backend
+    )
 
-    # generate times
-    time_set = np.zeros((np.shape(np.transpose(ta_set, axes=[2, 0, 1]))))
-    if time_flag:
-        dta_set = (
-            np.transpose(ta_set, axes=[2, 0, 1]).T[1:].T[0]
-            - np.transpose(ta_set, axes=[2, 0, 1]).T[0]
-        )  # true anomaly differences
-        time_set[0].T[0] = t_1.T  # initial time setting
-        tof = (
-            find_tof(
-                np.transpose(pos_set, axes=[2, 0, 1])[0][None],
-                np.transpose(pos_set, axes=[2, 0, 1])[1:],
-                p,
-                dta_set,
-                mu,
-            )
-            / 86400.0
-        )  # calculate time of flight
-        rev_count = np.floor(dta_set / (2.0 * np.pi))  # count orbits
-        revs_adjust = np.where((tof < 0))  # adjust for TOF algorithm angle wrapping
-        rev_count[revs_adjust] = rev_count[revs_adjust] + 1
-        time_set[0].T[1:] = 86400. * (t_1 / 86400.0 + tof + rev_count * period / 86400.0).T  # generate time array
-    return pos_set, vel_set, time_set
 
 def get_true_anomaly(p, ecc, r, v) -> np.ndarray:
     """
@@ -149,12 +149,11 @@ def get_true_anomaly(p, ecc, r, v) -> np.ndarray:
     :return:
     ta: true anomaly [rad]
     """
-    ta = np.arccos((p / la.norm(r, axis=1) - 1.0) / ecc)  # true anomaly
-    quad_check = np.diag(np.dot(np.transpose(r, axes=[2, 0, 1]), v)[0].T[0])
-    quad_ind = np.where(quad_check < 0)
-
-    if len(quad_ind) > 0:
-        ta[quad_ind] = 2.0 * np.pi - ta[quad_ind]  # apply quadrant fix
+    # true anomaly; rounding can push the cosine just past +-1 at the apsides
+    ta = np.arccos(np.clip((p / la.norm(r, axis=1) - 1.0) / ecc, -1.0, 1.0))
+    quad_check = np.einsum("ijk,ijk->ik", r, v)  # r . v of each row, negative when approaching
+    quad_ind = quad_check < 0
+    ta[quad_ind] = 2.0 * np.pi - ta[quad_ind]  # apply quadrant fix
     return ta
     pass
 
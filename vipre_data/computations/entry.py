@@ -28,19 +28,60 @@
 import numpy as np
 
 
-def bvec_theta() -> float:
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.sqrt(np.einsum("ij,ij->i", vectors, vectors))[:, None]
+
+
+def b_plane(
+    v_inf: np.ndarray, pos: np.ndarray, vel: np.ndarray, pole: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the B-plane angle and magnitude of many arrivals at once.
+
+    The B-plane is normal to the incoming asymptote S, the direction of the arrival v-infinity. Its
+    T axis is S x pole, in the body's equatorial plane, and its R axis is S x T. The B vector lies
+    along S x h, where h is the angular momentum of the arrival state, with magnitude |h| / |v_inf|.
+
+    :param v_inf: Nx3 arrival v-infinity vectors [km/s]
+    :param pos: Nx3 body relative positions along the arrival trajectories [km]
+    :param vel: Nx3 body relative velocities at those positions [km/s]
+    :param pole: 3 or Nx3 body spin pole unit vectors, in the same frame as the other vectors
+    :return:
+        bvec_theta: angle of the B vector from the T axis towards the R axis [rad]
+        bvec_mag: magnitude of the B vector, the impact parameter of the arrival [km]
+    """
+    v_inf, pos, vel = (np.asarray(a, dtype=float).reshape(-1, 3) for a in (v_inf, pos, vel))
+    pole = np.broadcast_to(np.asarray(pole, dtype=float), v_inf.shape)
+
+    v_inf_mag = np.sqrt(np.einsum("ij,ij->i", v_inf, v_inf))
+    s_hat = v_inf / v_inf_mag[:, None]
+    h = np.cross(pos, vel)
+    # Only the direction of S x h is used, which stays in the B-plane even if h is not exactly
+    # normal to S (e.g. when v_inf and the state come from slightly different models)
+    b_vec = np.cross(s_hat, h)
+    b_mag = np.sqrt(np.einsum("ij,ij->i", h, h)) / v_inf_mag
+    t_hat = _unit(np.cross(s_hat, pole))
+    r_hat = np.cross(s_hat, t_hat)
+    b_t = np.einsum("ij,ij->i", b_vec, t_hat)
+    b_r = np.einsum("ij,ij->i", b_vec, r_hat)
+    return np.arctan2(b_r, b_t), b_mag
+
+
+def bvec_theta(v_inf: np.ndarray, pos: np.ndarray, vel: np.ndarray, pole: np.ndarray) -> np.ndarray:
     """
-    Compute the B-plane theta vector for a single entry.
+    Compute the B-plane theta angle for many entries, see `b_plane`.
 
     :return: Angle on B-plane for target arrival [rad]
     """
-    pass
+    return b_plane(v_inf, pos, vel, pole)[0]
 
 
-def bvec_mag() -> float:
+def bvec_mag(v_inf: np.ndarray, pos: np.ndarray, vel: np.ndarray) -> np.ndarray:
     """
-    Compute the B-plane magnitude for a single entry
+    Compute the B-plane magnitude for many entries, see `b_plane`.
 
     :return: Radial distance from body origin for target arrival [km]
     """
-    pass
+    v_inf, pos, vel = (np.asarray(a, dtype=float).reshape(-1, 3) for a in (v_inf, pos, vel))
+    h = np.cross(pos, vel)
+    return np.sqrt(np.einsum("ij,ij->i", h, h) / np.einsum("ij,ij->i", v_inf, v_inf))
@@ -0,0 +1,125 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""
+Reference cases for the conic kernels, taken from the examples documented in conic_2point.
+
+Documented outputs are rounded to 9 significant figures and their times are in days (t_1 and t_2
+of the examples are interpreted as days there), so outputs are compared with DOCUMENTED_RTOL
+relative to each arc's scale and times are compared as times of flight.
+"""
+
+import numpy as np
+
+DOCUMENTED_RTOL = 1e-8
+
+CONIC_2POINT_EXAMPLES = [
+    dict(
+        ta_step=15,
+        mu=37931206.1590105,
+        r_1=np.array([[[-52570775.9381423], [-48053033.8464909], [-18714087.8322127]]]),
+        r_2=np.array([[[-5244.70404103397], [-28361.2929499602], [-54124.8468055892]]]),
+        rev_check=1,
+        t_1=np.array([[13701.5]]),
+        t_2=np.array([[13801.5]]),
+        time_flag=1,
+        v_1=np.array([[[5.92245272612931], [5.41349858784282], [2.08599922052923]]]),
+        v_2=np.array([[[-6.2516040802002], [5.34768724441528], [0.149426251649857]]]),
+    ),
+    dict(
+        ta_step=12,
+        mu=132712440041.279,
+        r_1=np.array(
+            [
+                [[-490781577.445248], [665883634.267565], [8483597.29825115]],
+                [[-507338731.981395], [662408807.107071], [9041504.31209764]],
+                [[-52570775.9381423], [-48053033.8464909], [-18714087.8322127]],
+            ]
+        ),
+        r_2=np.array(
+            [
+                [[-1272998893.0951], [556745185.1877], [41012437.6064022]],
+                [[-1284198529.59937], [533637648.158208], [41859341.5064153]],
+                [[-5244.70404103397], [-28361.2929499602], [-54124.8468055892]],
+            ]
+        ),
+        rev_check=1,
+        t_1=np.array([[13079.7579005001], [13103.0297838546], [13701.5]]),
+        t_2=np.array([[13771.5], [13801.5], [13801.5]]),
+        time_flag=1,
+        v_1=np.array(
+            [
+                [[-15.98380387215], [0.854676233590379], [0.614597010939183]],
+                [[-15.8104622005541], [0.487581744461126], [0.6163084862148]],
+                [[5.92245272612931], [5.41349858784282], [2.08599922052923]],
+            ]
+        ),
+        v_2=np.array(
+            [
+                [[-10.739749897275], [-3.33432341479318], [0.476430938814154]],
+                [[-10.4910612381906], [-3.60317735118423], [0.474128964364346]],
+                [[-6.2516040802002], [5.34768724441528], [0.149426251649857]],
+            ]
+        ),
+    ),
+]
+
+# Documented outputs of the first example; the second example's outputs are not documented
+# fmt: off
+CONIC_2POINT_EXAMPLE_1_OUTPUTS = dict(
+    pos_set=np.array([
+        [[-5.25707759e+07, -1.21673667e+06, -5.31592774e+05, -3.07759404e+05,
+          -1.99866707e+05, -1.37785365e+05, -9.81666234e+04, -7.10857609e+04,
+          -5.16421229e+04, -3.71548327e+04, -2.60432933e+04, -1.73206216e+04,
+          -1.03420092e+04, -4.67031830e+03, -9.45874490e-10]],
+        [[-4.80530338e+07, -1.11217472e+06, -4.85909617e+05, -2.81311676e+05,
+          -1.82690886e+05, -1.25944590e+05, -8.97305393e+04, -6.49769081e+04,
+          -4.72041859e+04, -3.39618809e+04, -2.38052270e+04, -1.58321501e+04,
+          -9.45325434e+03, -4.26896806e+03, 3.03475645e-08]],
+        [[-1.87140878e+07, -6.03207544e+05, -3.43148505e+05, -2.49076994e+05,
+          -1.98398914e+05, -1.65776165e+05, -1.42541635e+05, -1.24881780e+05,
+          -1.10836482e+05, -9.92852651e+04, -8.95360511e+04, -8.11354197e+04,
+          -7.37722072e+04, -6.72247139e+04, -6.13300000e+04]],
+    ]),
+    vel_set=np.array([
+        [[5.92245273, 7.50255478, 9.02927236, 10.48916923, 11.86939726,
+          13.15780942, 14.34306677, 15.41473819, 16.36339218, 17.18067991,
+          17.85940865, 18.39360511, 18.77856795, 19.01090924, 19.08858421]],
+        [[5.41349859, 6.8578124, 8.25332939, 9.58776802, 10.84938424,
+          12.02707493, 13.11047556, 14.09005141, 14.95718152, 15.7042345,
+          16.32463575, 16.8129253, 17.16480583, 17.37718055, 17.44818041]],
+        [[2.08599922, 2.75728912, 3.62623146, 4.68517891, 5.92481198,
+          7.33422099, 8.90100212, 10.61136658, 12.4502619, 14.40150449,
+          16.447922, 18.57150447, 20.75356284, 22.97489341, 25.21594688]],
+    ]),
+    time_set=np.array([
+        [[13701.5, 13799.97685882, 13800.95895667, 13801.22754334,
+          13801.34002581, 13801.39770096, 13801.43114571, 13801.4522512,
+          13801.46643116, 13801.47643514, 13801.48377758, 13801.48934696,
+          13801.49369156, 13801.49716419, 13801.5]],
+    ]),
+)
+# fmt: on
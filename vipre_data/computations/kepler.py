@@ -0,0 +1,148 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+
+# Orbits with eccentricities this close to 1 are treated as parabolic
+PARABOLIC_TOL = 1e-10
+
+
+def mean_anomaly(ta, ecc) -> np.ndarray:
+    """
+    Compute the mean anomaly of points on an orbit from their true anomaly.
+    Inputs can be scalar or arrays of matching shape
+    :inputs:
+    ta: true anomaly [rad], expected in the range (-pi, pi]
+    ecc: eccentricity
+    :return:
+    M: mean anomaly [rad]; elliptic, hyperbolic or Barker's (parabolic) form depending on ecc
+    """
+    ta, ecc = np.broadcast_arrays(np.asarray(ta, dtype=float), np.asarray(ecc, dtype=float))
+    M = np.zeros(np.shape(ta))
+    ell = ecc < 1.0 - PARABOLIC_TOL
+    hyp = ecc > 1.0 + PARABOLIC_TOL
+    par = ~(ell | hyp)
+
+    # elliptic: M = E - e sin(E)
+    E = 2.0 * np.arctan2(
+        np.sqrt(1.0 - ecc[ell]) * np.sin(ta[ell] / 2.0),
+        np.sqrt(1.0 + ecc[ell]) * np.cos(ta[ell] / 2.0),
+    )
+    M[ell] = E - ecc[ell] * np.sin(E)
+    # hyperbolic: M = e sinh(F) - F
+    F = 2.0 * np.arctanh(np.sqrt((ecc[hyp] - 1.0) / (ecc[hyp] + 1.0)) * np.tan(ta[hyp] / 2.0))
+    M[hyp] = ecc[hyp] * np.sinh(F) - F
+    # parabolic (Barker): M = D + D^3 / 3
+    D = np.tan(ta[par] / 2.0)
+    M[par] = D + D**3 / 3.0
+    return M
+
+
+def true_anomaly_from_mean(M, ecc, tol=1e-12, max_iter=50) -> np.ndarray:
+    """
+    Solve Kepler's equation for the true anomaly corresponding to a mean anomaly.
+    Inputs can be scalar or arrays of matching shape
+    :inputs:
+    M: mean anomaly [rad] as returned by mean_anomaly. Elliptic values may span several revolutions
+    ecc: eccentricity
+    tol: convergence tolerance of the Newton iterations [rad]
+    max_iter: maximum number of Newton iterations
+    :return:
+    ta: true anomaly [rad]; elliptic values are unwrapped so that full revolutions are preserved
+    """
+    M, ecc = np.broadcast_arrays(np.asarray(M, dtype=float), np.asarray(ecc, dtype=float))
+    ta = np.zeros(np.shape(M))
+    ell = ecc < 1.0 - PARABOLIC_TOL
+    hyp = ecc > 1.0 + PARABOLIC_TOL
+    par = ~(ell | hyp)
+
+    # elliptic: solve E - e sin(E) = M within one revolution, then restore the revolution count
+    e = ecc[ell]
+    revs = np.round(M[ell] / (2.0 * np.pi))
+    Mr = M[ell] - 2.0 * np.pi * revs
+    E = np.where(e < 0.8, Mr, np.pi * np.sign(Mr))  # starting guess, Vallado p. 65
+    for _ in range(max_iter):
+        step = (E - e * np.sin(E) - Mr) / (1.0 - e * np.cos(E))
+        E -= step
+        if np.all(np.abs(step) < tol):
+            break
+    ta[ell] = 2.0 * np.arctan2(
+        np.sqrt(1.0 + e) * np.sin(E / 2.0), np.sqrt(1.0 - e) * np.cos(E / 2.0)
+    )
+    ta[ell] += 2.0 * np.pi * revs
+
+    # hyperbolic: solve e sinh(F) - F = M
+    e = ecc[hyp]
+    F = np.arcsinh(M[hyp] / e)  # starting guess, exact for large |M|
+    for _ in range(max_iter):
+        step = (e * np.sinh(F) - F - M[hyp]) / (e * np.cosh(F) - 1.0)
+        F -= step
+        if np.all(np.abs(step) < tol):
+            break
+    ta[hyp] = 2.0 * np.arctan(np.sqrt((e + 1.0) / (e - 1.0)) * np.tanh(F / 2.0))
+
+    # parabolic: closed form solution of Barker's equation
+    A = np.cbrt((3.0 * M[par] + np.sqrt(9.0 * M[par] ** 2 + 4.0)) / 2.0)
+    ta[par] = 2.0 * np.arctan(A - 1.0 / A)
+    return ta
+
+
+def mean_motion(p, ecc, mu) -> np.ndarray:
+    """
+    Compute the rate of change of the mean anomaly returned by mean_anomaly.
+    :inputs:
+    p: semi parameter of orbit [km]
+    ecc: eccentricity
+    mu: gravity constant of central body [km3/s2]
+    :return:
+    n: mean motion [rad/s]
+    """
+    p, ecc = np.broadcast_arrays(np.asarray(p, dtype=float), np.asarray(ecc, dtype=float))
+    par = np.abs(ecc - 1.0) <= PARABOLIC_TOL
+    sma = np.abs(p / np.where(par, 1.0, 1.0 - ecc**2))
+    return np.where(par, 2.0 * np.sqrt(mu / p**3), np.sqrt(mu / sma**3))
+
+
+def true_anomaly_at_time(ta_1, t_1, t_2, p, ecc, mu) -> np.ndarray:
+    """
+    Compute the true anomaly reached at time t_2 by a body at true anomaly ta_1 at time t_1.
+    Inputs can be scalar or arrays of matching shape (e.g. Nx1 as used by conic_1point)
+    :inputs:
+    ta_1: true anomaly at time 1 [rad]
+    t_1: time 1 [seconds past J2000]
+    t_2: time 2 [seconds past J2000]
+    p: semi parameter of orbit [km]
+    ecc: eccentricity
+    mu: gravity constant of central body [km3/s2]
+    :return:
+    ta_2: true anomaly at time 2 [rad], unwrapped so that ta_2 - ta_1 is the angle travelled
+    """
+    ta_1 = np.asarray(ta_1, dtype=float)
+    ta_1_wrapped = np.arctan2(np.sin(ta_1), np.cos(ta_1))  # true anomaly in (-pi, pi]
+    M_1 = mean_anomaly(ta_1_wrapped, ecc)
+    M_2 = M_1 + mean_motion(p, ecc, mu) * (np.asarray(t_2) - np.asarray(t_1))
+    return ta_1 + (true_anomaly_from_mean(M_2, ecc) - ta_1_wrapped)
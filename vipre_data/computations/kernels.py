@@ -0,0 +1,413 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""
+Interchangeable backends for the per-sample work of the conic propagation kernels.
+
+conic_1point and conic_2point resolve the geometry of each arc (a handful of values per arc) with
+NumPy and then evaluate positions, velocities and times at every true anomaly sample. With the
+"numpy" backend that evaluation is done with whole-array operations; with the "numba" backend it
+is done by `conic_sets`, a single JIT compiled loop per arc that never materialises intermediate
+arrays. The "numba" backend is only available when numba is installed.
+
+Both backends implement the same formulas in the same order. Positions and velocities agree to
+within POS_RTOL/VEL_RTOL and times to within TIME_ATOL seconds. `python -m
+vipre_data.computations.kernels` checks this on the examples documented in conic_2point.
+
+The backend defaults to "numba" when it is available and can be chosen with the
+VIPRE_DATA_CONIC_BACKEND environment variable or at runtime with `set_backend`.
+"""
+
+import logging
+import os
+
+import numpy as np
+
+from vipre_data.computations.workspace import ConicWorkspace
+
+try:
+    import numba
+except ImportError:  # numba is an optional dependency
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("numpy", "numba")
+POS_RTOL = 1e-12  # relative to the largest position magnitude of each arc
+VEL_RTOL = 1e-12  # relative to the largest velocity magnitude of each arc
+TIME_ATOL = 1e-6  # [s]
+
+
+def available_backends() -> list[str]:
+    return [b for b in BACKENDS if b != "numba" or numba is not None]
+
+
+def set_backend(name: str) -> None:
+    """Select the backend used by conic_1point and conic_2point"""
+    global _backend
+    if name not in available_backends():
+        raise ValueError(
+            f"Conic backend {name!r} is not available; use one of {available_backends()}"
+        )
+    _backend = name
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def _default_backend() -> str:
+    name = os.environ.get("VIPRE_DATA_CONIC_BACKEND", "auto")
+    if name == "auto":
+        return "numba" if numba is not None else "numpy"
+    if name not in available_backends():
+        logger.warning("Conic backend %r is not available, falling back to numpy", name)
+        return "numpy"
+    return name
+
+
+def _jit(func):
+    # Without numba the kernels remain importable as plain (slow) Python, which is only used to
+    # cross check the NumPy backend
+    return numba.njit(cache=True, nogil=True)(func) if numba is not None else func
+
+
+@_jit
+def _tof(r0_norm, r_norm, p, delta_ta, mu, conic):
+    # Time of flight between two points of a conic: Vallado p. 134 algorithm 11 (FINDTOF), see
+    # conic_2point.find_tof. conic is 1 for ellipses, 0 for parabolas and -1 for hyperbolas
+    cos_delta_ta = np.cos(delta_ta)
+    sin_delta_ta = np.sin(delta_ta)
+    k = r0_norm * r_norm * (1.0 - cos_delta_ta)
+    l = r0_norm + r_norm
+    m = r0_norm * r_norm * (1.0 + cos_delta_ta)
+    a = m * k * p / ((2 * m - l**2) * p**2 + 2 * k * l * p - k**2)
+    f = 1 - r_norm * (1 - cos_delta_ta) / p
+    g = r0_norm * r_norm * sin_delta_ta / np.sqrt(mu * p)
+    if conic > 0:
+        tan_half_delta_ta = sin_delta_ta / (1.0 + cos_delta_ta)
+        f_dot = (
+            np.sqrt(mu / p)
+            * tan_half_delta_ta
+            * ((1.0 - cos_delta_ta) / p - 1.0 / r0_norm - 1.0 / r_norm)
+        )
+        sin_delta_E = -r0_norm * r_norm * f_dot / np.sqrt(mu * a)
+        cos_delta_E = 1.0 - r0_norm * (1.0 - f) / a
+        delta_E = np.arctan2(sin_delta_E, cos_delta_E)
+        return g + np.sqrt(a**3 / mu) * (delta_E - sin_delta_E)
+    if conic == 0:
+        c = np.sqrt(r0_norm**2 + r_norm**2 - 2.0 * r0_norm * r_norm * cos_delta_ta)
+        s = (r0_norm + r_norm + c) / 2.0
+        return 2.0 / 3.0 * np.sqrt(s**3.0 / (2.0 * mu)) * (1.0 - ((s - c) / s) ** (3.0 / 2.0))
+    delta_H = np.arccosh(1 + (f - 1) * r0_norm / a)
+    return g + np.sqrt((-a) ** 3 / mu) * (np.sinh(delta_H) - delta_H)
+
+
+@_jit
+def _sma(r0_norm, r_norm, p, delta_ta):
+    # Semi major axis as computed by FINDTOF, which selects the conic type
+    cos_delta_ta = np.cos(delta_ta)
+    k = r0_norm * r_norm * (1.0 - cos_delta_ta)
+    l = r0_norm + r_norm
+    m = r0_norm * r_norm * (1.0 + cos_delta_ta)
+    return m * k * p / ((2 * m - l**2) * p**2 + 2 * k * l * p - k**2)
+
+
+@_jit
+def _fill_conic_sets(
+    E, P, p, ecc, ta_set, mu, t_1, period, time_flag, vel_flag, pos_set, vel_set, time_set
+):
+    n, k = ta_set.shape
+    for i in range(n):
+        sqrt_mu_p = np.sqrt(mu / p[i])
+        for j in range(k):
+            cos_ta = np.cos(ta_set[i, j])
+            sin_ta = np.sin(ta_set[i, j])
+            radius = p[i] / (1.0 + ecc[i] * cos_ta)
+            pos_E = radius * cos_ta
+            pos_P = radius * sin_ta
+            vel_E = -sqrt_mu_p * sin_ta
+            vel_P = sqrt_mu_p * (ecc[i] + cos_ta)
+            for c in range(3):
+                pos_set[c, i, j] = E[i, c] * pos_E + P[i, c] * pos_P
+            if vel_flag:
+                for c in range(3):
+                    vel_set[c, i, j] = E[i, c] * vel_E + P[i, c] * vel_P
+
+        if not time_flag:
+            continue
+        r0_norm = np.sqrt(pos_set[0, i, 0] ** 2 + pos_set[1, i, 0] ** 2 + pos_set[2, i, 0] ** 2)
+
+        # Like find_tof, one formula is used for the whole arc: hyperbolic if any sample
+        # classifies as hyperbolic, else parabolic if any does, else elliptic
+        any_ellipse, any_parabola, any_hyperbola = False, False, False
+        for j in range(1, k):
+            r_norm = np.sqrt(pos_set[0, i, j] ** 2 + pos_set[1, i, j] ** 2 + pos_set[2, i, j] ** 2)
+            a = _sma(r0_norm, r_norm, p[i], ta_set[i, j] - ta_set[i, 0])
+            any_ellipse |= a > 0
+            any_parabola |= a == 0
+            any_hyperbola |= a < 0
+        if any_hyperbola:
+            conic = -1
+        elif any_parabola:
+            conic = 0
+        elif any_ellipse:
+            conic = 1
+        else:  # no valid samples, find_tof leaves the time of flight at 0
+            conic = 2
+
+        time_set[0, i, 0] = t_1[i]
+        for j in range(1, k):
+            delta_ta = ta_set[i, j] - ta_set[i, 0]
+            tof = 0.0
+            if conic < 2:
+                r_norm = np.sqrt(
+                    pos_set[0, i, j] ** 2 + pos_set[1, i, j] ** 2 + pos_set[2, i, j] ** 2
+                )
+                tof = _tof(r0_norm, r_norm, p[i], delta_ta, mu, conic) / 86400.0
+            rev_count = np.floor(delta_ta / (2.0 * np.pi))  # count orbits
+            if tof < 0:  # adjust for TOF algorithm angle wrapping
+                rev_count += 1
+            time_set[0, i, j] = 86400.0 * (t_1[i] / 86400.0 + tof + rev_count * period[i] / 86400.0)
+
+
+def _numpy_conic_sets(
+    E, P, p, ecc, ta_set, mu, t_1, period, time_flag, pos_set, vel_set, time_set, workspace
+):
+    from vipre_data.computations.conic_2point import find_tof  # conic_2point imports this module
+
+    shape = np.shape(ta_set)
+    p_arc = p.T[None].T  # Nx1x1, broadcasts against the samples of each arc
+    ecc_arc = ecc.T[None].T
+    cos_ta = np.cos(ta_set, out=workspace.array("cos_ta", shape))
+    sin_ta = np.sin(ta_set, out=workspace.array("sin_ta", shape))
+    product = workspace.array("product", shape[:2])
+
+    def rotate(set_E, set_P, out):
+        # out[c] = E[c] * set_E + P[c] * set_P, from the E/P directions to cartesian coordinates
+        for c in range(3):
+            np.multiply(E[:, c], set_E[:, :, 0], out=out[c])
+            np.multiply(P[:, c], set_P[:, :, 0], out=product)
+            out[c] += product
+
+    # generate positions
+    radius = np.multiply(ecc_arc, cos_ta, out=workspace.array("radius", shape))
+    radius += 1.0
+    np.divide(p_arc, radius, out=radius)
+    set_E = np.multiply(radius, cos_ta, out=workspace.array("set_E", shape))  # E direction
+    set_P = np.multiply(radius, sin_ta, out=radius)  # P direction
+    rotate(set_E, set_P, pos_set)
+
+    # generate velocities
+    if vel_set is not None:
+        sqrt_mu_p = np.sqrt(mu / p_arc)
+        np.multiply(-sqrt_mu_p, sin_ta, out=set_E)  # E direction
+        np.add(ecc_arc, cos_ta, out=set_P)
+        np.multiply(sqrt_mu_p, set_P, out=set_P)  # P direction
+        rotate(set_E, set_P, vel_set)
+
+    # generate times
+    if time_flag:
+        dta_set = ta_set[:, 1:, 0] - ta_set[:, :1, 0]  # true anomaly differences
+        time_set[0, :, 0] = t_1[:, 0]  # initial time setting
+        tof = (
+            find_tof(
+                np.transpose(pos_set, axes=[2, 0, 1])[0][None],
+                np.transpose(pos_set, axes=[2, 0, 1])[1:],
+                p,
+                dta_set,
+                mu,
+            )
+            / 86400.0
+        )  # calculate time of flight
+        rev_count = np.floor(dta_set / (2.0 * np.pi))  # count orbits
+        revs_adjust = np.where((tof < 0))  # adjust for TOF algorithm angle wrapping
+        rev_count[revs_adjust] = rev_count[revs_adjust] + 1
+        time_set[0, :, 1:] = 86400.0 * (
+            t_1 / 86400.0 + tof + rev_count * period / 86400.0
+        )  # generate time array
+
+
+def _conic_outputs(shape, time_flag, vel_flag, out, workspace):
+    n, k = shape[:2]
+    if out is not None:
+        pos_set, vel_set, time_set = out
+        expected = [("pos_set", pos_set, (3, n, k))]
+        if vel_flag:
+            expected.append(("vel_set", vel_set, (3, n, k)))
+        if time_flag:
+            expected.append(("time_set", time_set, (1, n, k)))
+        for name, array, array_shape in expected:
+            if array is None or np.shape(array) != array_shape:
+                raise ValueError(f"out {name} must be an array of shape {array_shape}")
+        if not time_flag:
+            time_set = None
+    elif workspace is not None:
+        pos_set = workspace.array("pos_set", (3, n, k))
+        vel_set = workspace.array("vel_set", (3, n, k))
+        time_set = workspace.array("time_set", (1, n, k)) if time_flag else None
+    else:
+        pos_set = np.empty((3, n, k))
+        vel_set = np.empty((3, n, k))
+        time_set = np.zeros((1, n, k))
+    return pos_set, vel_set if vel_flag else None, time_set
+
+
+def conic_sets(
+    E,
+    P,
+    p,
+    ecc,
+    ta_set,
+    mu,
+    t_1,
+    period,
+    time_flag,
+    vel_flag=1,
+    out=None,
+    workspace=None,
+    backend=None,
+):
+    """
+    Evaluate positions, velocities and (optionally) times along a batch of conic arcs.
+    Inputs use the shapes of conic_1point/conic_2point:
+    :inputs:
+    E: Nx3x1 eccentricity unit vectors
+    P: Nx3x1 semi-latus rectum unit vectors
+    p: Nx1 semi parameters of the orbits [km]
+    ecc: Nx1 eccentricities
+    ta_set: NxKx1 true anomaly samples [rad]
+    mu: gravity constant of central body [km3/s2]
+    t_1: Nx1 times of the first samples [s]
+    period: Nx1 orbit periods, 0 for open orbits [s]
+    time_flag: 1 to compute the time at each sample
+    vel_flag: 1 to compute the velocity at each sample
+    out: optional (pos_set, vel_set, time_set) arrays the results are written to. Arrays of
+        quantities that are not requested may be None
+    workspace: optional ConicWorkspace providing the intermediate arrays and, when out is not
+        given, the results. Results are then overwritten by the next use of the workspace
+    backend: "numpy" or "numba" to override the selected backend
+    :return:
+        pos_set: 3xNxK positions
+        vel_set: 3xNxK velocities, None if vel_flag is off
+        time_set: 1xNxK times. None if time_flag is off and out or workspace is given, otherwise
+            zeros as before
+    """
+    shape = np.shape(ta_set)
+    pos_set, vel_set, time_set = _conic_outputs(shape, time_flag, vel_flag, out, workspace)
+    if (backend or _backend) == "numpy":
+        _numpy_conic_sets(
+            E,
+            P,
+            p,
+            ecc,
+            ta_set,
+            mu,
+            np.broadcast_to(t_1, (shape[0], 1)),
+            period,
+            time_flag,
+            pos_set,
+            vel_set,
+            time_set,
+            workspace if workspace is not None else ConicWorkspace(),
+        )
+        return pos_set, vel_set, time_set
+
+    _fill_conic_sets(
+        np.ascontiguousarray(E[:, :, 0], dtype=float),
+        np.ascontiguousarray(P[:, :, 0], dtype=float),
+        np.ascontiguousarray(p[:, 0], dtype=float),
+        np.ascontiguousarray(ecc[:, 0], dtype=float),
+        np.ascontiguousarray(ta_set[:, :, 0], dtype=float),
+        float(mu),
+        np.ascontiguousarray(np.broadcast_to(t_1, (shape[0], 1))[:, 0], dtype=float),
+        np.ascontiguousarray(period[:, 0], dtype=float),
+        bool(time_flag),
+        bool(vel_flag),
+        pos_set,
+        vel_set if vel_set is not None else np.empty((3, 0, 0)),
+        time_set if time_set is not None else np.empty((1, 0, 0)),
+    )
+    return pos_set, vel_set, time_set
+
+
+_backend = _default_backend()
+
+
+def _arc_error(actual, expected) -> float:
+    # Largest deviation of each arc relative to that arc's largest magnitude
+    scale = np.max(np.abs(expected), axis=(0, 2))
+    return float(np.max(np.max(np.abs(actual - expected), axis=(0, 2)) / scale))
+
+
+def check_backends(backend: str = "numba") -> list[str]:
+    """
+    Compare `backend` against the NumPy backend and the documented outputs on the examples of
+    conic_2point. Returns a description of every tolerance that is exceeded.
+    """
+    from vipre_data.computations.conic_2point import conic_2point
+    from vipre_data.computations.fixtures import (
+        CONIC_2POINT_EXAMPLE_1_OUTPUTS,
+        CONIC_2POINT_EXAMPLES,
+        DOCUMENTED_RTOL,
+    )
+
+    failures = []
+    for n, example in enumerate(CONIC_2POINT_EXAMPLES, start=1):
+        expected = conic_2point(**example, backend="numpy")
+        actual = conic_2point(**example, backend=backend)
+        pos_error = _arc_error(actual[0], expected[0])
+        vel_error = _arc_error(actual[1], expected[1])
+        time_error = float(np.max(np.abs(actual[2] - expected[2])))
+        if pos_error > POS_RTOL:
+            failures.append(f"example {n}: {backend} positions differ by {pos_error:.2e}")
+        if vel_error > VEL_RTOL:
+            failures.append(f"example {n}: {backend} velocities differ by {vel_error:.2e}")
+        if time_error > TIME_ATOL:
+            failures.append(f"example {n}: {backend} times differ by {time_error:.2e} s")
+
+    documented = CONIC_2POINT_EXAMPLE_1_OUTPUTS
+    for name in available_backends():
+        pos_set, vel_set, time_set = conic_2point(**CONIC_2POINT_EXAMPLES[0], backend=name)
+        tof = (time_set - time_set[..., :1]) / 86400.0
+        documented_tof = documented["time_set"] - documented["time_set"][..., :1]
+        for label, error in [
+            ("positions", _arc_error(pos_set, documented["pos_set"])),
+            ("velocities", _arc_error(vel_set, documented["vel_set"])),
+            ("times of flight", _arc_error(tof, documented_tof)),
+        ]:
+            if error > DOCUMENTED_RTOL:
+                failures.append(f"example 1: {name} {label} differ from documented by {error:.2e}")
+    return failures
+
+
+if __name__ == "__main__":
+    print(f"Available backends: {available_backends()}, selected: {get_backend()}")
+    if numba is None:
+        print("numba is not installed; checking the uncompiled kernels")
+    problems = check_backends()
+    print("\n".join(problems) if problems else "All backends agree within tolerance")
+    raise SystemExit(1 if problems else 0)
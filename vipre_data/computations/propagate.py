@@ -0,0 +1,82 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+from typing import Optional
+
+import numpy as np
+from numpy import linalg as la
+
+from vipre_data.computations.conic_1point import get_true_anomaly
+from vipre_data.computations.kepler import true_anomaly_at_time
+
+
+def propagate(
+    r_1, v_1, t_1, times, mu: float, vel_flag: int = 1
+) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Propagate states along their conics to arbitrary epochs, for many states and epochs at once.
+    The orbital elements are found as in conic_1point and Kepler's equation is solved for the true
+    anomaly at each epoch (see computations.kepler), for elliptic, parabolic and hyperbolic orbits.
+    :inputs:
+    r_1: Nx3x1 positions at time 1 [km]
+    v_1: Nx3x1 velocities at time 1 [km/s]
+    t_1: Nx1 times of the states [seconds past J2000]
+    times: K epochs shared by all states, or NxK epochs per state [seconds past J2000]. Epochs may
+        precede t_1
+    mu: gravity constant of central body [km3/s2]
+    vel_flag: 1 to also compute the velocities
+    :return:
+    pos_set: 3xNxK positions at the epochs [km]
+    vel_set: 3xNxK velocities at the epochs [km/s], or None when vel_flag is off
+    """
+    h = np.cross(r_1, v_1, axis=1)  # angular momentum vector
+    h_hat = h / la.norm(h, axis=1)[:, None]  # unit vector of h
+    r_hat = r_1 / la.norm(r_1, axis=1)[:, None]  # unit vector of r_1
+    th_hat = np.cross(h_hat, r_hat, axis=1)  # tangential unit vector
+
+    p = la.norm(h, axis=1) ** 2 / mu  # semi latus rectum
+    energy = la.norm(v_1, axis=1) ** 2 / 2.0 - mu / la.norm(r_1, axis=1)  # orbital energy
+    ecc = np.sqrt(1.0 + (2.0 * energy * la.norm(h, axis=1) ** 2) / mu**2)  # eccentricity
+    ta_1 = get_true_anomaly(p, ecc, r_1, v_1)  # true anomaly at time 1
+    # Perifocal unit vectors, rotated back from the radial and tangential directions by ta_1. Unlike
+    # the angles raan, aop and inc used by kep2cart_array, this is also defined for equatorial orbits
+    cos_1, sin_1 = np.cos(ta_1)[:, None], np.sin(ta_1)[:, None]
+    E = cos_1 * r_hat - sin_1 * th_hat  # Nx3x1
+    P = sin_1 * r_hat + cos_1 * th_hat
+
+    times = np.broadcast_to(np.asarray(times, dtype=float), (len(p), np.shape(times)[-1]))
+    ta = true_anomaly_at_time(ta_1, t_1, times, p, ecc, mu)  # NxK
+    cos, sin = np.cos(ta), np.sin(ta)
+    # 3xNx1 unit vectors broadcast against the NxK anomalies
+    E, P = E.transpose(1, 0, 2), P.transpose(1, 0, 2)
+
+    radius = p / (1.0 + ecc * cos)
+    pos_set = radius * (cos * E + sin * P)
+    if not vel_flag:
+        return pos_set, None
+    vel_set = np.sqrt(mu / p) * (-sin * E + (ecc + cos) * P)
+    return pos_set, vel_set
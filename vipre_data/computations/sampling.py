@@ -0,0 +1,168 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+
+# Default tolerances of the adaptive sampling mode
+CHORD_TOL = 1e-3  # maximum chord deviation, relative to the periapsis radius
+ANGLE_TOL = np.deg2rad(1.0)  # maximum turn of the flight direction between samples [rad]
+MIN_STEP = 3  # fewest samples returned for an arc
+RESOLUTION = 256  # true anomaly samples used to integrate the sampling density of each arc
+
+
+def uniform_true_anomaly_set(ta_1, span, ta_step, out=None) -> np.ndarray:
+    """
+    Sample true anomaly evenly between ta_1 and ta_1 + span.
+    Inputs are Nx1 np arrays
+    :inputs:
+    ta_1: true anomaly at the start of each arc [rad]
+    span: change in true anomaly along each arc [rad]
+    ta_step: number of samples
+    out: optional NxKx1 array the samples are written to
+    :return:
+    ta_set: NxKx1 array of true anomalies, K = ta_step
+    """
+    if out is None or ta_step < 2:
+        return np.linspace(np.zeros(np.shape(span)), span, ta_step, axis=1) + ta_1.T[None].T
+
+    # Same arithmetic as np.linspace, so both paths return identical samples
+    div = ta_step - 1
+    samples = np.arange(ta_step, dtype=float)[None, :, None]
+    step = span / div
+    if np.any(step == 0):
+        np.multiply(samples / div, span[:, :, None], out=out)
+    else:
+        np.multiply(samples, step[:, :, None], out=out)
+    out[:, -1] = span
+    out += ta_1[:, :, None]
+    return out
+
+
+def sampling_density(ta, p, ecc, chord_tol=CHORD_TOL, angle_tol=ANGLE_TOL) -> np.ndarray:
+    """
+    Number of samples per radian of true anomaly needed to draw a conic within tolerance.
+
+    A straight segment of length s drawn over an arc of curvature k deviates from it by about
+    k s^2 / 8, so keeping the deviation below d needs sqrt(k / 8d) samples per unit length; keeping
+    the turn of the flight direction below angle_tol needs k / angle_tol. Both are converted to
+    densities in true anomaly with the arc length ds/dta and added.
+    :inputs:
+    ta: true anomaly [rad]
+    p: semi parameter of orbit [km], broadcastable against ta
+    ecc: eccentricity, broadcastable against ta
+    chord_tol: maximum chord deviation, relative to the periapsis radius
+    angle_tol: maximum turn of the flight direction between samples [rad]
+    :return:
+    density: samples per radian of true anomaly
+    """
+    cos_ta = np.cos(ta)
+    w = np.maximum(1.0 + ecc * cos_ta, 1e-12)  # p / r; vanishes on the hyperbolic asymptotes
+    q = 1.0 + ecc**2 + 2.0 * ecc * cos_ta  # (v / v_circular)^2 at the semi parameter
+    ds = p * np.sqrt(q) / w**2  # arc length per radian of true anomaly
+    curvature = w**3 / (p * q**1.5)
+    d_tol = chord_tol * p / (1.0 + ecc)
+    return np.sqrt(curvature / (8.0 * d_tol)) * ds + curvature * ds / angle_tol
+
+
+def adaptive_true_anomaly_set(
+    ta_1,
+    span,
+    p,
+    ecc,
+    ta_step,
+    chord_tol=CHORD_TOL,
+    angle_tol=ANGLE_TOL,
+    min_step=MIN_STEP,
+    resolution=RESOLUTION,
+) -> np.ndarray:
+    """
+    Sample true anomaly between ta_1 and ta_1 + span with spacing adapted to the conic's curvature.
+
+    Samples are equidistributed in `sampling_density`, so they concentrate around periapsis and
+    thin out along the nearly straight legs of a hyperbola. Every arc in the batch receives the same
+    number of samples K: the count needed by the most demanding arc, clipped to [min_step, ta_step].
+    Arcs needing fewer samples therefore exceed the tolerances; if the count is clipped at ta_step
+    the tolerances may not be met.
+    Inputs are Nx1 np arrays
+    :inputs:
+    ta_1: true anomaly at the start of each arc [rad]
+    span: change in true anomaly along each arc [rad]
+    p: semi parameter of orbit [km]
+    ecc: eccentricity
+    ta_step: maximum number of samples
+    chord_tol: maximum chord deviation, relative to the periapsis radius
+    angle_tol: maximum turn of the flight direction between samples [rad]
+    min_step: minimum number of samples
+    resolution: number of true anomaly samples used to integrate the density of each arc
+    :return:
+    ta_set: NxKx1 array of true anomalies
+    """
+    n = np.shape(span)[0]
+    u = np.linspace(0.0, 1.0, resolution)  # fraction of each arc's span
+    ta_fine = ta_1 + span * u  # N x resolution
+    density = sampling_density(ta_fine, p, ecc, chord_tol, angle_tol) * span
+
+    # cumulative sample count along each arc (trapezoid rule)
+    counts = np.zeros((n, resolution))
+    counts[:, 1:] = np.cumsum((density[:, 1:] + density[:, :-1]) / 2.0 * np.diff(u), axis=1)
+    total = counts[:, -1]
+    step = int(np.clip(np.ceil(np.max(total, initial=0.0)) + 1, min_step, ta_step))
+
+    # invert every arc's cumulative count at once by offsetting each row into its own interval
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normalized = np.where(total[:, None] > 0, counts / total[:, None], u)
+    normalized = np.maximum.accumulate(normalized, axis=1)
+    offsets = 2.0 * np.arange(n)[:, None]
+    targets = np.linspace(0.0, 1.0, step) + offsets
+    fractions = np.interp(targets.ravel(), (normalized + offsets).ravel(), np.tile(u, n))
+    fractions = fractions.reshape(n, step)
+    fractions[:, 0], fractions[:, -1] = 0.0, 1.0  # end points are always sampled exactly
+
+    return (ta_1 + span * fractions)[:, :, None]
+
+
+def true_anomaly_set(ta_1, span, p, ecc, ta_step, sampling="uniform", out=None) -> np.ndarray:
+    """
+    Sample true anomaly along a batch of conic arcs.
+    Inputs are Nx1 np arrays
+    :inputs:
+    ta_1: true anomaly at the start of each arc [rad]
+    span: change in true anomaly along each arc [rad]
+    p: semi parameter of orbit [km]
+    ecc: eccentricity
+    ta_step: number of samples ("uniform"), or the maximum number of samples ("adaptive")
+    sampling: "uniform" for even steps in true anomaly or "adaptive" for curvature based steps
+    out: optional NxKx1 array the uniform samples are written to; adaptive samples are always
+        returned in a new array as their number is not known in advance
+    :return:
+    ta_set: NxKx1 array of true anomalies
+    """
+    if sampling == "uniform":
+        return uniform_true_anomaly_set(ta_1, span, ta_step, out)
+    if sampling == "adaptive":
+        return adaptive_true_anomaly_set(ta_1, span, p, ecc, ta_step)
+    raise ValueError(f"Unknown sampling mode: {sampling}")
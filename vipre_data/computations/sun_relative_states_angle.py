@@ -26,24 +26,51 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import numpy as np
-from numpy import linalg as la
 
-def sun_relative_states_angle(R_b_s,R_b_e,R,V):
-	# compute sun and earth relative angles for column vectors
+CHUNK_SIZE = 65536  # columns processed at a time, bounding the size of the temporaries
 
-	# inputs:
-	#    R: position of spacecraft relative to body (assumed to be at time of entry)
-	#    V: Orbital Velocity
-	#    R_b_s: psition from body to sun
-	#    R_b_e:position from body to earth
 
-	# outputs:
-	#    solar_phase: solar phase angle -> angle between Sun-Body line and interplanetary V infinity
-	#    solar_conj: solar conjunction angle -> Sun-Earth-S/C angle
-	#    solar_incidence: solar incidence angle -> angle between sun and entry position 
+def column_angle(a: np.ndarray, b: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    Angle between each pair of column vectors of two 3xN arrays, from their column-wise dot
+    products. Nothing larger than N is ever formed, unlike np.diag(np.dot(a.T, b)), which builds an
+    NxN matrix.
 
-	solar_phase=np.arccos(np.diag(np.dot(R_b_s.T,V))/la.norm(V,axis=0)/la.norm(R_b_s,axis=0));#angle between sun and V
-	solar_conj=np.arccos(np.diag(np.dot(R_b_s.T,R_b_e))/la.norm(R_b_e,axis=0)/la.norm(R_b_s,axis=0));#conjunction angle
-	solar_incidence=np.arccos(np.diag(np.dot(R_b_s.T,R))/la.norm(R,axis=0)/la.norm(R_b_s,axis=0));#angle between sun and entry position
+    :param a: 3xN array of vectors
+    :param b: 3xN array of vectors
+    :param out: optional array of N angles to write into
+    :return: N angles [rad]
+    """
+    cos = np.einsum("ij,ij->j", a, b)
+    cos /= np.sqrt(np.einsum("ij,ij->j", a, a))
+    cos /= np.sqrt(np.einsum("ij,ij->j", b, b))
+    # Rounding can push the cosine of (anti)parallel vectors just past +-1
+    np.clip(cos, -1.0, 1.0, out=cos)
+    return np.arccos(cos, out=out)
 
-	return(solar_phase,solar_conj,solar_incidence)
\ No newline at end of file
+
+def sun_relative_states_angle(
+    R_b_s: np.ndarray, R_b_e: np.ndarray, R: np.ndarray, V: np.ndarray, chunk_size: int = CHUNK_SIZE
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute sun and earth relative angles for column vectors, CHUNK_SIZE columns at a time.
+
+    :param R_b_s: 3xN positions from body to sun
+    :param R_b_e: 3xN positions from body to earth
+    :param R: 3xN positions of spacecraft relative to body (assumed to be at time of entry)
+    :param V: 3xN orbital velocities
+    :param chunk_size: number of columns processed at a time
+    :return:
+        solar_phase: solar phase angle -> angle between Sun-Body line and interplanetary V infinity
+        solar_conj: solar conjunction angle -> Sun-Earth-S/C angle
+        solar_incidence: solar incidence angle -> angle between sun and entry position
+    """
+    n = np.shape(R_b_s)[1]
+    solar_phase, solar_conj, solar_incidence = np.empty((3, n))
+    for start in range(0, n, chunk_size):
+        cols = slice(start, start + chunk_size)
+        sun = R_b_s[:, cols]
+        column_angle(sun, V[:, cols], out=solar_phase[cols])  # angle between sun and V
+        column_angle(sun, R_b_e[:, cols], out=solar_conj[cols])  # conjunction angle
+        column_angle(sun, R[:, cols], out=solar_incidence[cols])  # angle between sun and entry
+    return solar_phase, solar_conj, solar_incidence
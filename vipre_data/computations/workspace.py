@@ -0,0 +1,86 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+import numpy as np
+
+
+class ConicWorkspace:
+    """
+    Named scratch buffers reused by the conic kernels across calls.
+
+    `array` returns a view of the named buffer with the requested shape, growing the buffer (to the
+    next power of two elements) only when it is too small. Arrays handed out by a workspace are
+    overwritten by the next call that uses it, so results must be consumed or copied first.
+    """
+
+    def __init__(self):
+        self._buffers: dict[str, np.ndarray] = {}
+
+    def array(self, name: str, shape: tuple) -> np.ndarray:
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = self._buffers[name] = np.empty(1 << max(size - 1, 0).bit_length())
+        return buffer[:size].reshape(shape)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self._buffers.values())
+
+
+class WorkspacePool:
+    """
+    Thread safe pool of workspaces shared by concurrent requests.
+
+    At most `size` idle workspaces are kept, and workspaces that grew past `max_bytes` are dropped
+    on release so that a single very large request does not pin its buffers.
+    """
+
+    def __init__(self, size: int = 8, max_bytes: int = 64 * 2**20):
+        self.size = size
+        self.max_bytes = max_bytes
+        self._idle: list[ConicWorkspace] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self) -> Iterator[ConicWorkspace]:
+        with self._lock:
+            workspace = self._idle.pop() if self._idle else ConicWorkspace()
+        try:
+            yield workspace
+        finally:
+            if workspace.nbytes <= self.max_bytes:
+                with self._lock:
+                    if len(self._idle) < self.size:
+                        self._idle.append(workspace)
+
+
+pool = WorkspacePool()
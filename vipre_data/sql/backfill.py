@@ -0,0 +1,214 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Fill in derived columns of databases written before vipre-gen produced them
+
+Each backfill computes a group of columns from states already stored in the database, for the
+rows where any of them is missing (or for every row with --overwrite). Rows are processed in
+chunks of CHUNK_SIZE, each in its own transaction, so an interrupted backfill can be resumed.
+
+Usage:
+    python -m vipre_data.sql.backfill path/to/database.db {bplane,solar_angles} [--overwrite]
+"""
+
+import argparse
+import logging
+import typing as t
+
+import numpy as np
+from sqlalchemy import Table, bindparam, create_engine, or_, select
+from sqlalchemy.engine import Engine
+
+from vipre_data.computations.entry import b_plane
+from vipre_data.computations.sun_relative_states_angle import sun_relative_states_angle
+from vipre_data.sql import models
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+
+
+def _xyz(rows: list[t.Mapping], prefix: str) -> np.ndarray:
+    # Nx3 array of the "<prefix>_{x,y,z}" columns of the rows, with nan for nulls
+    return np.array([[row[f"{prefix}_{i}"] for i in "xyz"] for row in rows], dtype=float)
+
+
+def _bplane(rows: list[t.Mapping]) -> dict[str, np.ndarray]:
+    theta, mag = b_plane(
+        _xyz(rows, "v_inf_arr"),
+        _xyz(rows, "pos_entry"),
+        _xyz(rows, "vel_entry"),
+        _xyz(rows, "pole_vec"),
+    )
+    return {"bvec_theta": theta, "bvec_mag": mag}
+
+
+def _entry_solar_angles(rows: list[t.Mapping]) -> dict[str, np.ndarray]:
+    # Like the entry position, the sun and earth positions at entry are relative to the target
+    angles = sun_relative_states_angle(
+        R_b_s=_xyz(rows, "pos_sun_entry").T,
+        R_b_e=_xyz(rows, "pos_earth_entry").T,
+        R=_xyz(rows, "pos_entry").T,
+        V=_xyz(rows, "v_inf_arr").T,
+    )
+    return dict(zip(SOLAR_ANGLES, angles))
+
+
+def _trajectory_solar_angles(rows: list[t.Mapping]) -> dict[str, np.ndarray]:
+    # Arrival positions are heliocentric
+    target = _xyz(rows, "pos_target_arr")
+    angles = sun_relative_states_angle(
+        R_b_s=-target.T,
+        R_b_e=(_xyz(rows, "pos_earth_arr") - target).T,
+        R=(_xyz(rows, "pos_sc_arr") - target).T,
+        V=_xyz(rows, "v_inf_arr").T,
+    )
+    return dict(zip(SOLAR_ANGLES, angles))
+
+
+class Backfill(t.NamedTuple):
+    table: Table
+    columns: list[str]
+    # Columns selected as input, from the table joined with its trajectory and body
+    inputs: list
+    compute: t.Callable[[list[t.Mapping]], dict[str, np.ndarray]]
+
+
+def _xyz_columns(table: Table, prefix: str) -> list:
+    return [table.c[f"{prefix}_{i}"] for i in "xyz"]
+
+
+_entry = models.Entry.__table__
+_trajectory = models.Trajectory.__table__
+_body = models.Body.__table__
+
+SOLAR_ANGLES = ["solar_phase_angle", "solar_conj_angle", "solar_incidence_angle"]
+
+BACKFILLS: dict[str, list[Backfill]] = {
+    "bplane": [
+        Backfill(
+            table=_entry,
+            columns=["bvec_theta", "bvec_mag"],
+            inputs=_xyz_columns(_trajectory, "v_inf_arr")
+            + _xyz_columns(_entry, "pos_entry")
+            + _xyz_columns(_entry, "vel_entry")
+            + _xyz_columns(_body, "pole_vec"),
+            compute=_bplane,
+        )
+    ],
+    "solar_angles": [
+        Backfill(
+            table=_entry,
+            columns=SOLAR_ANGLES,
+            inputs=_xyz_columns(_trajectory, "v_inf_arr")
+            + _xyz_columns(_entry, "pos_entry")
+            + _xyz_columns(_entry, "pos_sun_entry")
+            + _xyz_columns(_entry, "pos_earth_entry"),
+            compute=_entry_solar_angles,
+        ),
+        Backfill(
+            table=_trajectory,
+            columns=SOLAR_ANGLES,
+            inputs=_xyz_columns(_trajectory, "v_inf_arr")
+            + _xyz_columns(_trajectory, "pos_target_arr")
+            + _xyz_columns(_trajectory, "pos_earth_arr")
+            + _xyz_columns(_trajectory, "pos_sc_arr"),
+            compute=_trajectory_solar_angles,
+        ),
+    ],
+}
+
+
+def _source(table: Table):
+    # The table joined with the rows its inputs may come from
+    if table is _entry:
+        return _entry.join(_trajectory, _entry.c.trajectory_id == _trajectory.c.id).join(
+            _body, _entry.c.body_id == _body.c.id
+        )
+    return table
+
+
+def backfill(engine: Engine, name: str, overwrite: bool = False) -> int:
+    """Compute the columns of a backfill in `BACKFILLS` for every row missing any of them
+
+    :param engine: database to update
+    :param name: which backfill to run
+    :param overwrite: recompute the columns of every row, not only of those missing values
+    :return: number of rows updated
+    """
+    return sum(_backfill_table(engine, name, spec, overwrite) for spec in BACKFILLS[name])
+
+
+def _backfill_table(engine: Engine, name: str, spec: Backfill, overwrite: bool) -> int:
+    table = spec.table
+    query = select(table.c.id, *spec.inputs).select_from(_source(table))
+    if not overwrite:
+        query = query.where(or_(*(table.c[column].is_(None) for column in spec.columns)))
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("row_id"))
+        .values({column: bindparam(column) for column in spec.columns})
+    )
+
+    updated, last_id = 0, None
+    while True:
+        # Rows are paged by ID rather than streamed, since updated rows drop out of the query
+        page = query if last_id is None else query.where(table.c.id > last_id)
+        with engine.begin() as conn:
+            rows = conn.execute(page.order_by(table.c.id).limit(CHUNK_SIZE)).mappings().all()
+            if not rows:
+                return updated
+            values = spec.compute(rows)
+            conn.execute(
+                update,
+                [
+                    {
+                        "row_id": row["id"],
+                        # Rows missing some of the inputs are left without values
+                        **{c: None if np.isnan(v[i]) else float(v[i]) for c, v in values.items()},
+                    }
+                    for i, row in enumerate(rows)
+                ],
+            )
+        updated += len(rows)
+        last_id = rows[-1]["id"]
+        logger.info("Backfilled %s of %d %s rows", name, updated, table.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("database", help="path to the database to update")
+    parser.add_argument("backfill", choices=sorted(BACKFILLS), help="columns to compute")
+    parser.add_argument(
+        "--overwrite", action="store_true", help="recompute the columns of rows that have them"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    count = backfill(create_engine(f"sqlite:///{args.database}"), args.backfill, args.overwrite)
+    print(f"Updated {count} rows")
@@ -25,13 +25,17 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import logging
 from typing import Optional, Union, Type
 
-from sqlalchemy.orm import Query, Session
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Query, Session, joinedload
 
 from vipre_data.app import schemas
 from vipre_data.sql import models
 
+logger = logging.getLogger(__name__)
+
 filter_fields_map: dict[str, set] = {
     "Trajectory": schemas.utils.trajectory_filter_fields,
     "Entry": schemas.utils.entry_filter_fields,
@@ -56,8 +60,8 @@ def make_query(
         # Ensure that all requested filter field_names are valid
         filter_fields = filter_fields_map.get(model.__name__, set())
         if f.field_name not in filter_fields:
-            # TODO: should probably emit an error or at least a warning here
-            print("INVALID FIELD_NAME; SKIPPING FILTER ", f.field_name)
+            # TODO: should probably emit an error here
+            logger.warning("Invalid field_name, skipping filter %s", f.field_name)
             continue
 
         # Need to fetch the ORM column dynamically based on string field_name
@@ -77,7 +81,7 @@ def make_query(
     # TODO: Is limiting rows going to be a problem? Do we need paging?
     if limit:
         query = query.limit(limit)  # Limit number of rows returned
-    print(str(query))
+    logger.debug("%s", query)
     return query
 
 
@@ -97,10 +101,78 @@ def count_trajectory_entries(db: Session, trajectory_id: int) -> int:
     return db.query(models.Entry).where(models.Entry.trajectory_id == trajectory_id).count()
 
 
+def get_entry_ids(
+    db: Session, trajectory_id: Optional[int] = None, body_id: Optional[int] = None
+) -> list[int]:
+    """IDs of the entries of a trajectory and/or at a target body, in ascending order"""
+    query: Query = db.query(models.Entry.id)
+    if trajectory_id is not None:
+        query = query.where(models.Entry.trajectory_id == trajectory_id)
+    if body_id is not None:
+        query = query.where(models.Entry.body_id == body_id)
+    return [entry_id for entry_id, in query.order_by(models.Entry.id)]
+
+
 def get_entry(db: Session, entry_id: int) -> models.Entry:
     return db.query(models.Entry).where(models.Entry.id == entry_id).first()
 
 
+def get_entries(db: Session, entry_ids: list[int]) -> list[models.Entry]:
+    query: Query = (
+        db.query(models.Entry)
+        .options(joinedload(models.Entry.target_body))
+        .where(models.Entry.id.in_(entry_ids))
+    )
+    return query.all()
+
+
+def get_trajectories(db: Session, trajectory_ids: list[int]) -> dict[int, models.Trajectory]:
+    """Fetch many trajectories at once, keyed by trajectory ID"""
+    query: Query = db.query(models.Trajectory).where(models.Trajectory.id.in_(trajectory_ids))
+    return {t.id: t for t in query.all()}
+
+
+def get_trajectory_flybys(db: Session, trajectory_id: int) -> list[models.Flyby]:
+    """Fetch the flybys of a trajectory with their bodies, in flyby order"""
+    query: Query = (
+        db.query(models.Flyby)
+        .options(joinedload(models.Flyby.flyby_body))
+        .where(models.Flyby.trajectory_id == trajectory_id)
+        .order_by(models.Flyby.order)
+    )
+    return query.all()
+
+
+def get_divert_maneuvers(db: Session, entry_ids: list[int]) -> dict[int, models.Maneuver]:
+    """Fetch the divert maneuver of each entry, keyed by entry ID"""
+    query: Query = (
+        db.query(models.Maneuver)
+        .where(models.Maneuver.entry_id.in_(entry_ids))
+        .where(models.Maneuver.maneuver_type == "divert")
+        .order_by(models.Maneuver.id.desc())
+    )
+    # Iterating in descending ID order keeps the first divert maneuver of each entry
+    return {m.entry_id: m for m in query.all()}
+
+
+def get_final_datarates(db: Session, entry_ids: list[int]) -> dict[int, models.Datarate]:
+    """Fetch the last datarate in the time series of each entry, keyed by entry ID"""
+    last = (
+        db.query(models.Datarate.entry_id, func.max(models.Datarate.order).label("order"))
+        .where(models.Datarate.entry_id.in_(entry_ids))
+        .group_by(models.Datarate.entry_id)
+        .subquery()
+    )
+    query: Query = db.query(models.Datarate).join(
+        last,
+        and_(
+            models.Datarate.entry_id == last.c.entry_id,
+            models.Datarate.order == last.c.order,
+        ),
+    )
+    return {d.entry_id: d for d in query.all()}
+
+
 def count_body_trajectories(db: Session, target_body_id) -> int:
     return db.query(models.Trajectory).where(models.Trajectory.body_id == target_body_id).count()
 
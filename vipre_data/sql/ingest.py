@@ -0,0 +1,224 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Append newly generated trajectory runs to an existing database
+
+`vipre-gen` writes each batch of runs to its own database with IDs starting from 1. Rather than
+regenerating the served database from scratch, this module copies the rows of such a batch into an
+existing database, shifting every primary and foreign key past the IDs already in use. Bodies are
+keyed by their NASA Horizons ID and are only inserted when missing; architectures are matched on
+their flyby sequence so that repeated sequences reuse the existing row.
+
+Usage:
+    python -m vipre_data.sql.ingest path/to/served.db path/to/new_runs.db [--notify URL]
+"""
+
+import argparse
+import json
+import logging
+import urllib.request
+from typing import Optional
+
+from sqlalchemy import Table, create_engine, func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from vipre_data.sql import models
+from vipre_data.sql.manifest import database_checksum, make_manifest, write_manifest
+from vipre_data.sql.validate_db import is_sane_database
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+
+# Foreign keys that must be shifted along with the parent table's IDs, in dependency order.
+# body_id columns are intentionally absent: body IDs are Horizons IDs and are never remapped.
+APPEND_TABLES: dict[str, dict[str, str]] = {
+    "architecture": {},
+    "trajectory": {"architecture_id": "architecture"},
+    "flyby": {"trajectory_id": "trajectory"},
+    "occultation": {"trajectory_id": "trajectory"},
+    "entry": {"trajectory_id": "trajectory"},
+    "maneuver": {"entry_id": "entry"},
+    "datarate": {"entry_id": "entry"},
+}
+
+
+def _table(name: str) -> Table:
+    return models.Base.metadata.tables[name]
+
+
+def _id_range(conn: Connection, table: Table) -> tuple[Optional[int], Optional[int]]:
+    return conn.execute(select(func.min(table.c.id), func.max(table.c.id))).one()
+
+
+def _append_bodies(source: Connection, target: Connection) -> int:
+    """Insert bodies referenced by the new runs that are not yet present in the target"""
+    body = _table("body")
+    existing = set(target.execute(select(body.c.id)).scalars())
+    rows = [dict(r) for r in source.execute(select(body)).mappings() if r["id"] not in existing]
+    if rows:
+        target.execute(body.insert(), rows)
+    return len(rows)
+
+
+def _architecture_map(source: Connection, target: Connection) -> tuple[dict[int, int], int]:
+    """Map source architecture IDs onto target IDs, inserting sequences that are not yet present"""
+    arch = _table("architecture")
+    by_sequence = {r.sequence: r.id for r in target.execute(select(arch.c.id, arch.c.sequence))}
+    next_id = (_id_range(target, arch)[1] or 0) + 1
+    mapping, new_rows = {}, []
+    for row in source.execute(select(arch.c.id, arch.c.sequence).order_by(arch.c.id)):
+        if row.sequence not in by_sequence:
+            by_sequence[row.sequence] = next_id
+            new_rows.append({"id": next_id, "sequence": row.sequence})
+            next_id += 1
+        mapping[row.id] = by_sequence[row.sequence]
+    if new_rows:
+        target.execute(arch.insert(), new_rows)
+    return mapping, len(new_rows)
+
+
+def _check_parents(source: Connection) -> None:
+    """Ensure that the rows of every table come with the rows of the tables they reference"""
+    empty = {name for name in APPEND_TABLES if _id_range(source, _table(name))[0] is None}
+    for name, foreign_keys in APPEND_TABLES.items():
+        for column, parent in foreign_keys.items():
+            if name not in empty and parent in empty:
+                raise ValueError(
+                    f"Rows of {name} reference {parent} through {column}, but the source database "
+                    f"has no {parent} rows; runs must be appended together with their {parent}"
+                )
+
+
+def append_database(target: Engine, source: Engine) -> dict:
+    """Append all runs stored in `source` to the `target` database.
+
+    The append happens in a single transaction; if any key collides (e.g. another process wrote to
+    the target concurrently) the transaction is rolled back and the target is left untouched.
+
+    :param target: engine for the database being served
+    :param source: engine for the database holding the new runs
+    :return: change manifest describing the inserted rows
+    """
+    for engine in (target, source):
+        with Session(bind=engine) as session:
+            if not is_sane_database(models.Base, session):
+                raise ValueError(f"Database does not match the data model: {engine.url.database}")
+    with source.connect() as src:
+        _check_parents(src)
+
+    checksum_before = database_checksum(target)
+    summary: dict[str, dict] = {}
+    body_ids: set[int] = set()
+
+    with source.connect() as src, target.begin() as dst:
+        summary["body"] = {"inserted": _append_bodies(src, dst)}
+        arch_map, n_arch = _architecture_map(src, dst)
+        summary["architecture"] = {"inserted": n_arch}
+
+        shifts: dict[str, int] = {}
+        for name, foreign_keys in APPEND_TABLES.items():
+            if name == "architecture":
+                continue
+            table = _table(name)
+            src_min, src_max = _id_range(src, table)
+            if src_min is None:
+                summary[name] = {"inserted": 0}
+                continue
+            dst_max = _id_range(dst, table)[1] or 0
+            shifts[name] = dst_max + 1 - src_min
+
+            inserted = 0
+            result = src.execution_options(stream_results=True).execute(
+                select(table).order_by(table.c.id)
+            )
+            for chunk in result.mappings().partitions(CHUNK_SIZE):
+                rows = []
+                for row in chunk:
+                    row = dict(row)
+                    row["id"] += shifts[name]
+                    for column, parent in foreign_keys.items():
+                        if row[column] is None:
+                            continue
+                        if parent == "architecture":
+                            row[column] = arch_map[row[column]]
+                        else:
+                            row[column] += shifts[parent]
+                    if name in ("trajectory", "entry") and row["body_id"] is not None:
+                        body_ids.add(row["body_id"])
+                    rows.append(row)
+                dst.execute(table.insert(), rows)
+                inserted += len(rows)
+
+            summary[name] = {
+                "inserted": inserted,
+                "first_id": src_min + shifts[name],
+                "last_id": src_max + shifts[name],
+            }
+            logger.info("Appended %d rows to %s", inserted, name)
+
+    target.dispose()  # Release the file so the checksum reflects the committed contents
+    return make_manifest(
+        target,
+        source=str(source.url.database),
+        checksum_before=checksum_before,
+        checksum_after=database_checksum(target),
+        tables=summary,
+        body_ids=list(body_ids),
+    )
+
+
+def notify(manifest: dict, server: str) -> None:
+    """Post a manifest to a running vipre-data server so it can invalidate affected caches"""
+    request = urllib.request.Request(
+        f"{server.rstrip('/')}/database/manifest",
+        data=json.dumps(manifest).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        logger.info("Server acknowledged manifest: %s", response.read().decode())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("target", help="path to the existing database to append to")
+    parser.add_argument("source", help="path to the database holding the new runs")
+    parser.add_argument("--manifest", help="where to write the change manifest")
+    parser.add_argument("--notify", help="base URL of a running server to send the manifest to")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    manifest = append_database(
+        create_engine(f"sqlite:///{args.target}"), create_engine(f"sqlite:///{args.source}")
+    )
+    path = write_manifest(manifest, args.manifest)
+    print(f"Wrote change manifest to {path}")
+    if args.notify:
+        notify(manifest, args.notify)
@@ -0,0 +1,151 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Change manifests describing rows appended to an existing database
+
+A manifest is written by the append ingest (see `vipre_data.sql.ingest`) and records which tables
+and ID ranges were inserted, along with the database checksum before and after the append. Serving
+processes use it to invalidate only the cached results affected by the new rows rather than being
+restarted.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Union
+
+from sqlalchemy.engine import URL, Engine, make_url
+
+MANIFEST_VERSION = 1
+
+# Number of bytes read from each end of a SQLite file when computing its checksum
+_CHECKSUM_SAMPLE_BYTES = 64 * 1024
+
+# Latest checksum computed for each file, as (size, modification time, checksum), so that repeated
+# lookups of an unchanged file only cost a stat() call
+_checksums: dict[Path, tuple[int, int, str]] = {}
+
+
+def database_path(database: Union[str, URL, Engine]) -> Optional[Path]:
+    """Resolve the file backing a SQLite database, or None for any other kind of database"""
+    if isinstance(database, Engine):
+        database = database.url
+    url = make_url(database)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return Path(url.database).absolute()
+
+
+def database_checksum(database: Union[str, URL, Engine]) -> str:
+    """Compute a cheap checksum identifying the current contents of a database.
+
+    For SQLite files this hashes the file size together with the first and last pages of the file.
+    The first page holds the SQLite header, including the file change counter that is incremented
+    by every committed write, so any append produces a new checksum without reading the whole file.
+    Other databases fall back to a hash of the connection URL.
+
+    :param database: SQLAlchemy URL (or string) or Engine for the database
+    :return: hex digest identifying the database contents
+    """
+    path = database_path(database)
+    digest = hashlib.sha1()
+    if path is None or not path.exists():
+        url = database.url if isinstance(database, Engine) else make_url(database)
+        digest.update(url.render_as_string(hide_password=True).encode())
+        return digest.hexdigest()
+
+    stat = path.stat()
+    size = stat.st_size
+    memo = _checksums.get(path)
+    if memo is not None and memo[:2] == (size, stat.st_mtime_ns):
+        return memo[2]
+
+    digest.update(str(size).encode())
+    with path.open("rb") as f:
+        digest.update(f.read(_CHECKSUM_SAMPLE_BYTES))
+        if size > _CHECKSUM_SAMPLE_BYTES:
+            f.seek(max(size - _CHECKSUM_SAMPLE_BYTES, _CHECKSUM_SAMPLE_BYTES))
+            digest.update(f.read())
+    checksum = digest.hexdigest()
+    _checksums[path] = (size, stat.st_mtime_ns, checksum)
+    return checksum
+
+
+def make_manifest(
+    database: Union[str, URL, Engine],
+    source: str,
+    checksum_before: str,
+    checksum_after: str,
+    tables: dict[str, dict],
+    body_ids: list[int],
+) -> dict:
+    """Assemble a change manifest describing a completed append.
+
+    :param database: the database that was appended to
+    :param source: description (typically a path) of where the new rows came from
+    :param checksum_before: `database_checksum` of the database before the append
+    :param checksum_after: `database_checksum` of the database after the append
+    :param tables: per-table summary of inserted rows; {"inserted": n, "first_id": a, "last_id": b}
+    :param body_ids: IDs of the target bodies whose trajectories or entries were appended
+    :return: JSON-serializable manifest
+    """
+    path = database_path(database)
+    return {
+        "version": MANIFEST_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "database": str(path) if path else str(database),
+        "source": source,
+        "checksum_before": checksum_before,
+        "checksum_after": checksum_after,
+        "tables": tables,
+        "body_ids": sorted(body_ids),
+    }
+
+
+def write_manifest(manifest: dict, path: Optional[Union[str, Path]] = None) -> Path:
+    """Write a manifest to disk, by default next to the database with a timestamped name"""
+    if path is None:
+        database = Path(manifest["database"])
+        stamp = datetime.fromisoformat(manifest["created"]).strftime("%Y%m%dT%H%M%S")
+        path = database.with_name(f"{database.stem}.{stamp}.manifest.json")
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)  # Readers never see a partially written manifest
+    return path
+
+
+def read_manifest(path: Union[str, Path]) -> dict:
+    with Path(path).open() as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+    return manifest
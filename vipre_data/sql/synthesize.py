@@ -0,0 +1,569 @@
+# Copyright (c) 2021-2023 California Institute of Technology ("Caltech"). U.S.
+# Government sponsorship acknowledged.
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# * Neither the name of Caltech nor its operating division, the Jet Propulsion
+#   Laboratory, nor the names of its contributors may be used to endorse or
+#   promote products derived from this software without specific prior written
+#   permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Generate synthetic VIPRE databases for scale and load testing
+
+The generated database has the schema of `vipre_data.sql.models` and is filled with physically
+plausible rows: bodies come from a catalog of planets and moons, arrival states lie on the
+hyperbolas of their trajectory's arrival v-infinity (so that their B-plane values match the stored
+ones), flybys turn their v-infinity by the angle of their altitude, and maneuver states are the
+entry states propagated back to the time of the maneuver. The output only depends on the counts and
+the seed.
+
+Rows are written with bulk inserts in chunks of CHUNK_SIZE entries (along with their maneuvers and
+datarates) and the indexes are built once every row is in, so that millions of entries are
+generated within minutes.
+
+Usage:
+    python -m vipre_data.sql.synthesize path/to/new.db [--trajectories N] [--entries N] [--seed S]
+"""
+
+import argparse
+import logging
+import typing as t
+from pathlib import Path
+
+import numpy as np
+from numpy import linalg as la
+from sqlalchemy import Table, create_engine
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+from vipre_data.computations.body_fixed import BodyRotation, inertial_to_body_fixed
+from vipre_data.computations.cart2sph import cart2sph
+from vipre_data.computations.propagate import propagate
+from vipre_data.computations.sun_relative_states_angle import sun_relative_states_angle
+from vipre_data.sql import models
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 20000  # entries (or trajectories) generated and inserted at a time
+
+DAY = 86400.0
+AU = 1.495978707e8  # [km]
+OBLIQUITY = np.deg2rad(23.4392911)  # of the ecliptic at J2000, from EME2000 to EMO2000
+LAUNCH_WINDOW = (7.9e8, 1.42e9)  # 2025 to 2045 [seconds past J2000]
+TIME_OF_FLIGHT = (4.0 * 365.25 * DAY, 15.0 * 365.25 * DAY)
+V_INF_ARR = (3.0, 12.0)  # [km/s]
+V_INF_FLYBY = (5.0, 15.0)  # [km/s]
+ENTRY_DELAY = (0.0, 30.0 * DAY)  # from arrival to entry
+MANEUVER_LEAD = (10.0 * DAY, 60.0 * DAY)  # from maneuver to entry
+DATARATE_STEP = 60  # [s]
+MANEUVER_TYPES = ["divert", "trim"]
+CARRIER_ORBITS = ["flyby", "orbiter"]
+LAUNCH_BODY = 399
+
+
+class BodyConstants(t.NamedTuple):
+    id: int  # NASA Horizons ID
+    name: str
+    radius: float  # [km]
+    mu: float  # [km3/s2]
+    period: float  # rotational period [days], negative for retrograde rotation
+    pole_ra: float  # right ascension of the spin pole in EME2000 [deg]
+    pole_dec: float  # declination of the spin pole in EME2000 [deg]
+    sma: float  # semi-major axis of the heliocentric orbit [km]
+    interface: float  # altitude of the atmospheric entry interface [km]
+
+
+BODIES: list[BodyConstants] = [
+    BodyConstants(
+        799, "Uranus", 25559.0, 5793939.0, -0.71833, 257.311, -15.175, 19.19 * AU, 1000.0
+    ),
+    BodyConstants(899, "Neptune", 24764.0, 6836529.0, 0.67125, 299.36, 43.46, 30.07 * AU, 1000.0),
+    BodyConstants(699, "Saturn", 60268.0, 37931187.0, 0.44401, 40.589, 83.537, 9.537 * AU, 1000.0),
+    BodyConstants(
+        599, "Jupiter", 71492.0, 126686534.0, 0.41354, 268.057, 64.495, 5.204 * AU, 1000.0
+    ),
+    BodyConstants(606, "Titan", 2574.7, 8978.1, 15.945, 39.4827, 83.4279, 9.537 * AU, 1000.0),
+    BodyConstants(299, "Venus", 6051.8, 324859.0, -243.0226, 272.76, 67.16, 0.7233 * AU, 200.0),
+    BodyConstants(499, "Mars", 3389.5, 42828.37, 1.02596, 317.681, 52.887, 1.5237 * AU, 125.0),
+]
+
+
+class Counts(t.NamedTuple):
+    bodies: int = 2  # first bodies of BODIES
+    architectures: int = 4
+    trajectories: int = 1000
+    entries: int = 20  # per trajectory
+    maneuvers: int = 1  # per entry
+    datarates: int = 20  # per entry
+    flybys: int = 2  # most flybys in an architecture's sequence
+    occultations: int = 1  # per trajectory
+
+
+# Independent random streams, so that changing one count does not change the other tables
+_STREAMS = ["architecture", "trajectory", "entry"]
+
+
+def _rng(seed: int, stream: str, *keys: int) -> np.random.Generator:
+    return np.random.default_rng([seed, _STREAMS.index(stream), *keys])
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / la.norm(vectors, axis=-1, keepdims=True)
+
+
+def _directions(rng: np.random.Generator, n: int) -> np.ndarray:
+    # Nx3 unit vectors distributed uniformly over the sphere
+    return _unit(rng.standard_normal((n, 3)))
+
+
+def _pole(body: BodyConstants) -> np.ndarray:
+    # Spin pole unit vector rotated from EME2000 into EMO2000
+    ra, dec = np.deg2rad(body.pole_ra), np.deg2rad(body.pole_dec)
+    x, y, z = np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)
+    cos, sin = np.cos(OBLIQUITY), np.sin(OBLIQUITY)
+    return np.array([x, cos * y + sin * z, cos * z - sin * y])
+
+
+def _xyz(prefix: str, vectors: np.ndarray) -> dict[str, np.ndarray]:
+    return {f"{prefix}_{axis}": vectors[:, i] for i, axis in enumerate("xyz")}
+
+
+def _spherical(prefix: str, vectors: np.ndarray, names=("mag", "dec", "ra")) -> dict:
+    # Magnitude, declination and right ascension [deg] columns of Nx3 vectors
+    return dict(zip((f"{prefix}_{name}" for name in names), cart2sph(*vectors.T)))
+
+
+def _lat_lon(vectors: np.ndarray, times: np.ndarray, body_ids: np.ndarray, bodies: dict) -> tuple:
+    # Body-fixed latitudes and longitudes [deg] of Nx3 inertial vectors at their times
+    fixed = np.empty((3, len(vectors)))
+    for body_id in np.unique(body_ids):
+        rows = body_ids == body_id
+        body = bodies[body_id]
+        rotation = BodyRotation(_pole(body), body.period)
+        fixed[:, rows] = inertial_to_body_fixed(
+            vectors[rows].T[:, :, None], times[rows][:, None], rotation
+        )[:, :, 0]
+    _, lat, lon = cart2sph(*fixed)
+    return lat, lon
+
+
+def arrival_states(
+    v_inf: np.ndarray, theta: np.ndarray, r_p: np.ndarray, r_entry: np.ndarray, mu, pole
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Entry states on the inbound legs of arrival hyperbolas, for many arrivals at once.
+
+    The hyperbola is set by its incoming asymptote S (along v_inf), its periapsis radius and the
+    direction of its B vector in the B-plane, with the axes of `entry.b_plane`.
+
+    :param v_inf: Nx3 arrival v-infinity vectors [km/s]
+    :param theta: N angles of the B vectors from the T axis towards the R axis [rad]
+    :param r_p: N periapsis radii, below the entry radii [km]
+    :param r_entry: N radii of the entry interface [km]
+    :param mu: gravity constants of the bodies, scalar or N [km3/s2]
+    :param pole: 3 or Nx3 spin pole unit vectors of the bodies
+    :return:
+        pos: Nx3 positions at entry [km]
+        vel: Nx3 velocities at entry [km/s]
+        flight_path_angle: N flight path angles at entry [deg]
+        bvec_mag: N magnitudes of the B vectors [km]
+    """
+    v_mag = la.norm(v_inf, axis=1)
+    s_hat = v_inf / v_mag[:, None]
+    t_hat = _unit(np.cross(s_hat, np.broadcast_to(pole, s_hat.shape)))
+    r_hat = np.cross(s_hat, t_hat)
+    b_hat = np.cos(theta)[:, None] * t_hat + np.sin(theta)[:, None] * r_hat
+    h_hat = np.cross(b_hat, s_hat)  # so that S x h is along B
+
+    ecc = 1.0 + r_p * v_mag**2 / mu
+    p = r_p * (1.0 + ecc)
+    # The incoming asymptote is (1, sqrt(ecc^2 - 1)) / ecc in the perifocal frame (P, Q)
+    ux, uy = 1.0 / ecc, np.sqrt(ecc**2 - 1.0) / ecc
+    p_hat = ux[:, None] * s_hat - uy[:, None] * np.cross(h_hat, s_hat)
+    q_hat = np.cross(h_hat, p_hat)
+
+    ta = -np.arccos((p / r_entry - 1.0) / ecc)  # inbound, before periapsis
+    cos, sin = np.cos(ta)[:, None], np.sin(ta)[:, None]
+    pos = r_entry[:, None] * (cos * p_hat + sin * q_hat)
+    vel = np.sqrt(mu / p)[:, None] * (-sin * p_hat + (ecc[:, None] + cos) * q_hat)
+    flight_path_angle = np.rad2deg(np.arctan2(ecc * sin[:, 0], 1.0 + ecc * cos[:, 0]))
+    bvec_mag = r_p * np.sqrt(1.0 + 2.0 * mu / (r_p * v_mag**2))
+    return pos, vel, flight_path_angle, bvec_mag
+
+
+def _insert(conn: Connection, table: Table, columns: dict[str, t.Any]) -> int:
+    # Bulk insert columns of equal length, as plain tuples to skip the per-row parameter handling
+    names = [column.name for column in table.columns if column.name in columns]
+    statement = table.insert().compile(dialect=conn.dialect, column_keys=names)
+    values = [np.asarray(columns[name]).tolist() for name in names]
+    rows = list(zip(*values))
+    if rows:
+        conn.exec_driver_sql(str(statement), rows)
+    return len(rows)
+
+
+class _Trajectories(t.NamedTuple):
+    # What entries need to know of their trajectories, indexed by trajectory ID - 1
+    body_id: np.ndarray
+    t_arr: np.ndarray
+    v_inf: np.ndarray
+    pos_target: np.ndarray
+    pos_earth: np.ndarray
+
+
+def _architectures(conn: Connection, counts: Counts, seed: int) -> list[list[int]]:
+    # Body IDs of the flybys and target of each architecture
+    rng = _rng(seed, "architecture")
+    targets = [body.id for body in BODIES[: counts.bodies]]
+    sequences = []
+    for _ in range(counts.architectures):
+        target = int(rng.choice(targets))
+        others = [body_id for body_id in targets if body_id != target]
+        n_flybys = int(rng.integers(0, min(counts.flybys, len(others)) + 1))
+        sequences.append([int(i) for i in rng.choice(others, n_flybys, replace=False)] + [target])
+    _insert(
+        conn,
+        models.Architecture.__table__,
+        {
+            "id": range(1, len(sequences) + 1),
+            "sequence": ["-".join(map(str, [LAUNCH_BODY, *ids])) for ids in sequences],
+        },
+    )
+    return sequences
+
+
+def _trajectory_chunk(
+    conn: Connection,
+    rng: np.random.Generator,
+    ids: np.ndarray,
+    sequences: list[list[int]],
+    bodies: dict[int, BodyConstants],
+    counts: Counts,
+    first_flyby_id: int,
+) -> tuple[_Trajectories, int]:
+    n = len(ids)
+    architecture_id = rng.integers(1, len(sequences) + 1, n)
+    body_id = np.array([sequences[i - 1][-1] for i in architecture_id])
+    t_launch = np.floor(rng.uniform(*LAUNCH_WINDOW, n))
+    t_arr = t_launch + np.floor(rng.uniform(*TIME_OF_FLIGHT, n))
+    v_inf = _directions(rng, n) * rng.uniform(*V_INF_ARR, n)[:, None]
+
+    # Heliocentric positions of the target near the ecliptic and of the earth at arrival
+    sma = np.array([bodies[i].sma for i in body_id])
+    longitude = rng.uniform(0.0, 2.0 * np.pi, n)
+    latitude = rng.uniform(-0.02, 0.02, n)
+    pos_target = sma[:, None] * np.stack(
+        [np.cos(latitude) * np.cos(longitude), np.cos(latitude) * np.sin(longitude), latitude], 1
+    )
+    longitude = rng.uniform(0.0, 2.0 * np.pi, n)
+    pos_earth = AU * np.stack([np.cos(longitude), np.sin(longitude), np.zeros(n)], 1)
+    pos_sc = pos_target - _unit(v_inf) * 1.0e6  # approaching along the arrival asymptote
+
+    solar = sun_relative_states_angle(
+        R_b_s=-pos_target.T, R_b_e=(pos_earth - pos_target).T, R=(pos_sc - pos_target).T, V=v_inf.T
+    )
+    earth_lat, earth_lon = _lat_lon(pos_earth - pos_target, t_arr, body_id, bodies)
+    sun_lat, sun_lon = _lat_lon(-pos_target, t_arr, body_id, bodies)
+    _insert(
+        conn,
+        models.Trajectory.__table__,
+        {
+            "id": ids,
+            "body_id": body_id,
+            "architecture_id": architecture_id,
+            "t_launch": t_launch.astype(int),
+            "t_arr": t_arr.astype(int),
+            **_xyz("v_inf_arr", v_inf),
+            **_spherical("v_inf_arr", v_inf),
+            "c3": rng.uniform(10.0, 120.0, n),
+            "interplanetary_dv": rng.uniform(0.0, 2.0, n),
+            "solar_phase_angle": solar[0],
+            "solar_conj_angle": solar[1],
+            "solar_incidence_angle": solar[2],
+            **_xyz("pos_earth_arr", pos_earth),
+            "pos_earth_arr_lat": earth_lat,
+            "pos_earth_arr_lon": earth_lon,
+            **_xyz("pos_sc_arr", pos_sc),
+            **_xyz("pos_target_arr", pos_target),
+            "pos_sun_arr_lat": sun_lat,
+            "pos_sun_arr_lon": sun_lon,
+        },
+    )
+
+    # One row per flyby of each trajectory's sequence, spread between launch and arrival
+    flyby_bodies = [sequences[i - 1][:-1] for i in architecture_id]
+    n_flybys = np.array([len(ids) for ids in flyby_bodies], dtype=int)
+    if n_flybys.sum():
+        rows = np.repeat(np.arange(n), n_flybys)
+        order = np.concatenate([np.arange(1, k + 1) for k in n_flybys])
+        flyby_body = np.array([body for ids in flyby_bodies for body in ids])
+        radius = np.array([bodies[i].radius for i in flyby_body])
+        mu = np.array([bodies[i].mu for i in flyby_body])
+        altitude = radius * rng.uniform(0.1, 5.0, len(rows))
+        v_in = _directions(rng, len(rows)) * rng.uniform(*V_INF_FLYBY, len(rows))[:, None]
+        # An unpowered flyby turns v-infinity by 2 arcsin(1 / ecc) about its angular momentum
+        v_mag = la.norm(v_in, axis=1)
+        turn = 2.0 * np.arcsin(1.0 / (1.0 + (radius + altitude) * v_mag**2 / mu))
+        normal = _unit(np.cross(v_in, _directions(rng, len(rows))))
+        v_out = np.cos(turn)[:, None] * v_in + np.sin(turn)[:, None] * np.cross(normal, v_in)
+        fraction = order / (n_flybys[rows] + 1.0)
+        t_flyby = t_launch[rows] + fraction * (t_arr[rows] - t_launch[rows])
+        _insert(
+            conn,
+            models.Flyby.__table__,
+            {
+                "id": range(first_flyby_id, first_flyby_id + len(rows)),
+                "trajectory_id": ids[rows],
+                "body_id": flyby_body,
+                "order": order,
+                "t_flyby": t_flyby.astype(int),
+                "altitude": altitude,
+                **_xyz("v_inf_in", v_in),
+                "v_inf_in_mag": v_mag,
+                **_xyz("v_inf_out", v_out),
+                "v_inf_out_mag": la.norm(v_out, axis=1),
+            },
+        )
+
+    if counts.occultations:
+        rows = np.repeat(np.arange(n), counts.occultations)
+        t_occ_in = t_arr[rows] + np.floor(rng.uniform(0.0, 30.0 * DAY, len(rows)))
+        _insert(
+            conn,
+            models.Occultation.__table__,
+            {
+                "id": (ids[rows] - 1) * counts.occultations
+                + np.tile(np.arange(1, counts.occultations + 1), n),
+                "trajectory_id": ids[rows],
+                "t_occ_in": t_occ_in.astype(int),
+                "t_occ_out": (t_occ_in + np.floor(rng.uniform(1800.0, 7200.0, len(rows)))).astype(
+                    int
+                ),
+            },
+        )
+    return _Trajectories(body_id, t_arr, v_inf, pos_target, pos_earth), int(n_flybys.sum())
+
+
+def _entry_chunk(
+    conn: Connection,
+    rng: np.random.Generator,
+    ids: np.ndarray,
+    trajectories: _Trajectories,
+    bodies: dict[int, BodyConstants],
+    counts: Counts,
+):
+    n = len(ids)
+    trajectory = (ids - 1) // counts.entries
+    body_id = trajectories.body_id[trajectory]
+    v_inf = trajectories.v_inf[trajectory]
+    pos_target = trajectories.pos_target[trajectory]
+    t_entry = trajectories.t_arr[trajectory] + np.floor(rng.uniform(*ENTRY_DELAY, n))
+
+    # Entry states from random B-plane angles and periapses below the entry interface
+    pos, vel = np.empty((n, 3)), np.empty((n, 3))
+    flight_path_angle, bvec_mag = np.empty(n), np.empty(n)
+    theta = rng.uniform(-np.pi, np.pi, n)
+    depth = rng.uniform(0.3, 0.98, n)
+    for i in np.unique(body_id):
+        rows = body_id == i
+        body = bodies[i]
+        r_entry = np.full(rows.sum(), body.radius + body.interface)
+        pos[rows], vel[rows], flight_path_angle[rows], bvec_mag[rows] = arrival_states(
+            v_inf[rows], theta[rows], depth[rows] * r_entry, r_entry, body.mu, _pole(body)
+        )
+
+    pos_sun = -pos_target  # sun and earth positions at entry are relative to the target
+    pos_earth = trajectories.pos_earth[trajectory] - pos_target
+    solar = sun_relative_states_angle(R_b_s=pos_sun.T, R_b_e=pos_earth.T, R=pos.T, V=v_inf.T)
+    lat, lon = _lat_lon(pos, t_entry, body_id, bodies)
+    _insert(
+        conn,
+        models.Entry.__table__,
+        {
+            "id": ids,
+            "body_id": body_id,
+            "trajectory_id": trajectory + 1,
+            "bvec_theta": theta,
+            "bvec_mag": bvec_mag,
+            "safe": rng.random(n) < 0.9,
+            "t_entry": t_entry.astype(int),
+            **_xyz("pos_entry", pos),
+            "pos_entry_mag": la.norm(pos, axis=1),
+            "pos_entry_lat": lat,
+            "pos_entry_lon": lon,
+            **_xyz("vel_entry", vel),
+            **_spherical("vel_entry", vel),
+            "flight_path_angle": flight_path_angle,
+            "solar_phase_angle": solar[0],
+            "solar_conj_angle": solar[1],
+            "solar_incidence_angle": solar[2],
+            **_xyz("pos_sun_entry", pos_sun),
+            **_xyz("pos_earth_entry", pos_earth),
+            **_xyz("pos_target_entry", pos_target),
+            "relay_volume": rng.uniform(1.0, 100.0, n),
+            "ring_shadow": rng.random(n) < 0.1,
+            "carrier_orbit": np.array(CARRIER_ORBITS)[rng.integers(0, len(CARRIER_ORBITS), n)],
+        },
+    )
+
+    if counts.maneuvers:
+        # Maneuver states are the entry states propagated back to the maneuver times
+        m = counts.maneuvers
+        time_man = t_entry[:, None] - np.floor(rng.uniform(*MANEUVER_LEAD, (n, m)))
+        pos_man, vel_man = np.empty((3, n, m)), np.empty((3, n, m))
+        for i in np.unique(body_id):
+            rows = body_id == i
+            pos_man[:, rows], vel_man[:, rows] = propagate(
+                pos[rows][:, :, None],
+                vel[rows][:, :, None],
+                t_entry[rows][:, None],
+                time_man[rows],
+                bodies[i].mu,
+            )
+        dv = _directions(rng, n * m) * rng.uniform(0.005, 0.1, n * m)[:, None]
+        _insert(
+            conn,
+            models.Maneuver.__table__,
+            {
+                "id": (np.repeat(ids, m) - 1) * m + np.tile(np.arange(1, m + 1), n),
+                "entry_id": np.repeat(ids, m),
+                "maneuver_type": np.tile(
+                    [MANEUVER_TYPES[min(k, len(MANEUVER_TYPES) - 1)] for k in range(m)], n
+                ),
+                "time_man": time_man.ravel().astype(int),
+                **_xyz("dv_maneuver", dv),
+                "dv_maneuver_mag": la.norm(dv, axis=1),
+                **_xyz("pos_man", pos_man.reshape(3, -1).T),
+                **_xyz("vel_man", vel_man.reshape(3, -1).T),
+            },
+        )
+
+    if counts.datarates:
+        # Down sampled link rates decaying after entry
+        d = counts.datarates
+        time = np.arange(d) * DATARATE_STEP
+        peak = rng.uniform(50.0, 500.0, (n, 1))
+        decay = rng.uniform(300.0, 1800.0, (n, 1))
+        _insert(
+            conn,
+            models.Datarate.__table__,
+            {
+                "id": (np.repeat(ids, d) - 1) * d + np.tile(np.arange(1, d + 1), n),
+                "entry_id": np.repeat(ids, d),
+                "order": np.tile(np.arange(d), n),
+                "time": np.tile(time, n),
+                "rate": (peak * np.exp(-time / decay)).ravel(),
+            },
+        )
+
+
+def synthesize(engine: Engine, counts: Counts = Counts(), seed: int = 0) -> dict[str, int]:
+    """Create the tables of `models` in an empty database and fill them with synthetic rows
+
+    :param engine: empty database to write
+    :param counts: number of rows of each kind
+    :param seed: seed of the random values, the same seed and counts give the same database
+    :return: number of rows of each table
+    """
+    if not 1 <= counts.bodies <= len(BODIES):
+        raise ValueError(f"Between 1 and {len(BODIES)} bodies can be generated")
+    bodies = {body.id: body for body in BODIES[: counts.bodies]}
+    tables = models.Base.metadata.sorted_tables
+
+    with engine.connect() as conn:
+        # Nothing is worth keeping from a database that failed half way through
+        conn.exec_driver_sql("PRAGMA journal_mode = OFF")
+        conn.exec_driver_sql("PRAGMA synchronous = OFF")
+        # Room for sorting the index builds in memory
+        conn.exec_driver_sql("PRAGMA cache_size = -262144")
+        conn.exec_driver_sql("PRAGMA temp_store = MEMORY")
+        with conn.begin():
+            for table in tables:
+                conn.execute(CreateTable(table))
+            poles = np.array([_pole(body) for body in bodies.values()])
+            _insert(
+                conn,
+                models.Body.__table__,
+                {
+                    "id": list(bodies),
+                    "name": [body.name for body in bodies.values()],
+                    "radius": [body.radius for body in bodies.values()],
+                    "mu": [body.mu for body in bodies.values()],
+                    "period": [body.period for body in bodies.values()],
+                    **_xyz("pole_vec", poles),
+                },
+            )
+            sequences = _architectures(conn, counts, seed)
+
+        n_trajectories = counts.trajectories
+        trajectories = _Trajectories(
+            np.empty(n_trajectories, dtype=int),
+            np.empty(n_trajectories),
+            np.empty((n_trajectories, 3)),
+            np.empty((n_trajectories, 3)),
+            np.empty((n_trajectories, 3)),
+        )
+        flyby_id = 1
+        for chunk, start in enumerate(range(0, n_trajectories, CHUNK_SIZE)):
+            ids = np.arange(start + 1, min(start + CHUNK_SIZE, n_trajectories) + 1)
+            rng = _rng(seed, "trajectory", chunk)
+            with conn.begin():
+                values, n_flybys = _trajectory_chunk(
+                    conn, rng, ids, sequences, bodies, counts, flyby_id
+                )
+            flyby_id += n_flybys
+            for array, value in zip(trajectories, values):
+                array[ids - 1] = value
+            logger.info("Generated %d of %d trajectories", ids[-1], n_trajectories)
+
+        n_entries = n_trajectories * counts.entries
+        for chunk, start in enumerate(range(0, n_entries, CHUNK_SIZE)):
+            ids = np.arange(start + 1, min(start + CHUNK_SIZE, n_entries) + 1)
+            with conn.begin():
+                _entry_chunk(conn, _rng(seed, "entry", chunk), ids, trajectories, bodies, counts)
+            logger.info("Generated %d of %d entries", ids[-1], n_entries)
+
+        # Building the indexes once is much faster than updating them on every insert
+        with conn.begin():
+            for table in tables:
+                for index in table.indexes:
+                    index.create(conn)
+                logger.info("Indexed %s", table.name)
+            return {
+                table.name: conn.exec_driver_sql(f"SELECT count(*) FROM {table.name}").scalar()
+                for table in tables
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("database", type=Path, help="path of the database to create")
+    for field, default in Counts._field_defaults.items():
+        parser.add_argument(f"--{field}", type=int, default=default, help=f"(default: {default})")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random values")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.database.exists():
+        parser.error(f"{args.database} already exists")
+    counts = Counts(**{field: getattr(args, field) for field in Counts._fields})
+    rows = synthesize(create_engine(f"sqlite:///{args.database}"), counts, args.seed)
+    print("\n".join(f"{name}: {count}" for name, count in rows.items()))